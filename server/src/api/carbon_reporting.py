@@ -15,6 +15,8 @@ from ..core.constants import Status, Constants, WebsocketStatus
 
 from ..services.celery_tasks.report_planning import start_planning, start_thresholding
 from ..services.celery_tasks.report_generation import start_generating
+from ..services.chunk_metadata import validate_filter, validate_owners
+from ..services.retrieval import validate_mode, validate_candidate_multiplier
 
 from ..ws.manager import WSConnectionManager
 
@@ -78,6 +80,20 @@ async def plan_report_ws(
                     cr_plan_obj.action = cr_plan_req["action"]
                     cr_plan_obj.company = cr_plan_req["company"]
 
+                    try:
+                        cr_plan_obj.filter = validate_filter(cr_plan_req.get("filter"))
+                        cr_plan_obj.retrieval_mode = validate_mode(cr_plan_req.get("retrieval_mode"))
+                        cr_plan_obj.candidate_multiplier = validate_candidate_multiplier(cr_plan_req.get("candidate_multiplier"))
+                        cr_plan_obj.owners = validate_owners(cr_plan_req.get("owners"))
+                    except ValueError as e:
+                        await ws_manager.send_json_obj(
+                            CRPlanResponse(
+                                task_status=Status.failed.value,
+                                error=str(e)
+                            ).json(), websocket)
+                        await ws_manager.disconnect_and_close(websocket)
+                        break
+
                     report = ReportModel(
                         user_id=cr_plan_obj.user_id,
                         report_name=cr_plan_obj.report_name,
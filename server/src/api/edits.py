@@ -7,8 +7,6 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from bson.objectid import ObjectId
 
-from sentence_transformers import SentenceTransformer
-
 from ..core.utils import get_logger
 from ..core.schemas import ManualEditsRequest, GenericResponse, AIEditsRequest, AIEditsResponse
 from ..core.constants import Status
@@ -17,7 +15,13 @@ from ..core.config import GAIModels, settings, GAIEmbeddersCollections
 from ..agents import AgentBase
 from ..agents.prompts import *
 
-from ..core.dependencies import get_mongo_client, milvus_client
+from ..services.retrieval import search_chunks, validate_mode
+from ..services.query_cache import aembed_query
+from ..services.embedding_engine import EngineOverloaded
+from ..services.executors import retrieval_executor, genai_executor
+from ..services.chunk_metadata import validate_filter
+
+from ..core.dependencies import get_mongo_client
 
 
 logger = get_logger(__name__)
@@ -136,6 +140,15 @@ async def ai_edits(
             status=Status.failed.value
         )
 
+    try:
+        search_filter = validate_filter(ai_edit_request.filter)
+        retrieval_mode = validate_mode(ai_edit_request.retrieval_mode)
+    except ValueError as e:
+        return GenericResponse(
+            response = str(e),
+            status = Status.invalid.value
+        )
+
     if not section_id or not user_request:
         return GenericResponse(
             response = "Section ID and User Edits should not be empty or None",
@@ -190,24 +203,22 @@ async def ai_edits(
     )
 
     embedding_model = "stella_15"
-    emb_model = settings.embedders.model_fields[embedding_model].default
 
-    embedder = SentenceTransformer(emb_model,
-                                   trust_remote_code=True,
-                                   device=device)
-
-    query_embedding = embedder.encode(user_instructions, device=device)
-
-    vector_col_name = GAIEmbeddersCollections.mapping()[embedding_model]
+    # the same instructions were embedded when the report was planned
+    try:
+        query_embedding = await aembed_query(embedding_model, user_instructions, device)
+    except EngineOverloaded as e:
+        return GenericResponse(
+            response = str(e),
+            status = Status.failed.value
+        )
 
-    results = milvus_client.search(
-        collection_name=vector_col_name,
-        anns_field="vector_embs",
-        data=[query_embedding],
-        limit=3,
-        search_params={"metric_type": "L2"},
-        output_fields=["text_chunk"]
-    )
+    results = await retrieval_executor.run(search_chunks, embedding_model, query_embedding, limit=3,
+                                           filter=search_filter,
+                                           mode=retrieval_mode,
+                                           candidate_multiplier=ai_edit_request.candidate_multiplier,
+                                           query_texts=[user_instructions],
+                                           owners=ai_edit_request.owners)
 
     context = ""
 
@@ -232,7 +243,7 @@ async def ai_edits(
 
     for _ in range(2):
         try:
-            agent_out = edit_agent(edit_instruction, json_out=True)[0]
+            agent_out = (await genai_executor.run(edit_agent, edit_instruction, json_out=True))[0]
             modified_content = agent_out["modified_content"]
             break
         except:
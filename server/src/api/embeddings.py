@@ -3,20 +3,26 @@ from typing import List
 
 import torch
 
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 
 from celery.result import AsyncResult
 
-from sentence_transformers import SentenceTransformer
-
-from ..core.utils import get_logger, get_device, clear_torch_cache
+from ..core.utils import get_logger, get_device
 from ..core.config import GAIEmbeddersCollections, settings
-from ..core.schemas import ComputeDocumentEmbeddingsRequest, GetEmbeddingRequest, SearchEmbRequest
+from ..core.schemas import ComputeDocumentEmbeddingsRequest, GetEmbeddingRequest, SearchEmbRequest, BatchSearchEmbRequest
 
 from ..services.celery_tasks.compute_embeddings import start_computing
-
-from ..core.dependencies import milvus_client
+from ..services.embedder_registry import embedder_registry
+from ..services.embedding_engine import embedding_engine, EngineOverloaded
+from ..services.retrieval import search_chunks, validate_mode, validate_search_limit, deduplicate_hits
+from ..services.query_cache import aembed_query, aembed_queries, query_embedding_cache
+from ..services.executors import retrieval_executor, executor_stats
+from ..services.result_cache import search_result_cache
+from ..services.chunk_metadata import validate_filter
+from ..services.uploads import save_uploads, InvalidUpload
+from ..services.ingestion_progress import PROGRESS_STATE
 
 
 logger = get_logger(__name__)
@@ -37,7 +43,11 @@ async def generate_embeddings(
     logger.info(f"Generating Document Embeddings in: \npath: {docs_path}, \ngenaimodel: {embedding_model} and \ndevice: {device}")
     
     emb_task = start_computing.apply_async(
-        args=[docs_path, embedding_model, device]
+        args=[docs_path, embedding_model, device],
+        kwargs={"chunk_size": docs_emb_request.chunk_size,
+                "metadata": {"company": docs_emb_request.company,
+                             "owner": docs_emb_request.owner,
+                             "year": docs_emb_request.year}}
     )
 
     return JSONResponse(content={"task_id": emb_task.id})
@@ -47,33 +57,55 @@ async def generate_embeddings(
         "/upload_file",
         tags=["Document Embeddings"], 
         description="Accepts a PDF file, extracts the contents and starts computing the embeddings")
-async def upload_file(files: List[UploadFile] = File(...)):
-    os.makedirs(settings.user_files_path, exist_ok=True)
+async def upload_file(files: List[UploadFile] = File(...),
+                      company: str = Form(None),
+                      owner: str = Form(None),
+                      year: int = Form(None),
+                      doc_ids: List[str] = Form(None)):
+    await run_in_threadpool(os.makedirs, settings.user_files_path, exist_ok=True)
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    filenames = []
-    docs = []
-
     for file in files:
-        try:
-            if file.content_type != "application/pdf":
-                raise HTTPException(status_code=400, detail="Invalid file type. Only PDF files are allowed.")
-        
-            with open(os.path.join(settings.user_files_path, file.filename), 'wb') as f:
-                while contents := file.file.read(1024 * 1024):
-                    f.write(contents)
-            
-            filenames.append(file.filename)
-            docs.append(os.path.join(settings.user_files_path, file.filename))
+        if file.content_type != "application/pdf":
+            raise HTTPException(status_code=400, detail=f"Invalid file type for {file.filename}. Only PDF files are allowed.")
 
-        except Exception:
-            raise HTTPException(status_code=500, detail='Something went wrong')
-        
-        finally:
-            file.file.close()
+    if doc_ids is not None and len(doc_ids) != len(files):
+        raise HTTPException(status_code=400, detail=f"Got {len(doc_ids)} document ids for {len(files)} files")
 
-    emb_task = start_computing.apply_async(
-        args=[docs, None, device, True]
+    # an explicit id, or the owner and original file name, identify a document across uploads,
+    # so a new version of it replaces the old chunks; two files of one upload cannot share one
+    named_ids = [doc_ids[idx] if doc_ids else (f"{owner}/{file.filename}" if owner else None)
+                 for idx, file in enumerate(files)]
+    duplicates = sorted({doc_id for doc_id in named_ids if doc_id is not None and named_ids.count(doc_id) > 1})
+
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Several files of the upload have the document id {duplicates}")
+
+    try:
+        stored = await save_uploads(files, settings.user_files_path)
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to store uploaded files: {e}")
+        raise HTTPException(status_code=500, detail='Something went wrong')
+
+    docs = []
+    docs_ids = []
+
+    for file, doc_id, (doc_path, file_hash) in zip(files, named_ids, stored):
+        # without an owner the name says nothing about which document this is, the content does
+        doc_id = doc_id or f"{file_hash}/{file.filename}"
+
+        # identical files are stored once, yet each id they were uploaded under is a document of its own
+        if doc_id not in docs_ids:
+            docs.append(doc_path)
+            docs_ids.append(doc_id)
+
+    emb_task = await run_in_threadpool(
+        start_computing.apply_async,
+        args=[docs, None, device, True],
+        kwargs={"doc_ids": docs_ids,
+                "metadata": {"company": company, "owner": owner, "year": year}}
     )
             
     return JSONResponse(content={
@@ -87,8 +119,15 @@ async def get_result(task_id: str):
     task_result = AsyncResult(task_id)
 
     if task_result.state == "SUCCESS":
+        # ingestion tasks finish with their final progress, other tasks keep returning their result as the status
+        if isinstance(task_result.result, dict) and "docs_total" in task_result.result:
+            return {"status": task_result.state, "progress": task_result.result}
+
         return {"status": task_result.result}
 
+    elif task_result.state == PROGRESS_STATE:
+        return {"status": task_result.state, "progress": task_result.info}
+
     else:
         return {"status": task_result.state}
 
@@ -103,21 +142,11 @@ async def get_embedding(emb_request: GetEmbeddingRequest):
     computed_embeddings = None
 
     if embedding_model in GAIEmbeddersCollections.opensource_embedders().keys() and os.getenv("USE_EMBEDDERS_LOCALLY"):
+        try:
+            computed_embeddings = await embedding_engine.aencode(embedding_model, req_texts, device)
+        except EngineOverloaded as e:
+            raise HTTPException(status_code=503, detail=str(e))
 
-        emb_model = settings.embedders.model_fields[embedding_model].default
-        
-        logger.info(f"Dowloading/Loading and computing chunks for: {emb_model}")
-        embedder = SentenceTransformer(emb_model,
-                                       trust_remote_code=True, 
-                                       device=device)
-        
-        computed_embeddings = embedder.encode(req_texts, 
-                                              show_progress_bar="tqdm", 
-                                              device=device)
-        
-        del embedder
-        clear_torch_cache()
-        
     return {
         "embeddings": computed_embeddings.tolist()
     }
@@ -130,31 +159,86 @@ async def get_closest_texts(search_request: SearchEmbRequest):
     k = search_request.k
     device = get_device(search_request.device)
 
+    try:
+        search_filter = validate_filter(search_request.filter)
+        retrieval_mode = validate_mode(search_request.retrieval_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        validate_search_limit(k, retrieval_mode, search_request.candidate_multiplier)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     results = None
 
     if embedding_model in GAIEmbeddersCollections.opensource_embedders().keys() and os.getenv("USE_EMBEDDERS_LOCALLY"):
-        emb_model = settings.embedders.model_fields[embedding_model].default
-        
-        logger.info(f"Dowloading/Loading and computing chunks for: {emb_model}")
-        embedder = SentenceTransformer(emb_model,
-                                       trust_remote_code=True, 
-                                       device=device)
-        
-        query_embedding = embedder.encode(query, 
-                                          show_progress_bar="tqdm", 
-                                          device=device)
-        
+        try:
+            query_embedding = await aembed_query(embedding_model, query, device)
+        except EngineOverloaded as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
         logger.info(f"Query embedding computed!")
 
-        vector_col_name = GAIEmbeddersCollections.mapping()[embedding_model]
+        results = await retrieval_executor.run(search_chunks, embedding_model, query_embedding, limit=k,
+                                               output_fields=["text_chunk", "doc_id", "page_start", "page_end", "company", "year"],
+                                               filter=search_filter,
+                                               mode=retrieval_mode,
+                                               candidate_multiplier=search_request.candidate_multiplier,
+                                               query_texts=[query],
+                                               owners=search_request.owners)
 
-        results = milvus_client.search(
-            collection_name=vector_col_name,
-            anns_field="vector_embs",
-            data=[query_embedding],
-            limit=k,
-            search_params={"metric_type": "L2"}, 
-            output_fields=["text_chunk"]
-        )
+    return {"top_k": results}
+
+
+@router.post("/get_closest_batch", tags=["Document Embeddings"])
+async def get_closest_texts_batch(search_request: BatchSearchEmbRequest):
+    queries = search_request.queries
+    embedding_model = search_request.model
+    k = search_request.k
+    device = get_device(search_request.device)
+
+    try:
+        search_filter = validate_filter(search_request.filter)
+        retrieval_mode = validate_mode(search_request.retrieval_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # deduplicating needs enough hits per query to make up for those given to other queries
+    limit = k * len(queries) if search_request.deduplicate else k
+
+    try:
+        validate_search_limit(limit, retrieval_mode, search_request.candidate_multiplier)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    results = None
+
+    if embedding_model in GAIEmbeddersCollections.opensource_embedders().keys() and os.getenv("USE_EMBEDDERS_LOCALLY"):
+        # one encoder pass and one multi-vector search for all queries
+        try:
+            query_embeddings = await aembed_queries(embedding_model, queries, device)
+        except EngineOverloaded as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        results = await retrieval_executor.run(search_chunks, embedding_model, query_embeddings, limit=limit,
+                                               output_fields=["text_chunk", "doc_id", "page_start", "page_end", "company", "year"],
+                                               filter=search_filter,
+                                               mode=retrieval_mode,
+                                               candidate_multiplier=search_request.candidate_multiplier,
+                                               query_texts=queries,
+                                               owners=search_request.owners)
+
+        if search_request.deduplicate:
+            results = deduplicate_hits(results, k)
 
     return {"top_k": results}
+
+
+@router.get("/registry", tags=["Document Embeddings"])
+async def get_registry_stats():
+    return {**embedder_registry.stats(),
+            "query_cache": query_embedding_cache.stats(),
+            "result_cache": search_result_cache.stats(),
+            "embedding_engine": embedding_engine.stats(),
+            "executors": executor_stats()}
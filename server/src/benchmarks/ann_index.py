@@ -0,0 +1,149 @@
+"""
+Reports recall@k against exact (FLAT) search and the p50/p99 latency of single-query searches
+for each ANN index of `vector_codec.ANN_INDEXES`, at several corpus sizes, on a running Milvus.
+Every index is built in a scratch collection that is dropped afterwards.
+
+    python -m server.src.benchmarks.ann_index --sizes 10000 100000 1000000 --dim 1024
+    python -m server.src.benchmarks.ann_index --collection STELLA_15_CR_EMBS --sizes 5000 20000
+    python -m server.src.benchmarks.ann_index --indexes HNSW --search '{"ef": 128}'
+
+The corpus is drawn from a gaussian mixture unless `--collection` is given, and queries are held
+out from it. Build and search parameters default to those of `ANN_INDEXES`, `--build` and
+`--search` override them for every index they apply to.
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+from ..services.vector_codec import ANN_INDEXES, index_params, search_params
+from .vector_precision import _collection_vectors, _synthetic_vectors, _top_k_l2, _recall
+
+
+BENCH_COLLECTION = "ANN_INDEX_BENCHMARK"
+
+
+def _index(index_type, build_overrides, search_overrides):
+    index_type = index_type.upper()
+    build, search = ANN_INDEXES[index_type]
+
+    # overrides only apply to the indexes that take them, IVF_PQ also takes its sub-vector count `m`
+    build_names = set(build) | ({"m"} if index_type == "IVF_PQ" else set())
+
+    return {"type": index_type,
+            "build": {**build, **{name: value for name, value in build_overrides.items() if name in build_names}},
+            "search": {**search, **{name: value for name, value in search_overrides.items() if name in search}}}
+
+
+def _create(milvus_client, dim, index):
+    from pymilvus import MilvusClient, DataType
+
+    schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=False)
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(field_name="vector_embs", datatype=DataType.FLOAT_VECTOR, dim=dim)
+
+    params = milvus_client.prepare_index_params()
+    params.add_index(field_name="vector_embs", **index_params("float32", index, dim))
+
+    milvus_client.create_collection(collection_name=BENCH_COLLECTION, schema=schema, index_params=params)
+
+
+def _build(milvus_client, corpus, index, batch_size=5000):
+    if milvus_client.has_collection(collection_name=BENCH_COLLECTION):
+        milvus_client.drop_collection(collection_name=BENCH_COLLECTION)
+
+    _create(milvus_client, corpus.shape[1], index)
+
+    start = time.perf_counter()
+
+    for offset in range(0, len(corpus), batch_size):
+        milvus_client.insert(collection_name=BENCH_COLLECTION,
+                             data=[{"id": offset + idx, "vector_embs": vector}
+                                   for idx, vector in enumerate(corpus[offset:offset + batch_size])])
+
+    milvus_client.flush(collection_name=BENCH_COLLECTION)
+
+    while milvus_client.describe_index(collection_name=BENCH_COLLECTION, index_name="vector_embs").get("pending_index_rows"):
+        time.sleep(1)
+
+    milvus_client.load_collection(collection_name=BENCH_COLLECTION)
+
+    return time.perf_counter() - start
+
+
+def _search(milvus_client, queries, index, k):
+    params = search_params("float32", index, k)
+
+    # warm-up, the first searches after loading pay for segment initialisation
+    for query in queries[:10]:
+        milvus_client.search(collection_name=BENCH_COLLECTION, anns_field="vector_embs",
+                             data=[query], limit=k, search_params=params)
+
+    found, latencies = [], []
+
+    for query in queries:
+        start = time.perf_counter()
+        hits = milvus_client.search(collection_name=BENCH_COLLECTION, anns_field="vector_embs",
+                                    data=[query], limit=k, search_params=params)[0]
+        latencies.append(time.perf_counter() - start)
+
+        found.append([hit["id"] for hit in hits])
+
+    return found, 1000 * np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", help="read the corpus from this Milvus collection")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--indexes", nargs="+", default=list(ANN_INDEXES))
+    parser.add_argument("--build", type=json.loads, default={}, help="JSON build parameters, e.g. '{\"M\": 32}'")
+    parser.add_argument("--search", type=json.loads, default={}, help="JSON search parameters, e.g. '{\"nprobe\": 32}'")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from ..core.dependencies import milvus_client
+
+    n_vectors = max(args.sizes) + args.queries
+
+    if args.collection:
+        vectors = _collection_vectors(args.collection, n_vectors)
+    else:
+        vectors = _synthetic_vectors(n_vectors, args.dim, args.clusters, args.seed)
+
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+
+    print(f"{'size':>9}  {'index':<10}{'build s':>9}{f'recall@{args.k}':>11}{'p50 ms':>9}{'p99 ms':>9}")
+
+    try:
+        for size in sorted(args.sizes):
+            if size > len(corpus):
+                print(f"{size:>9}  only {len(corpus)} vectors available, skipped")
+                continue
+
+            truth = _top_k_l2(corpus[:size], queries, args.k)
+
+            for index_type in args.indexes:
+                index = _index(index_type, args.build, args.search)
+
+                try:
+                    build_sec = _build(milvus_client, corpus[:size], index)
+                    found, latencies = _search(milvus_client, queries, index, args.k)
+                except Exception as e:
+                    print(f"{size:>9}  {index['type']:<10}failed: {e}")
+                    continue
+
+                print(f"{size:>9}  {index['type']:<10}{build_sec:>9.1f}{_recall(found, truth, args.k):>11.3f}"
+                      f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}")
+    finally:
+        if milvus_client.has_collection(collection_name=BENCH_COLLECTION):
+            milvus_client.drop_collection(collection_name=BENCH_COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compares the prefix-sum chunker in `services.chunking` against the original `compute_chunks`
+walk on the sample reports in `client/data/reports` and the reference PDFs in `VS_files`.
+
+    python -m server.src.benchmarks.chunking --repeat 1 10 50
+    python -m server.src.benchmarks.chunking --tokenizer whitespace
+
+`--repeat` concatenates every report's sentences that many times to reach the sentence counts
+of the largest filings.
+"""
+import os
+import time
+import argparse
+from glob import glob
+
+import pymupdf
+
+from nltk import sent_tokenize
+
+from ..services.chunking import compute_chunks
+
+
+REPORTS_DIRS = [os.path.join(os.getcwd(), "client", "data", "reports"),
+                os.path.join(os.getcwd(), "server", "src", "VS_files")]
+
+
+# verbatim copy of the chunker that `services.chunking` replaced, kept as the baseline
+def legacy_compute_chunks(inputs, text_sents, chunk_size_approx=256, overlap_tokens=20):
+    start_idx = 0
+
+    out_embs = []
+    out_texts = []
+
+    added_idxs = set()
+
+    while start_idx < len(inputs["input_ids"]):
+        curr_len = len(inputs["input_ids"][start_idx])
+        temp_embs = [inputs["input_ids"][start_idx]]
+        temp_txts = [text_sents[start_idx]]
+
+        temp_idxs = [start_idx]
+
+        while start_idx+1<len(inputs["input_ids"]) and curr_len <= chunk_size_approx:
+            start_idx += 1
+            
+            temp_embs.append(inputs["input_ids"][start_idx])
+            temp_txts.append(text_sents[start_idx])
+
+            temp_idxs.append(start_idx)
+            
+            curr_len += len(inputs["input_ids"][start_idx])
+        
+        if tuple(temp_idxs) not in added_idxs:
+            out_embs.append(temp_embs)
+            out_texts.append(temp_txts)
+        
+            added_idxs.add(tuple(temp_idxs))
+        else:
+            start_idx += 1
+            continue
+        
+
+        if start_idx+1 >= len(inputs["input_ids"]):
+            break
+
+        if len(inputs["input_ids"][start_idx]) >= chunk_size_approx:
+            start_idx += 1
+            continue
+
+        curr_overlap_size = 0
+
+        while start_idx > 0 and curr_overlap_size <= overlap_tokens:
+            start_idx -= 1
+            curr_overlap_size += len(inputs["input_ids"][start_idx])
+
+    
+    return out_texts
+
+
+def _load_sentences(pdf_path):
+    doc = pymupdf.open(pdf_path)
+    full_text = " ".join(page.get_text() for page in doc).strip()
+
+    return sent_tokenize(full_text) if full_text else []
+
+
+def _tokenize(tokenizer_name, sentences):
+    if tokenizer_name == "whitespace":
+        return {"input_ids": [sent.split() for sent in sentences]}
+
+    from transformers import AutoTokenizer
+
+    from ..core.config import settings
+
+    model_name = settings.embedders.model_fields[tokenizer_name].default
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+
+    return tokenizer(sentences, **settings.embedders.default_emb_params)
+
+
+def _time(fn, *args, runs):
+    best = float("inf")
+    result = None
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports-dirs", nargs="+", default=REPORTS_DIRS)
+    parser.add_argument("--tokenizer", default="gte_modernbert", help="`Embedders` key or `whitespace`")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=20)
+    parser.add_argument("--repeat", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    pdf_paths = sorted(path for reports_dir in args.reports_dirs for path in glob(os.path.join(reports_dir, "*.pdf")))
+
+    if not pdf_paths:
+        raise SystemExit(f"No PDFs found in {args.reports_dirs}")
+
+    print(f"{'report':<16}{'x':>4}{'sentences':>11}{'chunks':>9}{'legacy ms':>12}{'prefix ms':>12}{'speedup':>9}  same")
+
+    for pdf_path in pdf_paths:
+        sentences = _load_sentences(pdf_path)
+
+        if not sentences:
+            continue
+
+        inputs = _tokenize(args.tokenizer, sentences)
+
+        for repeat in args.repeat:
+            rep_inputs = {key: list(values) * repeat for key, values in inputs.items() if key in ("input_ids", "length")}
+            rep_sentences = sentences * repeat
+
+            legacy_sec, legacy_chunks = _time(legacy_compute_chunks, rep_inputs, rep_sentences,
+                                              args.chunk_size, args.overlap_tokens, runs=args.runs)
+            prefix_sec, prefix_chunks = _time(compute_chunks, rep_inputs, rep_sentences,
+                                              args.chunk_size, args.overlap_tokens, runs=args.runs)
+
+            print(f"{os.path.basename(pdf_path)[:15]:<16}{repeat:>4}{len(rep_sentences):>11}{len(prefix_chunks):>9}"
+                  f"{legacy_sec * 1000:>12.2f}{prefix_sec * 1000:>12.2f}{legacy_sec / prefix_sec:>9.1f}  "
+                  f"{legacy_chunks == prefix_chunks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares chunk encoding schedules on CPU for every open-source model in `Embedders`, on the
+chunks of the reports in `client/data/reports` and `VS_files`:
+
+    original   chunks in document order, 64 per `encode` call (the streaming pipeline before)
+    whole      one `encode` call over all chunks, sentence-transformers' own sort and batch size 32
+    budget     `batching.encode_length_sorted`, token-sorted batches packed under a token budget
+
+    python -m server.src.benchmarks.encoding --max-chunks 256
+    python -m server.src.benchmarks.encoding --models gte_modernbert --token-budget 8192 16384
+
+`padding` is the share of real tokens in the padded batches, `max diff` the largest absolute
+difference to the `whole` embeddings, which shows the original order is restored.
+"""
+import os
+import time
+import argparse
+from glob import glob
+
+import numpy as np
+
+from ..core.config import settings, GAIEmbeddersCollections
+from ..services.chunking import compute_chunks
+from ..services.batching import encode_length_sorted, token_budget_batches
+from .chunking import REPORTS_DIRS, _load_sentences
+
+
+def _chunks(embedder, reports_dirs, chunk_size, overlap_tokens, max_chunks):
+    texts = []
+
+    for reports_dir in reports_dirs:
+        for pdf_path in sorted(glob(os.path.join(reports_dir, "*.pdf"))):
+            sentences = _load_sentences(pdf_path)
+
+            if sentences:
+                inputs = embedder.tokenizer(sentences, **settings.embedders.default_emb_params)
+                texts.extend(" ".join(chunk) for chunk in compute_chunks(inputs, sentences, chunk_size, overlap_tokens))
+
+    return texts[:max_chunks]
+
+
+def _padding_efficiency(lengths, batches):
+    padded = sum(len(batch) * lengths[batch].max() for batch in batches)
+    return lengths.sum() / padded
+
+
+def _fixed_batches(order, batch_size):
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def _time(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, np.asarray(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(GAIEmbeddersCollections.opensource_embedders().keys()))
+    parser.add_argument("--reports-dirs", nargs="+", default=REPORTS_DIRS)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=20)
+    parser.add_argument("--max-chunks", type=int, default=256)
+    parser.add_argument("--token-budget", type=int, nargs="+", default=[settings.ingestion.encode_token_budget])
+    parser.add_argument("--max-batch-size", type=int, default=settings.ingestion.encode_batch_size)
+    args = parser.parse_args()
+
+    from ..services.embedder_registry import get_embedder
+
+    print(f"{'model':<16}{'schedule':<16}{'chunks':>8}{'sec':>9}{'chunks/s':>10}{'padding':>9}{'max diff':>10}")
+
+    for model in args.models:
+        embedder = get_embedder(model, "cpu")
+        texts = _chunks(embedder, args.reports_dirs, args.chunk_size, args.overlap_tokens, args.max_chunks)
+
+        if not texts:
+            raise SystemExit(f"No PDFs with text found in {args.reports_dirs}")
+
+        max_seq_length = getattr(embedder, "max_seq_length", None) or np.iinfo(np.int64).max
+        inputs = embedder.tokenizer(texts, **settings.embedders.default_emb_params)
+        lengths = np.minimum([len(ids) for ids in inputs["input_ids"]], max_seq_length)
+
+        # warm-up, the first forward pass pays for lazy initialisation
+        embedder.encode(texts[:2], device="cpu")
+
+        whole_sec, whole = _time(lambda: embedder.encode(texts, device="cpu"))
+
+        original_sec, original = _time(lambda: np.concatenate([embedder.encode(texts[start:start + 64], batch_size=64, device="cpu")
+                                                               for start in range(0, len(texts), 64)]))
+
+        rows = [("whole", whole_sec, whole,
+                 _fixed_batches(np.argsort([-len(text) for text in texts], kind="stable"), 32)),
+                ("original", original_sec, original,
+                 _fixed_batches(np.arange(len(texts)), 64))]
+
+        for token_budget in args.token_budget:
+            budget_sec, budget = _time(lambda: encode_length_sorted(embedder, texts,
+                                                                    lengths=lengths,
+                                                                    token_budget=token_budget,
+                                                                    max_batch_size=args.max_batch_size,
+                                                                    device="cpu"))
+            rows.append((f"budget {token_budget}", budget_sec, budget,
+                         token_budget_batches(lengths, token_budget, args.max_batch_size)))
+
+        for schedule, seconds, embeddings, batches in rows:
+            print(f"{model:<16}{schedule:<16}{len(texts):>8}{seconds:>9.2f}{len(texts) / seconds:>10.1f}"
+                  f"{_padding_efficiency(lengths, batches):>9.2f}{np.abs(embeddings - whole).max():>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
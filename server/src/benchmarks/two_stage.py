@@ -0,0 +1,118 @@
+"""
+Reports what the "two_stage" retrieval mode of `services.retrieval` trades for its speed: recall@k
+of re-scoring `k * multiplier` candidates found on the first 128 dimensions, against exact
+search on the full vectors, together with the p50/p99 latency per query.
+
+    python -m server.src.benchmarks.two_stage --synthetic 100000 --dim 1024
+    python -m server.src.benchmarks.two_stage --collection STELLA_15_CR_EMBS --multipliers 2 5 10 20
+    python -m server.src.benchmarks.two_stage --collection STELLA_15_CR_EMBS --milvus --model stella_15
+
+By default both stages are exact brute-force searches in NumPy, which isolates the loss of
+ranking candidates on the head dimensions. `--milvus` runs `search_chunks` itself in both modes
+against the collection of `--model`, with its configured indexes, and measures recall against
+the "vector" mode; queries are stored vectors, so each query finds itself in both modes.
+"""
+import time
+import argparse
+
+import numpy as np
+
+from ..services.retrieval import HEAD_DIM
+from .vector_precision import _collection_vectors, _synthetic_vectors, _top_k_l2, _recall
+
+
+def _two_stage(corpus, head_corpus, query, k, multiplier):
+    candidates = _top_k_l2(head_corpus, query[None, :HEAD_DIM], min(k * multiplier, len(corpus)))[0]
+    distances = ((corpus[candidates] - query) ** 2).sum(axis=1)
+
+    return candidates[np.argsort(distances, kind="stable")[:k]]
+
+
+def _timed(fn, queries):
+    found, latencies = [], []
+
+    for query in queries:
+        start = time.perf_counter()
+        found.append(fn(query))
+        latencies.append(time.perf_counter() - start)
+
+    return found, 1000 * np.asarray(latencies)
+
+
+def _header(k):
+    print(f"{'mode':<16}{f'recall@{k}':>11}{'p50 ms':>9}{'p99 ms':>9}")
+
+
+def _row(name, found, truth, k, latencies):
+    print(f"{name:<16}{_recall(found, truth, k):>11.3f}{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}")
+
+
+def _numpy(vectors, args):
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+    head_corpus = np.ascontiguousarray(corpus[:, :HEAD_DIM])
+
+    print(f"corpus {len(corpus)} x {corpus.shape[1]}, {len(queries)} held-out queries, brute force\n")
+    _header(args.k)
+
+    exact, latencies = _timed(lambda query: _top_k_l2(corpus, query[None], args.k)[0], queries)
+    _row("vector", exact, exact, args.k, latencies)
+
+    for multiplier in args.multipliers:
+        found, latencies = _timed(lambda query: _two_stage(corpus, head_corpus, query, args.k, multiplier), queries)
+        _row(f"two_stage x{multiplier}", found, exact, args.k, latencies)
+
+
+def _milvus(vectors, args):
+    from ..services.retrieval import search_chunks
+
+    queries = vectors[:args.queries]
+
+    def ids(mode, multiplier=None):
+        return lambda query: [hit["id"] for hit in search_chunks(args.model, query, limit=args.k, mode=mode,
+                                                                 candidate_multiplier=multiplier, cache=False)[0]]
+
+    print(f"{len(queries)} stored vectors of {args.collection} as queries, search_chunks on Milvus\n")
+    _header(args.k)
+
+    # warm-up, the first searches after loading pay for segment initialisation
+    for query in queries[:10]:
+        search_chunks(args.model, query, limit=args.k, cache=False)
+
+    exact, latencies = _timed(ids("vector"), queries)
+    _row("vector", exact, exact, args.k, latencies)
+
+    for multiplier in args.multipliers:
+        found, latencies = _timed(ids("two_stage", multiplier), queries)
+        _row(f"two_stage x{multiplier}", found, exact, args.k, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", help="read the corpus from this Milvus collection")
+    parser.add_argument("--milvus", action="store_true", help="search the collection of --model through Milvus")
+    parser.add_argument("--model", default="stella_15", help="`Embedders` key whose collection --milvus searches")
+    parser.add_argument("--synthetic", type=int, default=50000, help="corpus size without --collection")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--max-vectors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--multipliers", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.collection:
+        vectors = _collection_vectors(args.collection, args.max_vectors)
+    else:
+        vectors = _synthetic_vectors(args.synthetic + args.queries, args.dim, args.clusters, args.seed)
+
+    np.random.default_rng(args.seed).shuffle(vectors)
+
+    if args.milvus:
+        _milvus(vectors, args)
+    else:
+        _numpy(vectors, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Reports how much recall each vector precision of `services.vector_codec` gives up for the memory
+it saves. Queries are held out from the corpus and the exact float32 L2 neighbours serve as
+ground truth, so the numbers isolate the quantization loss from any index approximation.
+
+    python -m server.src.benchmarks.vector_precision --collection STELLA_15_CR_EMBS
+    python -m server.src.benchmarks.vector_precision --model gte_modernbert
+    python -m server.src.benchmarks.vector_precision --synthetic 50000 --dim 1024
+
+`--collection` reads the stored vectors of a float32 or float16 collection from Milvus,
+`--model` embeds the chunks of the reports in `--reports-dirs`, and without either the corpus is
+drawn from a gaussian mixture.
+"""
+import os
+import argparse
+from glob import glob
+
+import numpy as np
+
+from ..services.vector_codec import PRECISIONS, bytes_per_vector, collection_precision, decode_vector
+from .chunking import REPORTS_DIRS, _load_sentences
+
+
+def _collection_vectors(collection_name, max_vectors):
+    from ..core.dependencies import milvus_client
+
+    iterator = milvus_client.query_iterator(collection_name=collection_name,
+                                            batch_size=1000,
+                                            limit=max_vectors,
+                                            output_fields=["vector_embs"])
+    precision = collection_precision(collection_name)
+    vectors = []
+
+    try:
+        while batch := iterator.next():
+            vectors.extend(np.asarray(decode_vector(row["vector_embs"], precision), dtype=np.float32) for row in batch)
+    finally:
+        iterator.close()
+
+    return np.stack(vectors)
+
+
+def _model_vectors(embedding_model, reports_dirs, chunk_size, overlap_tokens, device):
+    from ..core.config import settings
+    from ..services.chunking import compute_chunks
+    from ..services.embedder_registry import get_embedder
+
+    embedder = get_embedder(embedding_model, device)
+    texts = []
+
+    for reports_dir in reports_dirs:
+        for pdf_path in sorted(glob(os.path.join(reports_dir, "*.pdf"))):
+            sentences = _load_sentences(pdf_path)
+
+            if not sentences:
+                continue
+
+            inputs = embedder.tokenizer(sentences, **settings.embedders.default_emb_params)
+            texts.extend(" ".join(chunk) for chunk in compute_chunks(inputs, sentences, chunk_size, overlap_tokens))
+
+    return np.asarray(embedder.encode(texts, device=device), dtype=np.float32)
+
+
+def _synthetic_vectors(n_vectors, dim, n_clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(n_clusters, size=n_vectors)] + 0.5 * rng.normal(size=(n_vectors, dim)).astype(np.float32)
+
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _top_k_l2(corpus, queries, k):
+    # ||c||^2 - 2 q.c ranks the same as the L2 distance
+    scores = np.einsum("ij,ij->i", corpus, corpus)[None, :] - 2 * queries @ corpus.T
+    top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+
+    return np.take_along_axis(top, np.argsort(np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def _top_k_hamming(corpus, queries, k):
+    corpus_bits = np.unpackbits(np.packbits(corpus > 0, axis=1), axis=1).astype(np.float32)
+    query_bits = np.unpackbits(np.packbits(queries > 0, axis=1), axis=1).astype(np.float32)
+
+    # hamming(q, c) = |q| + |c| - 2 q.c on 0/1 codes
+    scores = corpus_bits.sum(axis=1)[None, :] - 2 * query_bits @ corpus_bits.T
+    top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+
+    return np.take_along_axis(top, np.argsort(np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def _sq8(corpus, queries):
+    # per-dimension min/max scalar quantizer, the same scheme as Milvus IVF_SQ8
+    low, high = corpus.min(axis=0), corpus.max(axis=0)
+    scale = np.where(high > low, (high - low) / 255, 1.0)
+
+    codes = np.clip(np.round((corpus - low) / scale), 0, 255)
+
+    return codes * scale + low, queries
+
+
+def _ranked(precision, corpus, queries, k):
+    if precision == "binary":
+        return _top_k_hamming(corpus, queries, k)
+    if precision == "float16":
+        return _top_k_l2(corpus.astype(np.float16).astype(np.float32),
+                         queries.astype(np.float16).astype(np.float32), k)
+    if precision == "int8":
+        return _top_k_l2(*_sq8(corpus, queries), k)
+    return _top_k_l2(corpus, queries, k)
+
+
+def _recall(found, truth, k):
+    return np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", help="read the corpus from this Milvus collection")
+    parser.add_argument("--model", help="`Embedders` key used to embed the reports")
+    parser.add_argument("--reports-dirs", nargs="+", default=REPORTS_DIRS)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=20)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--synthetic", type=int, default=20000, help="corpus size without --collection or --model")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--max-vectors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.collection:
+        vectors = _collection_vectors(args.collection, args.max_vectors)
+    elif args.model:
+        vectors = _model_vectors(args.model, args.reports_dirs, args.chunk_size, args.overlap_tokens, args.device)
+    else:
+        vectors = _synthetic_vectors(args.synthetic, args.dim, args.clusters, args.seed)
+
+    rng = np.random.default_rng(args.seed)
+    n_queries = min(args.queries, len(vectors) // 10)
+    query_idxs = rng.choice(len(vectors), size=n_queries, replace=False)
+
+    queries = vectors[query_idxs]
+    corpus = np.delete(vectors, query_idxs, axis=0)
+    dim = corpus.shape[1]
+    max_k = max(args.k)
+
+    truth = _top_k_l2(corpus, queries, max_k)
+
+    print(f"corpus {len(corpus)} x {dim}, {n_queries} held-out queries\n")
+    print(f"{'precision':<10}{'B/vector':>10}{'corpus MB':>11}{'MB per 1M':>11}" +
+          "".join(f"{f'recall@{k}':>11}" for k in args.k))
+
+    for precision in PRECISIONS:
+        found = _ranked(precision, corpus, queries, max_k)
+        n_bytes = bytes_per_vector(dim, precision)
+
+        print(f"{precision:<10}{n_bytes:>10}{n_bytes * len(corpus) / 2 ** 20:>11.1f}{n_bytes * 1e6 / 2 ** 20:>11.0f}" +
+              "".join(f"{_recall(found, truth, k):>11.3f}" for k in args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,83 @@
 import os
 from enum import Enum
 from typing import Dict
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class MilvusSettings(BaseSettings):
+    # "precision" picks how vectors are stored: float32, float16, int8 (scalar-quantized index) or binary (sign codes),
+    # see `services.vector_codec` and `python -m server.src.benchmarks.vector_precision` for the recall trade-off.
+    # "index" picks the ANN index of float32/float16 collections, e.g. {"type": "HNSW", "build": {"M": 16}, "search": {"ef": 64}},
+    # one of FLAT (the default), HNSW, IVF_FLAT, IVF_PQ or DISKANN; `python -m server.src.benchmarks.ann_index` reports
+    # recall and latency, and `python -m server.src.services.milvus_collections reindex` moves a collection to a new index.
+    # "partitions" makes `owner` the partition key, hashing each owner's chunks into one of that many partitions so a
+    # search scoped to owners only scans theirs; 0 keeps a single partition. Collections are not partitioned unless
+    # this is raised, e.g. to 64, after which `reindex` migrates an existing collection to the new layout
     collections: list[dict] = [
         {
             "collection_name": "OPENAI_CR_EMBS",
             "vector_dim": 1536,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         },
         {
             "collection_name": "GEMINI_CR_EMBS",
             "vector_dim": 768,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         },
         {
             "collection_name": "CLAUDE_CR_EMBS",
             "vector_dim": 1024,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         },
         {
             "collection_name": "STELLA_15_CR_EMBS",
             "vector_dim": 1024,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         },
         {
             "collection_name": "GTE_QWEN2_15_CR_EMBS",
             "vector_dim": 1536,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         },
         {
             "collection_name": "GTE_MODERNBERT_BASE_CR_EMBS",
             "vector_dim": 768,
             "chunk_max_length": 15000,
-            "add_emb_model_name": True
+            "add_emb_model_name": True,
+            "precision": "float32",
+            "index": {"type": "FLAT"},
+            "partitions": 0
         }
     ]
 
 
+    def collection(self, collection_name: str) -> dict:
+        for collection in self.collections:
+            if collection["collection_name"] == collection_name:
+                return collection
+        raise KeyError(f"No Milvus collection configured with the name {collection_name}")
+
+
 class Embedders(BaseSettings):
     #opensource
     stella_15: str = "dunzhang/stella_en_1.5B_v5"
@@ -63,9 +96,127 @@ class Embedders(BaseSettings):
                                 "return_length": True}
 
 
+class EmbedderRegistrySettings(BaseSettings):
+    # upper bound on the parameter memory of all embedders kept warm in one process
+    memory_budget_mb: int = 8192
+
+    # `Embedders` keys loaded when an API server or Celery worker boots
+    preload_models: list[str] = ["stella_15"]
+    preload_device: str = "cpu"
+
+
+class IngestionSettings(BaseSettings):
+    # approximate chunk length and overlap, both in embedder tokens
+    chunk_size: int = 256
+    overlap_tokens: int = 20
+
+    # processes used to extract PDF text (0 means one per core) and pages handed to each task
+    extraction_workers: int = 0
+    pages_per_shard: int = 16
+
+    # chunks sorted by length together, and the padded tokens (longest chunk x batch size) and chunks per forward pass
+    encode_window: int = 512
+    encode_token_budget: int = 16384
+    encode_batch_size: int = 64
+
+    # a buffered insert is flushed when either of these limits is reached
+    insert_batch_rows: int = 512
+    insert_batch_bytes: int = 16 * 1024 * 1024
+    insert_max_delay_sec: float = 2.0
+
+    # sentence-split documents shared by every embedding model, pruned after the ttl
+    sentence_cache_ttl_sec: int = 7 * 24 * 3600
+
+    # sentences per tokenizer call and capacity of each queue between pipeline stages
+    tokenize_batch_size: int = 256
+    stage_queue_size: int = 8
+
+    # minimum seconds between two progress updates published on the Celery task
+    progress_interval_sec: float = 1.0
+
+    # retries of a single (document, model) ingestion task, with exponential backoff from the base delay
+    task_max_retries: int = 3
+    task_retry_backoff_sec: int = 10
+
+
+class EmbeddingEngineSettings(BaseSettings):
+    # texts encoded together at most, and how long the first request of a batch waits for others
+    max_batch_texts: int = 64
+    max_wait_ms: float = 5.0
+    # requests queued per model before new ones are rejected
+    max_queue_size: int = 1024
+
+
+class ExecutorSettings(BaseSettings):
+    # threads per pool for blocking calls of the API handlers, see `services.executors`
+    retrieval_workers: int = 16
+    genai_workers: int = 8
+
+
+class RetrievalSettings(BaseSettings):
+    # default of `retrieval.RETRIEVAL_MODES`, and how many candidates per result "two_stage" re-scores and "fused" ranks,
+    # see `python -m server.src.benchmarks.two_stage` for its recall and latency
+    mode: str = "vector"
+    candidate_multiplier: int = 10
+    # "fused" sums 1 / (rrf_k + rank) over the vector and BM25 rankings, larger values flatten the head of each
+    rrf_k: int = 60
+
+
+class ReportGenerationSettings(BaseSettings):
+    # hits retrieved for each section of a generated plan, and the embedder tokens of them its prompts may carry
+    section_k: int = 5
+    section_context_tokens: int = 1024
+
+
+class LocalVectorStoreSettings(BaseSettings):
+    # read from LOCAL_VECTOR_STORE_PATH etc., a bare `path` would be taken from $PATH
+    model_config = SettingsConfigDict(env_prefix="LOCAL_VECTOR_STORE_")
+
+    # where `VECTOR_STORE_BACKEND=local` keeps its collections, see `services.local_vector_store`
+    path: str = os.path.join(os.getcwd(), "temp_files", "vector_store")
+    # a collection is compacted once it has more segments, or more of its rows deleted, than this
+    max_segments: int = 32
+    max_deleted_ratio: float = 0.2
+
+
+class ResultCacheSettings(BaseSettings):
+    # search hits cached per query until ingestion changes the collection, see `services.result_cache`;
+    # the TTL only bounds memory, and results are not cached while new rows may still be becoming searchable
+    enabled: bool = True
+    ttl_sec: int = 24 * 3600
+    settle_sec: float = 5.0
+
+
+class QueryCacheSettings(BaseSettings):
+    # vectors kept in each process, vectors kept in Redis, and how long either keeps them
+    max_entries: int = 2048
+    redis_max_entries: int = 100000
+    ttl_sec: int = 7 * 24 * 3600
+
+
+class UploadSettings(BaseSettings):
+    # bytes read from the request per step, and the largest accepted file
+    read_chunk_bytes: int = 1024 * 1024
+    max_file_bytes: int = 512 * 1024 * 1024
+
+    # files of one request written concurrently, and threads shared by all uploads for disk writes and hashing
+    max_concurrent_files: int = 4
+    io_threads: int = 8
+
+
 class Settings(BaseSettings):
     milvus: MilvusSettings = MilvusSettings()
     embedders: Embedders = Embedders()
+    embedder_registry: EmbedderRegistrySettings = EmbedderRegistrySettings()
+    ingestion: IngestionSettings = IngestionSettings()
+    uploads: UploadSettings = UploadSettings()
+    query_cache: QueryCacheSettings = QueryCacheSettings()
+    embedding_engine: EmbeddingEngineSettings = EmbeddingEngineSettings()
+    executors: ExecutorSettings = ExecutorSettings()
+    retrieval: RetrievalSettings = RetrievalSettings()
+    report_generation: ReportGenerationSettings = ReportGenerationSettings()
+    local_vector_store: LocalVectorStoreSettings = LocalVectorStoreSettings()
+    result_cache: ResultCacheSettings = ResultCacheSettings()
 
     app_name: str = "Self-Decisive MARAG Backend API Server"
     base_path: str = os.path.join(os.getcwd(), "server", "src")
@@ -73,6 +224,7 @@ class Settings(BaseSettings):
     temp_files_path: str = os.path.join(os.getcwd(), "temp_files")
     carbon_reports_path: str = os.path.join(base_path, "carbon_reports")
     user_files_path: str = os.path.join(base_path, "user_files")
+    sentence_cache_path: str = os.path.join(temp_files_path, "sentence_cache")
     
 
 settings = Settings()
@@ -11,6 +11,7 @@ from celery import Celery
 _milvus_client = None
 _mongo_client: Optional[motor_asyncio.AsyncIOMotorClient] = None
 _core_db = None
+_redis_client = None
 
 # Initialize Celery app immediately since it's needed for decorators
 celery_app = Celery("smarag-celery",
@@ -22,6 +23,10 @@ celery_app = Celery("smarag-celery",
 def get_milvus_client():
     """Get or create Milvus client with lazy initialization."""
     global _milvus_client
+    if _milvus_client is None and os.getenv("VECTOR_STORE_BACKEND", "milvus").lower() == "local":
+        # embedded stand-in for development, CI and small installs, no Milvus server needed
+        from ..services.local_vector_store import LocalVectorStore
+        _milvus_client = LocalVectorStore(os.getenv("LOCAL_VECTOR_STORE_PATH"))
     if _milvus_client is None:
         try:
             from pymilvus import MilvusClient
@@ -45,6 +50,15 @@ def get_mongo_client():
         _core_db = _mongo_client.get_database(os.getenv('MONGO_CORE_DB'))
     return _core_db
 
+def get_redis_client():
+    """Get or create the Redis client used for shared caches and manifests."""
+    global _redis_client
+    if _redis_client is None:
+        from redis import Redis
+        redis_url = os.getenv("REDIS_URL", os.getenv("CELERY_BACKEND", "redis://localhost:6379/0"))
+        _redis_client = Redis.from_url(redis_url)
+    return _redis_client
+
 # Create lazy milvus client for backward compatibility
 class LazyMilvusClient:
     def __init__(self):
@@ -1,6 +1,10 @@
+import os
+
 import nltk
 from nltk.tokenize import sent_tokenize
 
+from celery.signals import celeryd_after_setup, worker_init, worker_process_init
+
 from fastapi import FastAPI
 
 from typing import Callable
@@ -11,6 +15,46 @@ from .config import settings
 
 logger = get_logger(__name__)
 
+REQUIRED_CHUNK_FIELDS = ["doc_id", "page_start", "page_end", "chunk_hash", "company", "owner", "year"]
+
+
+def _check_collection_fields(milvus_client, collection_name: str) -> None:
+    from ..services.vector_codec import collection_precision, collection_index, collection_partitions, vector_datatype
+    from ..services.retrieval import BM25_FIELD
+
+    fields = {field["name"]: field for field in milvus_client.describe_collection(collection_name=collection_name)["fields"]}
+    missing = [field for field in REQUIRED_CHUNK_FIELDS if field not in fields]
+
+    if missing:
+        logger.error(f"Collection {collection_name} was created by an older version and lacks {missing}. "
+                     f"Ingestion into it will fail until it is dropped and recreated.")
+
+    precision = collection_precision(collection_name)
+
+    if "vector_embs" in fields and fields["vector_embs"]["type"] != vector_datatype(precision):
+        logger.error(f"Collection {collection_name} stores {fields['vector_embs']['type']} vectors but is configured "
+                     f"with precision {precision}. Drop and recreate it, or change the configured precision back.")
+
+    index_type = collection_index(collection_name)["type"]
+    built_type = milvus_client.describe_index(collection_name=collection_name, index_name="vector_embs").get("index_type")
+
+    if precision in ("float32", "float16") and built_type != index_type:
+        logger.warning(f"Collection {collection_name} has a {built_type} index but is configured with {index_type}. "
+                       f"Run `python -m server.src.services.milvus_collections reindex {collection_name}` to rebuild it.")
+
+    if BM25_FIELD not in fields:
+        logger.warning(f"Collection {collection_name} has no BM25 field, the \"fused\" retrieval mode fails on it. Run "
+                       f"`python -m server.src.services.milvus_collections reindex {collection_name}` to add it.")
+
+    partitions = collection_partitions(collection_name)
+    partitioned = bool(fields.get("owner", {}).get("is_partition_key"))
+
+    if partitioned != (partitions > 0):
+        logger.warning(f"Collection {collection_name} is {'' if partitioned else 'not '}partitioned by owner but is "
+                       f"configured with {partitions} partitions. Run "
+                       f"`python -m server.src.services.milvus_collections reindex {collection_name}` to migrate it.")
+
+
 def _startup_model(app: FastAPI, milvus_client) -> None:
 
     logger.info("Checking and Downloading(if needed) NLTK Deps")
@@ -26,47 +70,13 @@ def _startup_model(app: FastAPI, milvus_client) -> None:
     logger.info("\n\nChecking and Creating Milvus Collections if required\n\n")
 
     try:
-        from pymilvus import MilvusClient, DataType
-        
+        from ..services.milvus_collections import create_chunk_collection
+
         for collection in settings.milvus.collections:
             if not milvus_client.has_collection(collection_name=collection["collection_name"]):
-                schema = MilvusClient.create_schema(
-                    auto_id=False, 
-                    enable_dynamic_field=False
-                )
-
-                schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, auto_id=True)
-                schema.add_field(field_name="vector_embs", datatype=DataType.FLOAT_VECTOR, dim=collection["vector_dim"])
-                schema.add_field(field_name="head_embs", datatype=DataType.FLOAT_VECTOR, dim=128)
-                schema.add_field(field_name="text_chunk", datatype=DataType.VARCHAR, max_length=collection["chunk_max_length"])
-
-                if collection.get("add_emb_model_name", False):
-                    schema.add_field(field_name="emb_model_name", datatype=DataType.VARCHAR, max_length=64)
-
-                index_params = milvus_client.prepare_index_params()
-
-                index_params.add_index(
-                    field_name="id",
-                    index_type="STL_SORT"
-                )
-
-                index_params.add_index(
-                    field_name="head_embs", 
-                    index_type="FLAT",
-                    metric_type="L2"
-                )
-
-                index_params.add_index(
-                    field_name="vector_embs", 
-                    index_type="FLAT",
-                    metric_type="L2"
-                )
-
-                milvus_client.create_collection(
-                    collection_name=collection["collection_name"],
-                    schema=schema,
-                    index_params=index_params
-                )
+                create_chunk_collection(milvus_client, collection)
+            else:
+                _check_collection_fields(milvus_client, collection["collection_name"])
     except Exception as e:
         logger.error(f"Failed to initialize Milvus collections: {e}")
         logger.info("Continuing without Milvus collections...")
@@ -74,9 +84,55 @@ def _startup_model(app: FastAPI, milvus_client) -> None:
     logger.info("\n\nMilvus Collections Check/Creation complete!\n\n")
 
 
+def _preload_embedders() -> None:
+    if not os.getenv("USE_EMBEDDERS_LOCALLY"):
+        return
+
+    from ..services.embedder_registry import embedder_registry
+
+    logger.info(f"Preloading embedders: {settings.embedder_registry.preload_models}")
+
+    embedder_registry.preload()
+
+
+def _start_embedding_engine() -> None:
+    if not os.getenv("USE_EMBEDDERS_LOCALLY"):
+        return
+
+    from ..services.embedding_engine import embedding_engine
+
+    # the API serves queries from the engine, its workers start with the preloaded models
+    embedding_engine.start(settings.embedder_registry.preload_models, settings.embedder_registry.preload_device)
+
+
 def start_app_handler(app: FastAPI, milvus_client) -> Callable:
     def startup() -> None:
         logger.info("Running app start handler.")
         
         _startup_model(app, milvus_client)
+        _preload_embedders()
+        _start_embedding_engine()
     return startup
+
+
+@celeryd_after_setup.connect
+def add_host_queue_handler(sender=None, instance=None, **kwargs) -> None:
+    from ..services.sentence_cache import host_queue
+
+    # besides the shared queue each worker consumes its own, where a document's later ingestion tasks are sent
+    instance.app.amqp.queues.select_add(host_queue(sender))
+
+
+@worker_init.connect
+def start_worker_handler(sender=None, **kwargs) -> None:
+    # prefork children load their own copies in `worker_process_init`, models must not be loaded before the fork
+    pool_cls = getattr(sender, "pool_cls", "")
+    pool_name = pool_cls if isinstance(pool_cls, str) else getattr(pool_cls, "__module__", "")
+
+    if "prefork" not in pool_name:
+        _preload_embedders()
+
+
+@worker_process_init.connect
+def start_worker_process_handler(**kwargs) -> None:
+    _preload_embedders()
@@ -5,6 +5,9 @@ from pydantic import BaseModel, Field, field_validator, EmailStr
 from sympy import O
 
 
+OWNERS_DESCRIPTION = ("Only search the chunks uploaded under these owners. This narrows results for relevance "
+                      "and speed, it is not access control: any caller may name any owner.")
+
 class CarbonReportPlanRequest(BaseModel):
     standard: str
     goal: str
@@ -31,6 +34,10 @@ class CRPlanRequest:
     company: str = field(default=None)
     genai_model: str = field(default="openai-gpt-4o")
     device: str = field(default="cpu")
+    filter: str = field(default=None)
+    retrieval_mode: str = field(default=None)
+    candidate_multiplier: int = field(default=None)
+    owners: list = field(default=None)
 
 
 @dataclass
@@ -78,6 +85,10 @@ class AIEditsRequest(BaseModel):
     user_request: str
     genai_model: str = Field(default=None)
     device: str = Field(default=None)
+    filter: Optional[str] = Field(default=None)
+    owners: Optional[List[str]] = Field(default=None, description=OWNERS_DESCRIPTION)
+    retrieval_mode: Optional[str] = Field(default=None)
+    candidate_multiplier: Optional[int] = Field(default=None, ge=1)
 
 
 class AIEditsResponse(BaseModel):
@@ -90,6 +101,9 @@ class ComputeDocumentEmbeddingsRequest(BaseModel):
     embedding_model: str = Field(default=None)
     device: str = Field(default="cpu", validate_default=True)
     chunk_size: int = Field(default=256, validate_default=True)
+    company: Optional[str] = Field(default=None)
+    owner: Optional[str] = Field(default=None)
+    year: Optional[int] = Field(default=None)
 
     @field_validator('chunk_size', mode='before')
     @classmethod
@@ -118,6 +132,10 @@ class SearchEmbRequest(BaseModel):
     model: str
     k: int = Field(default=3, validate_default=True)
     device: str = Field(default="cpu", validate_default=True)
+    filter: Optional[str] = Field(default=None)
+    owners: Optional[List[str]] = Field(default=None, description=OWNERS_DESCRIPTION)
+    retrieval_mode: Optional[str] = Field(default=None)
+    candidate_multiplier: Optional[int] = Field(default=None, ge=1)
 
     @field_validator('k', mode='before')
     @classmethod
@@ -130,6 +148,29 @@ class SearchEmbRequest(BaseModel):
         return device or "cpu"
 
 
+class BatchSearchEmbRequest(BaseModel):
+    # one request embeds and searches all its queries at once, larger batches belong in several requests
+    queries: List[str] = Field(min_length=1, max_length=64)
+    model: str
+    k: int = Field(default=3, validate_default=True)
+    device: str = Field(default="cpu", validate_default=True)
+    filter: Optional[str] = Field(default=None)
+    owners: Optional[List[str]] = Field(default=None, description=OWNERS_DESCRIPTION)
+    retrieval_mode: Optional[str] = Field(default=None)
+    candidate_multiplier: Optional[int] = Field(default=None, ge=1)
+    deduplicate: bool = Field(default=False)
+
+    @field_validator('k', mode='before')
+    @classmethod
+    def ensure_k(cls, k: Optional[int]) -> int:
+        return k or 3
+
+    @field_validator('device', mode='before')
+    @classmethod
+    def ensure_device(cls, device: Optional[str]) -> str:
+        return device or "cpu"
+
+
 class UserLoginRequest(BaseModel):
     user_email: EmailStr
     password: str
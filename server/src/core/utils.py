@@ -59,6 +59,19 @@ def get_hash(file_path):
     return file_hash.hexdigest()
 
 
+def store_by_hash(src_path, target_dir, suffix=".pdf", file_hash=None):
+    # identical uploads collapse onto one `<hash><suffix>` file in target_dir
+    file_hash = file_hash or get_hash(src_path)
+    target_path = os.path.join(target_dir, f"{file_hash}{suffix}")
+
+    if os.path.exists(target_path):
+        delete_file(src_path)
+    else:
+        os.replace(src_path, target_path)
+
+    return target_path, file_hash
+
+
 def get_device(req_device: str = None):
     if req_device is not None and req_device.lower().strip() == "cuda" and torch.cuda.is_available():
         return "cuda"
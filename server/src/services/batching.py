@@ -0,0 +1,83 @@
+from typing import List, Sequence
+
+import numpy as np
+
+from ..core.config import settings
+
+
+def token_budget_batches(lengths: Sequence[int], token_budget: int, max_batch_size: int = None) -> List[np.ndarray]:
+    """
+    Groups text indices into forward passes, longest texts first. A batch costs its size times
+    its longest text, as every text is padded to that, and is closed once adding the next text
+    would take it over `token_budget` or past `max_batch_size` texts. Sorting first means
+    texts of similar length share a batch, so little of the budget goes to padding.
+    """
+    lengths = np.maximum(np.asarray(lengths, dtype=np.int64), 1)
+    order = np.argsort(-lengths, kind="stable")
+
+    batches = []
+    start = 0
+
+    while start < len(order):
+        # sorted descending, so the first text of the batch sets the padded length
+        longest = lengths[order[start]]
+        size = max(1, token_budget // longest)
+
+        if max_batch_size:
+            size = min(size, max_batch_size)
+
+        batches.append(order[start:start + size])
+        start += size
+
+    return batches
+
+
+def text_lengths(embedder, texts: List[str]) -> List[int]:
+    inputs = embedder.tokenizer(texts, **settings.embedders.default_emb_params)
+
+    if "length" in inputs:
+        return list(inputs["length"])
+    return [len(ids) for ids in inputs["input_ids"]]
+
+
+def encode_length_sorted(embedder,
+                         texts: List[str],
+                         lengths: Sequence[int] = None,
+                         token_budget: int = None,
+                         max_batch_size: int = None,
+                         device: str = None,
+                         **encode_kwargs) -> np.ndarray:
+    """
+    `embedder.encode(texts)` with batches packed by `token_budget_batches`, returned in the
+    order of `texts`. `lengths` are token counts, e.g. from the chunker; they are computed with
+    the embedder's tokenizer when not given.
+    """
+    if len(texts) == 0:
+        return np.zeros((0, embedder.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    token_budget = token_budget or settings.ingestion.encode_token_budget
+    max_batch_size = max_batch_size or settings.ingestion.encode_batch_size
+
+    if lengths is None:
+        lengths = text_lengths(embedder, texts)
+
+    # texts beyond the model's maximum are truncated, so they cost no more than the maximum
+    max_seq_length = getattr(embedder, "max_seq_length", None)
+
+    if max_seq_length:
+        lengths = np.minimum(np.asarray(lengths, dtype=np.int64), max_seq_length)
+
+    embeddings = None
+
+    for batch in token_budget_batches(lengths, token_budget, max_batch_size):
+        batch_embeddings = np.asarray(embedder.encode([texts[idx] for idx in batch],
+                                                      batch_size=len(batch),
+                                                      device=device,
+                                                      **encode_kwargs))
+
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=batch_embeddings.dtype)
+
+        embeddings[batch] = batch_embeddings
+
+    return embeddings
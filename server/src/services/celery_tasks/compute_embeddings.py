@@ -1,80 +1,179 @@
 import os
 from glob import glob
-from typing import Union
-from tqdm import tqdm
+from typing import Dict, List, Union
 
-import pymupdf
-
-from sentence_transformers import SentenceTransformer
-
-from nltk import sent_tokenize
+from celery import chain, chord
 
 from ...core.dependencies import celery_app, milvus_client
-from ...core.utils import get_logger, clear_torch_cache
+from ...core.utils import get_logger, get_hash
 from ...core.config import settings, GAIEmbeddersCollections, settings
+from ..milvus_writer import MilvusBulkWriter, delete_chunks, delete_uncommitted
+from ..vector_codec import collection_precision, encode_vectors
+from ..chunk_metadata import document_metadata
+from ..embedder_registry import get_embedder
+from ..ingestion_manifest import ingestion_manifest, document_versions, changed_pages
+from ..ingestion_pipeline import iter_ingestion_batches, DocumentEnd
+from ..ingestion_progress import IngestionProgress, SharedProgress, PROGRESS_STATE
+from ..pdf_extraction import count_pages
+from ..sentence_cache import SentenceCache, host_queue
+from ..result_cache import search_result_cache
 
 
 logger = get_logger(__name__)
 
 
-def compute_chunks(inputs, text_sents, chunk_size_approx=256, overlap_tokens=20):
-    start_idx = 0
-
-    out_embs = []
-    out_texts = []
-
-    added_idxs = set()
-
-    while start_idx < len(inputs["input_ids"]):
-        curr_len = len(inputs["input_ids"][start_idx])
-        temp_embs = [inputs["input_ids"][start_idx]]
-        temp_txts = [text_sents[start_idx]]
-
-        temp_idxs = [start_idx]
-
-        while start_idx+1<len(inputs["input_ids"]) and curr_len <= chunk_size_approx:
-            start_idx += 1
-            
-            temp_embs.append(inputs["input_ids"][start_idx])
-            temp_txts.append(text_sents[start_idx])
-
-            temp_idxs.append(start_idx)
-            
-            curr_len += len(inputs["input_ids"][start_idx])
-        
-        if tuple(temp_idxs) not in added_idxs:
-            out_embs.append(temp_embs)
-            out_texts.append(temp_txts)
-        
-            added_idxs.add(tuple(temp_idxs))
-        else:
-            start_idx += 1
-            continue
-        
-
-        if start_idx+1 >= len(inputs["input_ids"]):
-            break
-
-        if len(inputs["input_ids"][start_idx]) >= chunk_size_approx:
-            start_idx += 1
-            continue
-
-        curr_overlap_size = 0
-
-        while start_idx > 0 and curr_overlap_size <= overlap_tokens:
-            start_idx -= 1
-            curr_overlap_size += len(inputs["input_ids"][start_idx])
-
-    
-    return out_texts
-
-
-@celery_app.task(ignore_result=False, track_started=True)
-def start_computing(docs_path: Union[str, list], 
-                    embedding_model: str, 
-                    device:str = None, 
-                    paths_as_list:list = False):
-
+def ingest_documents(doc_paths: List[str],
+                     embedding_model: str,
+                     device: str,
+                     chunk_size: int,
+                     overlap_tokens: int,
+                     doc_ids: Dict[str, str],
+                     doc_hashes: Dict[str, str],
+                     doc_metadata: Dict[str, Dict],
+                     progress: IngestionProgress,
+                     sentence_cache: SentenceCache = None,
+                     is_retry: bool = False) -> None:
+    """
+    Embeds `doc_paths` with one model and writes their chunks to its collection. Chunks stored
+    for an earlier version of a document are kept, stale ones are deleted, and each document is
+    only recorded in the manifest once all its rows are inserted.
+    """
+    emb_model = settings.embedders.model_fields[embedding_model].default
+
+    logger.info(f"Computing chunks for: {emb_model}")
+    embedder = get_embedder(embedding_model, device)
+
+    vector_col_name = GAIEmbeddersCollections.mapping()[embedding_model]
+    precision = collection_precision(vector_col_name)
+
+    # chunks already stored for an earlier version of a document are not embedded again
+    known_chunks = {doc_path: document_versions.chunk_hashes(doc_ids[doc_path], embedding_model,
+                                                             chunk_size, overlap_tokens)
+                    for doc_path in doc_paths}
+
+    try:
+        _ingest_into(vector_col_name, precision, emb_model, doc_paths, embedding_model, embedder, device,
+                     chunk_size, overlap_tokens, doc_ids, doc_hashes, doc_metadata, progress,
+                     sentence_cache, known_chunks, is_retry)
+    finally:
+        # whatever was written, complete or not, makes cached search results of the collection stale
+        search_result_cache.bump(vector_col_name)
+
+
+def _ingest_into(vector_col_name, precision, emb_model, doc_paths, embedding_model, embedder, device,
+                 chunk_size, overlap_tokens, doc_ids, doc_hashes, doc_metadata, progress,
+                 sentence_cache, known_chunks, is_retry) -> None:
+    for doc_path in doc_paths:
+        doc_id = doc_ids[doc_path]
+        stored_metadata = document_versions.metadata(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        # chunks stored with other metadata, e.g. for another owner and so in another partition, are all written again
+        if known_chunks[doc_path] and stored_metadata is not None and stored_metadata != doc_metadata[doc_path]:
+            logger.info(f"Metadata of {doc_id} changed from {stored_metadata}, replacing all its chunks")
+
+            delete_uncommitted(milvus_client, vector_col_name, doc_id, [])
+            document_versions.save(doc_id, embedding_model, chunk_size, overlap_tokens, chunk_hashes=[], page_hashes=[])
+
+            known_chunks[doc_path] = set()
+
+    # a failed attempt may have inserted part of a document without recording it
+    if is_retry:
+        for doc_path in doc_paths:
+            delete_uncommitted(milvus_client, vector_col_name, doc_ids[doc_path], known_chunks[doc_path])
+
+    ingested_docs = []
+
+    # cached search results go stale with every batch that becomes searchable, not only at the end
+    with MilvusBulkWriter(milvus_client, vector_col_name,
+                          on_insert=lambda: search_result_cache.bump(vector_col_name)) as writer:
+        progress.start_model(embedding_model, writer)
+
+        # extraction, splitting, tokenization, chunking and encoding all run concurrently
+        for item in iter_ingestion_batches(doc_paths, embedder, chunk_size, overlap_tokens, device,
+                                           sentence_cache=sentence_cache,
+                                           doc_hashes=doc_hashes,
+                                           known_chunks=known_chunks,
+                                           stage_stats=progress.stage_stats):
+            if isinstance(item, DocumentEnd):
+                progress.document_done(item)
+
+                if item.n_chunks == 0:
+                    logger.warning(f"No text extracted from {item.doc_path}, skipping.")
+                else:
+                    logger.info(f"Chunked {item.n_chunks} chunks of {item.doc_path}, encoded "
+                                f"{item.n_chunks - item.n_skipped} new ones with {emb_model}")
+                    ingested_docs.append(item)
+                continue
+
+            writer.add(vector_embs=encode_vectors(item.embeddings, precision),
+                       head_embs=encode_vectors(item.embeddings[:, :128], precision),
+                       text_chunk=item.texts,
+                       emb_model_name=emb_model,
+                       doc_id=[doc_ids[doc_path] for doc_path in item.doc_paths],
+                       company=[doc_metadata[doc_path]["company"] for doc_path in item.doc_paths],
+                       owner=[doc_metadata[doc_path]["owner"] for doc_path in item.doc_paths],
+                       year=[doc_metadata[doc_path]["year"] for doc_path in item.doc_paths],
+                       page_start=[chunk.first_page for chunk in item.chunks],
+                       page_end=[chunk.last_page for chunk in item.chunks],
+                       chunk_hash=[chunk.chunk_hash for chunk in item.chunks])
+
+            progress.batch_encoded(item)
+
+    # only recorded once the writer has flushed, so a failed insert is retried next time
+    for doc_end in ingested_docs:
+        doc_id = doc_ids[doc_end.doc_path]
+
+        stale_chunks = sorted(known_chunks[doc_end.doc_path] - set(doc_end.chunk_hashes))
+
+        if stale_chunks:
+            progress.record_deleted(delete_chunks(milvus_client, vector_col_name, doc_id, stale_chunks))
+            search_result_cache.bump(vector_col_name)
+
+        if known_chunks[doc_end.doc_path]:
+            old_page_hashes = document_versions.page_hashes(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+            logger.info(f"Re-ingested {doc_id} with {emb_model}: "
+                        f"pages changed {changed_pages(old_page_hashes, doc_end.page_hashes)}, "
+                        f"{doc_end.n_chunks - doc_end.n_skipped} chunks embedded, {len(stale_chunks)} deleted")
+
+        metadata = doc_metadata[doc_end.doc_path]
+        previous_hash = document_versions.file_hash(doc_id, embedding_model, chunk_size, overlap_tokens)
+        previous_metadata = document_versions.metadata(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        document_versions.save(doc_id, embedding_model, chunk_size, overlap_tokens,
+                               chunk_hashes=doc_end.chunk_hashes,
+                               page_hashes=doc_end.page_hashes,
+                               file_hash=doc_hashes[doc_end.doc_path],
+                               metadata=metadata)
+
+        ingestion_manifest.mark_ingested(doc_hashes[doc_end.doc_path], doc_id, embedding_model, chunk_size, overlap_tokens,
+                                         metadata=metadata,
+                                         doc_path=doc_end.doc_path,
+                                         n_chunks=doc_end.n_chunks)
+
+        # the replaced version is no longer stored, uploading it again has to re-ingest it
+        if previous_hash and (previous_hash, previous_metadata) != (doc_hashes[doc_end.doc_path], metadata):
+            ingestion_manifest.forget(previous_hash, doc_id, embedding_model, chunk_size, overlap_tokens, previous_metadata)
+
+    progress.finish_model()
+
+
+@celery_app.task(bind=True, ignore_result=False, track_started=True)
+def start_computing(self,
+                    docs_path: Union[str, list],
+                    embedding_model: str,
+                    device:str = None,
+                    paths_as_list:list = False,
+                    chunk_size: int = None,
+                    doc_ids: list = None,
+                    metadata: dict = None):
+    """
+    Plans the ingestion of `docs_path` and fans it out as one `embed_document` task per
+    (document, model) pair still missing from the manifest. The tasks of a document run as a
+    chain pinned to the worker that picks up its first task, so later models read its sentences
+    back from that worker's sentence cache, while different documents spread over all workers. `finish_ingestion` takes over the id of this task, which
+    therefore reports the overall progress and, in the end, the summary.
+    """
     logger.info("Computing Document Embeddings")
 
     if embedding_model is None: # uses all models to extract embeddings
@@ -82,82 +181,121 @@ def start_computing(docs_path: Union[str, list],
     else:
         embedding_model = embedding_model.lower().strip()
         all_emb_models = [embedding_model]
-    
+
     if not paths_as_list:
         docs_path = docs_path+"/*.pdf" if docs_path[-1] != "/" else docs_path+"*.pdf"
         docs_path = glob(docs_path)
 
     logger.info(f"Docs path: {docs_path}")
 
-    for embedding_model in tqdm(all_emb_models):
-        if embedding_model in GAIEmbeddersCollections.opensource_embedders().keys() and os.getenv("USE_EMBEDDERS_LOCALLY"):
-            logger.info("\n\nDownloading and/or loading all required Embedding Models locally!\n\n")
+    # a document keeps its id across uploads, which is what lets an edited version replace the old one;
+    # by default that is its location, file names alone are not unique across folders
+    if doc_ids is None:
+        doc_ids = [os.path.abspath(doc_path) for doc_path in docs_path]
 
-            emb_model = settings.embedders.model_fields[embedding_model].default
-            
-            logger.info(f"Dowloading/Loading and computing chunks for: {emb_model}")
-            embedder = SentenceTransformer(emb_model,
-                                           trust_remote_code=True, 
-                                           device=device)
-            
-            emb_tokenizer = embedder.tokenizer
+    # one stored file may back several documents, e.g. the same report uploaded under two ids,
+    # so documents are keyed by their id and each is ingested on its own
+    documents = dict(zip(doc_ids, docs_path))
 
-            for doc_path in docs_path:
-                doc = pymupdf.open(doc_path)
+    chunk_size = chunk_size or settings.ingestion.chunk_size
+    overlap_tokens = settings.ingestion.overlap_tokens
 
-                text_list = []
+    doc_hashes = {doc_path: get_hash(doc_path) for doc_path in set(documents.values())}
+    doc_metadata = {doc_id: document_metadata(doc_id, **(metadata or {})) for doc_id in documents}
 
-                for page in doc:
-                    text = page.get_text()
-                    text_list.append(text)
+    pending_models = {}
 
-                full_text = " ".join(text_list).strip()
-
-                if not full_text:
-                    logger.warning(f"No text extracted from {doc_path}, skipping.")
+    for embedding_model in all_emb_models:
+        if embedding_model in GAIEmbeddersCollections.opensource_embedders().keys() and os.getenv("USE_EMBEDDERS_LOCALLY"):
+            for doc_id, doc_path in documents.items():
+                if ingestion_manifest.is_ingested(doc_hashes[doc_path], doc_id, embedding_model,
+                                                  chunk_size, overlap_tokens, doc_metadata[doc_id]):
+                    logger.info(f"{doc_path} is already embedded with {embedding_model} as {doc_id}, skipping.")
                     continue
-
-                sent_tokenized_text = sent_tokenize(full_text)
-
-                if not sent_tokenized_text:
-                    sent_tokenized_text = [full_text]
-
-                emb_inps = emb_tokenizer(sent_tokenized_text, **settings.embedders.default_emb_params)
-
-                emb_chunks = compute_chunks(emb_inps, 
-                                            sent_tokenized_text, 
-                                            chunk_size_approx=256, 
-                                            overlap_tokens=20)
-
-                logger.info(f"Chunking completed for: {emb_model}")
-
-                logger.info(f"Pushing embeddings to Milvus Vector Store with emb_model_name as {emb_model}!")
-
-                emb_chunks_joined = [" ".join(i) for i in emb_chunks]
-                
-                computed_embeddings = embedder.encode(emb_chunks_joined,
-                                                      show_progress_bar="tqdm",
-                                                      device=device)
-                
-                vector_col_name = GAIEmbeddersCollections.mapping()[embedding_model]
-
-                for chunk_idx, chunk in enumerate(computed_embeddings):
-                    chunk_data = {
-                        "vector_embs": chunk,
-                        "head_embs": chunk[:128],
-                        "text_chunk": emb_chunks_joined[chunk_idx],
-                        "emb_model_name": emb_model
-                    }
-
-                    milvus_client.insert(collection_name=vector_col_name, 
-                                         data=chunk_data)
-
-            del embedder
-            clear_torch_cache()
-
+                pending_models.setdefault(doc_id, []).append(embedding_model)
         else:
             # handle the closed source model embeddings
             continue
-    
-    return True
-    
\ No newline at end of file
+
+    page_counts = count_pages(sorted({documents[doc_id] for doc_id in pending_models}))
+
+    shared = SharedProgress(self.request.id)
+    shared.plan(docs_total=sum(len(models) for models in pending_models.values()),
+                pages_total=sum(page_counts[documents[doc_id]] * len(models) for doc_id, models in pending_models.items()),
+                models_total=len({model for models in pending_models.values() for model in models}))
+
+    if not pending_models:
+        summary = shared.as_dict()
+        shared.clear()
+        return summary
+
+    self.update_state(state=PROGRESS_STATE, meta=shared.as_dict())
+
+    header = [chain(*[embed_document.si(documents[doc_id], doc_id, doc_hashes[documents[doc_id]], model, device,
+                                        chunk_size, overlap_tokens, metadata, self.request.id)
+                      for model in models])
+              for doc_id, models in pending_models.items()]
+
+    logger.info(f"Fanning out {sum(len(models) for models in pending_models.values())} ingestion tasks "
+                f"over {len(pending_models)} documents")
+
+    return self.replace(chord(header, finish_ingestion.s(self.request.id)))
+
+
+@celery_app.task(bind=True, ignore_result=False, track_started=True)
+def embed_document(self,
+                   doc_path: str,
+                   doc_id: str,
+                   doc_hash: str,
+                   embedding_model: str,
+                   device: str,
+                   chunk_size: int,
+                   overlap_tokens: int,
+                   metadata: dict,
+                   parent_id: str):
+    """
+    Ingests one document with one model, retried on its own with exponential backoff. Once the
+    retries are used up the failure is recorded for the summary instead of failing the other
+    documents of the batch.
+    """
+    progress = IngestionProgress(task=self, parent_id=parent_id)
+    progress.plan({embedding_model: [doc_path]}, count_pages([doc_path]))
+
+    # the sentence cache is on this worker's disk, the rest of the document's chain runs here to read it back
+    for signature in self.request.chain or []:
+        signature.setdefault("options", {})["queue"] = host_queue(self.request.hostname)
+
+    try:
+        ingest_documents([doc_path], embedding_model, device, chunk_size, overlap_tokens,
+                         doc_ids={doc_path: doc_id},
+                         doc_hashes={doc_path: doc_hash},
+                         doc_metadata={doc_path: document_metadata(doc_id, **(metadata or {}))},
+                         progress=progress,
+                         sentence_cache=SentenceCache(),
+                         is_retry=self.request.retries > 0)
+    except Exception as e:
+        progress.rollback_shared()
+
+        if self.request.retries < settings.ingestion.task_max_retries:
+            logger.warning(f"Ingesting {doc_id} with {embedding_model} failed, retrying: {e}")
+            raise self.retry(exc=e,
+                             max_retries=settings.ingestion.task_max_retries,
+                             countdown=settings.ingestion.task_retry_backoff_sec * 2 ** self.request.retries)
+
+        logger.error(f"Ingesting {doc_id} with {embedding_model} failed after {self.request.retries} retries: {e}")
+        SharedProgress(parent_id).add_failure(doc_id, embedding_model, str(e))
+
+        return {"doc_id": doc_id, "model": embedding_model, "error": str(e)}
+
+    return {"doc_id": doc_id, "model": embedding_model, **progress.as_dict()}
+
+
+@celery_app.task(bind=True, ignore_result=False)
+def finish_ingestion(self, results, parent_id: str):
+    shared = SharedProgress(parent_id)
+    summary = shared.as_dict()
+    shared.clear()
+
+    logger.info(f"Ingestion finished: {summary}")
+
+    return summary
@@ -1,17 +1,82 @@
+import json
 from typing import Dict, Union, List
 
+import torch
+
 from ...core.dependencies import celery_app
 from ...core.utils import get_logger
+from ...core.config import settings
 from ...agents import AgentBase
 from ...agents.prompts import *
+from ..retrieval import search_chunks
+from ..query_cache import embed_queries
+from ..embedder_registry import get_embedder
+from ..chunking import sentence_lengths
 
 
 logger = get_logger(__name__)
 
+
+def section_contexts(cr_plan: Dict, generated_plan: Dict) -> Dict[str, str]:
+    """
+    Evidence for every section of `generated_plan`, retrieved with the section name and summary
+    as query. All summaries are embedded in one batch and searched in one multi-vector call.
+    Each section keeps its best hits, in rank order, up to `section_context_tokens` embedder
+    tokens; a section without hits gets an empty context.
+    """
+    embedding_model = "stella_15"
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    sections = list(generated_plan)
+    queries = [f"{section}\n{desc if isinstance(desc, str) else json.dumps(desc)}"
+               for section, desc in generated_plan.items()]
+
+    query_embeddings = embed_queries(embedding_model, queries, device)
+
+    results = search_chunks(embedding_model, query_embeddings, limit=settings.report_generation.section_k,
+                            filter=cr_plan.get("filter"),
+                            mode=cr_plan.get("retrieval_mode"),
+                            candidate_multiplier=cr_plan.get("candidate_multiplier"),
+                            query_texts=queries,
+                            owners=cr_plan.get("owners"))
+
+    tokenizer = get_embedder(embedding_model, device).tokenizer
+    budget = settings.report_generation.section_context_tokens
+
+    contexts = {}
+
+    for section, hits in zip(sections, results):
+        texts = [hit["entity"]["text_chunk"] for hit in hits]
+        lengths = sentence_lengths(tokenizer(texts, add_special_tokens=False, return_length=True)) if texts else []
+
+        relevant_ctx, n_tokens = [], 0
+
+        for text, length in zip(texts, lengths):
+            if n_tokens + length > budget:
+                break
+
+            relevant_ctx.append(f"{len(relevant_ctx) + 1}. " + text)
+            n_tokens += length
+
+        contexts[section] = ADDITIONAL_CONTEXT.format(context="\n\n".join(relevant_ctx)) if relevant_ctx else ""
+
+        logger.info(f"Retrieved {len(relevant_ctx)} of {len(hits)} hits ({n_tokens} tokens) for section: {section}")
+
+    return contexts
+
+
 @celery_app.task(ignore_result=False, track_started=True)
 def start_generating(cr_plan: Dict, user_instructions: str, generated_plan: Dict, context: str=None) -> Union[None, List]:
     logger.info("------------Executing Generation Process------------")
 
+    # the planning context was retrieved for the whole report, each section gets its own instead
+    try:
+        contexts = section_contexts(cr_plan, generated_plan)
+    except Exception as e:
+        logger.warning(f"Section retrieval failed, using the planning context for every section: {e}")
+        contexts = {section: context or "" for section in generated_plan}
+
     logger.info("------------Creating All required Agents------------")
 
     desc_agent = AgentBase(genai_model=cr_plan.get("genai_model"),
@@ -26,8 +91,8 @@ def start_generating(cr_plan: Dict, user_instructions: str, generated_plan: Dict
         logger.info(f"Processing section: {section}, Desc Type: {type(desc)}")
         desc_prompt = []
 
-        if context is not None and len(context) != 0:
-            desc_prompt = [context]
+        if contexts[section]:
+            desc_prompt = [contexts[section]]
 
         desc_prompt += [user_instructions,
                         ADD_SECTION_CONTEXT.format(section_name=section,
@@ -56,6 +121,9 @@ def start_generating(cr_plan: Dict, user_instructions: str, generated_plan: Dict
         agent_desc = ADD_SECTION_DESCRIPTION.format(section_name=agent_dict["section"],
                                                     section_desc=agent_dict["description"])
         agent_prompt = [user_instructions, agent_desc]
+
+        if contexts[agent_dict["section"]]:
+            agent_prompt = [contexts[agent_dict["section"]]] + agent_prompt
         agent_output = agent(agent_prompt)
 
         if not isinstance(agent_output, str):
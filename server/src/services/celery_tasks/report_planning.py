@@ -3,13 +3,13 @@ from typing import Dict, Union
 
 import torch
 
-from sentence_transformers import SentenceTransformer
-
-from ...core.dependencies import celery_app, milvus_client
+from ...core.dependencies import celery_app
 from ...core.utils import get_logger
 from ...core.config import settings, GAIEmbeddersCollections
 from ...agents import AgentBase
 from ...agents.prompts import *
+from ..retrieval import search_chunks
+from ..query_cache import embed_query
 
 
 logger = get_logger(__name__)
@@ -49,26 +49,17 @@ def start_planning(cr_plan: Dict, user_instructions: str, req_threshold: int) ->
     logger.info("------------Executing Planner Process------------")
 
     embedding_model = "stella_15"
-    emb_model = settings.embedders.model_fields[embedding_model].default
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    embedder = SentenceTransformer(emb_model,
-                                   trust_remote_code=True, 
-                                   device=device)
-
-    query_embedding = embedder.encode(user_instructions, device=device)
-
-    vector_col_name = GAIEmbeddersCollections.mapping()[embedding_model]
+    query_embedding = embed_query(embedding_model, user_instructions, device)
 
-    results = milvus_client.search(
-        collection_name=vector_col_name,
-        anns_field="vector_embs",
-        data=[query_embedding],
-        limit=3,
-        search_params={"metric_type": "L2"}, 
-        output_fields=["text_chunk"]
-    )
+    results = search_chunks(embedding_model, query_embedding, limit=3,
+                            filter=cr_plan.get("filter"),
+                            mode=cr_plan.get("retrieval_mode"),
+                            candidate_multiplier=cr_plan.get("candidate_multiplier"),
+                            query_texts=[user_instructions],
+                            owners=cr_plan.get("owners"))
     logger.info(results[0])
 
     context = ""
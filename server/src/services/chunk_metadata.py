@@ -0,0 +1,85 @@
+import re
+import json
+import datetime
+from typing import Dict, List, Optional
+
+
+# scalar fields stored with every chunk, the only fields a search filter may reference
+METADATA_FIELDS = ("doc_id", "page_start", "page_end", "company", "owner", "year")
+
+_YEAR_PATTERN = re.compile(r"(?<!\d)(19[89]\d|20\d\d)(?!\d)")
+
+_STRING_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_FILTER_KEYWORDS = {"and", "or", "not", "in", "like", "true", "false", "AND", "OR", "NOT", "IN", "LIKE"}
+_ALLOWED_CHARS = re.compile(r"^[\sA-Za-z0-9_.,()\[\]=!<>%+-]*$")
+
+
+def infer_year(doc_id: str) -> Optional[int]:
+    """
+    Reporting year from a file name such as `acme_sustainability_report_2023.pdf`. The latest
+    plausible year wins, as names like `2022-2023` refer to the later one.
+    """
+    max_year = datetime.date.today().year + 1
+    # only the file name, ids may start with a path or content hash whose digits are no year
+    file_name = (doc_id or "").replace("\\", "/").rsplit("/", 1)[-1]
+    years = [int(year) for year in _YEAR_PATTERN.findall(file_name) if int(year) <= max_year]
+
+    return max(years) if years else None
+
+
+def document_metadata(doc_id: str, company: str = None, owner: str = None, year: int = None) -> Dict:
+    # empty values instead of nulls, the scalar fields are not nullable
+    return {
+        "doc_id": doc_id,
+        "company": (company or "").strip(),
+        "owner": (owner or "").strip(),
+        "year": int(year or infer_year(doc_id) or 0),
+    }
+
+
+def validate_filter(expr: Optional[str]) -> Optional[str]:
+    """
+    Checks a Milvus boolean expression used to scope a search, e.g.
+    `company == "acme" and year >= 2022`. Only the chunk metadata fields may be referenced, so a
+    filter cannot select on the text or vectors. Raises `ValueError` for anything else.
+    """
+    if expr is None or not expr.strip():
+        return None
+
+    unquoted = _STRING_LITERAL.sub('""', expr)
+
+    if not _ALLOWED_CHARS.match(unquoted.replace('""', "")):
+        raise ValueError(f"Invalid characters in filter expression: {expr}")
+
+    for identifier in _IDENTIFIER.findall(unquoted.replace('""', "")):
+        if identifier not in METADATA_FIELDS and identifier not in _FILTER_KEYWORDS:
+            raise ValueError(f"Unknown field {identifier} in filter expression, expected one of {METADATA_FIELDS}")
+
+    return expr.strip()
+
+
+def validate_owners(owners) -> Optional[List[str]]:
+    # a single owner may be given as a plain string
+    if owners is None:
+        return None
+    if isinstance(owners, str):
+        owners = [owners]
+    if not isinstance(owners, list) or not all(isinstance(owner, str) for owner in owners):
+        raise ValueError(f"Owners should be a list of strings, got {owners}")
+
+    return owners
+
+
+def scope_filter(expr: Optional[str], owners: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Restricts a validated filter to the chunks of `owners`. Where `owner` is the partition key of
+    a chunk collection, Milvus then only searches the partitions of those owners. The owners
+    come from the request, so this scopes a search, it does not keep owners' documents apart.
+    """
+    if not owners:
+        return expr
+
+    scope = f"owner in {json.dumps(sorted({(owner or '').strip() for owner in owners}))}"
+
+    return f"{scope} and ({expr})" if expr else scope
@@ -0,0 +1,228 @@
+import hashlib
+from typing import List, Tuple
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def sentence_lengths(inputs) -> np.ndarray:
+    # tokenizers called with `return_length=True` already carry the lengths
+    if "length" in inputs:
+        return np.asarray(inputs["length"], dtype=np.int64)
+    return np.fromiter((len(ids) for ids in inputs["input_ids"]), dtype=np.int64)
+
+
+def _count_at_most(prefix: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    For every v in `values`, the number of entries of the non-decreasing array `prefix` that are
+    <= v. One vectorised binary search per value, O(n log n) in the number of sentences and
+    independent of their token counts.
+    """
+    return np.searchsorted(prefix, values, side="right")
+
+
+def _walk(lengths: np.ndarray,
+          chunk_size_approx: int,
+          overlap_tokens: int,
+          start_idx: int = 0,
+          visited: bytearray = None,
+          final: bool = True) -> Tuple[List[Tuple[int, int]], int]:
+    n_sents = len(lengths)
+
+    if n_sents == 0:
+        return [], start_idx
+
+    prefix = np.zeros(n_sents + 1, dtype=np.int64)
+    np.cumsum(lengths, out=prefix[1:])
+
+    # chunk_end[s]: first e >= s with sum(lengths[s..e]) > chunk_size_approx, capped at the last sentence
+    chunk_end = np.minimum(_count_at_most(prefix, prefix[:-1] + chunk_size_approx) - 1, n_sents - 1)
+
+    # overlap_start[e]: last t < e with sum(lengths[t..e-1]) > overlap_tokens, or 0 if there is none
+    overlap_start = np.maximum(_count_at_most(prefix, prefix[:-1] - overlap_tokens - 1) - 1, 0)
+
+    # tokens from s to the end of the input, a chunk starting at s is only final once this exceeds the chunk size
+    tokens_left = (prefix[-1] - prefix[:-1]).tolist()
+
+    chunk_end = chunk_end.tolist()
+    overlap_start = overlap_start.tolist()
+    is_long = (lengths >= chunk_size_approx).tolist()
+
+    visited = visited if visited is not None else bytearray(n_sents)
+    spans = []
+
+    while start_idx < n_sents:
+        if not final and tokens_left[start_idx] <= chunk_size_approx:
+            break
+
+        end_idx = chunk_end[start_idx]
+
+        if visited[start_idx]:
+            start_idx = end_idx + 1
+            continue
+
+        visited[start_idx] = 1
+        spans.append((start_idx, end_idx))
+
+        if final and end_idx + 1 >= n_sents:
+            start_idx = n_sents
+            break
+
+        if is_long[end_idx]:
+            start_idx = end_idx + 1
+        else:
+            start_idx = overlap_start[end_idx]
+
+        # only more input can tell whether this chunk was the last one
+        if end_idx + 1 >= n_sents:
+            break
+
+    return spans, start_idx
+
+
+def chunk_spans(lengths, chunk_size_approx: int = 256, overlap_tokens: int = 20) -> List[Tuple[int, int]]:
+    """
+    Splits a run of sentences with the given token lengths into chunks, returned as inclusive
+    (first sentence, last sentence) index pairs.
+
+    The semantics match the original `compute_chunks` walk: a chunk keeps taking sentences until
+    its token count goes over `chunk_size_approx`, and the next chunk starts far enough back to
+    repeat more than `overlap_tokens` tokens, unless the last sentence alone reached the chunk
+    size. A chunk whose start was already used is dropped and the walk moves past its end.
+
+    Both lookups are binary searches over the cumulative token lengths, and every start is taken
+    at most once, so the whole walk is O(n log n) in the number of sentences.
+    """
+    spans, _ = _walk(np.asarray(lengths, dtype=np.int64), chunk_size_approx, overlap_tokens)
+
+    return spans
+
+
+@dataclass
+class Chunk:
+    sentences: List[str]
+    first_page: int = None
+    last_page: int = None
+    n_tokens: int = None
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.sentences)
+
+    @property
+    def chunk_hash(self) -> str:
+        # the page span is part of a chunk's identity, unchanged text that moved to other pages
+        # is written again rather than reused with the citation of its old pages
+        digest = hashlib.sha1(self.text.encode("utf-8"))
+        digest.update(f"\x00{self.first_page}:{self.last_page}".encode("utf-8"))
+
+        return digest.hexdigest()
+
+
+class StreamingChunker:
+    """
+    Incremental form of `chunk_spans` for sentences that arrive a page at a time.
+
+    Chunks are emitted as soon as the sentences after them make their boundaries final, and
+    everything before the current walk position, apart from a short lookback for the overlap,
+    is dropped. Memory therefore depends on the chunk size rather than on the document length.
+    """
+
+    def __init__(self, chunk_size_approx: int = 256, overlap_tokens: int = 20, block_tokens: int = None):
+        # with an overlap as long as the chunk the walk can step back without bound, so nothing could be dropped
+        if overlap_tokens >= chunk_size_approx:
+            raise ValueError(f"overlap_tokens ({overlap_tokens}) must be smaller than chunk_size_approx "
+                             f"({chunk_size_approx}) when chunking a stream")
+
+        self.chunk_size_approx = chunk_size_approx
+        self.overlap_tokens = overlap_tokens
+
+        # the walk runs once this many tokens are buffered, which amortises the table building
+        self.block_tokens = block_tokens or 8 * (chunk_size_approx + overlap_tokens)
+
+        self._sentences: List[str] = []
+        self._lengths: List[int] = []
+        self._pages: List[int] = []
+        self._visited = bytearray()
+
+        self._next_start = 0
+        self._last_end = -1
+        self._pending_tokens = 0
+
+    def add(self, sentences: List[str], lengths: List[int], pages: List[int] = None) -> List[Chunk]:
+        self._sentences.extend(sentences)
+        self._lengths.extend(int(length) for length in lengths)
+        self._pages.extend(pages if pages is not None else [None] * len(sentences))
+        self._visited.extend(bytes(len(sentences)))
+
+        self._pending_tokens += sum(int(length) for length in lengths)
+
+        if self._pending_tokens < self.block_tokens:
+            return []
+
+        return self._run(final=False)
+
+    def finish(self) -> List[Chunk]:
+        # a chunk that already reached the last sentence ends the walk, as it does for a whole document
+        if self._last_end == len(self._lengths) - 1:
+            chunks = []
+        else:
+            chunks = self._run(final=True)
+
+        self._sentences, self._lengths, self._pages = [], [], []
+        self._visited = bytearray()
+        self._next_start = 0
+        self._last_end = -1
+        self._pending_tokens = 0
+
+        return chunks
+
+    def _run(self, final: bool) -> List[Chunk]:
+        lengths = np.asarray(self._lengths, dtype=np.int64)
+
+        spans, self._next_start = _walk(lengths,
+                                        self.chunk_size_approx,
+                                        self.overlap_tokens,
+                                        start_idx=self._next_start,
+                                        visited=self._visited,
+                                        final=final)
+
+        chunks = [Chunk(sentences=self._sentences[start:end + 1],
+                        first_page=self._pages[start],
+                        last_page=self._pages[end],
+                        n_tokens=sum(self._lengths[start:end + 1])) for start, end in spans]
+
+        if spans:
+            self._last_end = spans[-1][1]
+
+        if not final:
+            self._trim()
+
+        return chunks
+
+    def _trim(self) -> None:
+        # keep enough sentences before the walk position for any later overlap to reach back into: a chunk
+        # that steps back starts at most an overlap before the end of a chunk no longer than chunk_size_approx
+        lookback_tokens = self.chunk_size_approx + self.overlap_tokens
+
+        keep_from = self._next_start
+        lookback = 0
+
+        while keep_from > 0 and lookback <= lookback_tokens:
+            keep_from -= 1
+            lookback += self._lengths[keep_from]
+
+        del self._sentences[:keep_from]
+        del self._lengths[:keep_from]
+        del self._pages[:keep_from]
+        del self._visited[:keep_from]
+
+        self._next_start -= keep_from
+        self._last_end -= keep_from
+        self._pending_tokens = sum(self._lengths[self._next_start:])
+
+
+def compute_chunks(inputs, text_sents, chunk_size_approx=256, overlap_tokens=20):
+    spans = chunk_spans(sentence_lengths(inputs), chunk_size_approx, overlap_tokens)
+
+    return [text_sents[start:end + 1] for start, end in spans]
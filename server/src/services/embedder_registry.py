@@ -0,0 +1,126 @@
+import threading
+from typing import Dict, Tuple
+from collections import OrderedDict
+
+from sentence_transformers import SentenceTransformer
+
+from ..core.utils import get_logger, get_device, clear_torch_cache
+from ..core.config import settings
+
+
+logger = get_logger(__name__)
+
+
+def _model_nbytes(embedder: SentenceTransformer) -> int:
+    n_bytes = sum(p.numel() * p.element_size() for p in embedder.parameters())
+    n_bytes += sum(b.numel() * b.element_size() for b in embedder.buffers())
+    return n_bytes
+
+
+class EmbedderRegistry:
+    """
+    Keeps SentenceTransformer embedders warm for the lifetime of a process.
+
+    Models are keyed by (`Embedders` key, device) and evicted in least recently used order once
+    the summed parameter memory goes over `memory_budget_mb`. The most recently requested model
+    is never evicted, even if it alone is larger than the budget.
+    """
+
+    def __init__(self, memory_budget_mb: int = None):
+        self.memory_budget = (memory_budget_mb or settings.embedder_registry.memory_budget_mb) * 1024 * 1024
+
+        self._models: "OrderedDict[Tuple[str, str], Tuple[SentenceTransformer, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._devices: Dict[str, str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, embedding_model: str, device: str = None) -> SentenceTransformer:
+        key = (embedding_model.lower().strip(), self._resolve_device(device))
+
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # only one thread loads a given model, others wait for it instead of loading a copy
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key][0]
+
+                self.misses += 1
+
+            emb_model = settings.embedders.model_fields[key[0]].default
+
+            logger.info(f"Dowloading/Loading embedder {emb_model} on {key[1]}")
+            embedder = SentenceTransformer(emb_model,
+                                           trust_remote_code=True,
+                                           device=key[1])
+
+            with self._lock:
+                self._models[key] = (embedder, _model_nbytes(embedder))
+                self._evict()
+
+        return embedder
+
+    def _resolve_device(self, device: str) -> str:
+        if device not in self._devices:
+            self._devices[device] = get_device(device)
+        return self._devices[device]
+
+    def _evict(self) -> None:
+        evicted = False
+
+        while len(self._models) > 1 and self._memory_used() > self.memory_budget:
+            (name, device), _ = self._models.popitem(last=False)
+            self.evictions += 1
+            evicted = True
+            logger.info(f"Evicted embedder {name} on {device} from the registry")
+
+        if evicted:
+            clear_torch_cache()
+
+    def _memory_used(self) -> int:
+        return sum(n_bytes for _, n_bytes in self._models.values())
+
+    def preload(self, embedding_models: list = None, device: str = None) -> None:
+        embedding_models = settings.embedder_registry.preload_models if embedding_models is None else embedding_models
+        device = device or settings.embedder_registry.preload_device
+
+        for embedding_model in embedding_models:
+            try:
+                self.get(embedding_model, device)
+            except Exception as e:
+                logger.error(f"Failed to preload embedder {embedding_model}: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+        clear_torch_cache()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_used_mb": round(self._memory_used() / (1024 * 1024), 1),
+                "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 1),
+                "models": [{"model": name, "device": device} for name, device in self._models.keys()]
+            }
+
+
+embedder_registry = EmbedderRegistry()
+
+
+def get_embedder(embedding_model: str, device: str = None) -> SentenceTransformer:
+    return embedder_registry.get(embedding_model, device)
@@ -0,0 +1,198 @@
+import time
+import queue
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import Future
+
+import numpy as np
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from .embedder_registry import get_embedder
+from .batching import encode_length_sorted
+
+
+logger = get_logger(__name__)
+
+
+class EngineOverloaded(RuntimeError):
+    pass
+
+
+@dataclass
+class _EncodeRequest:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class _ModelWorker:
+    """
+    One thread serving one (`Embedders` key, device). It takes the oldest request, waits at most
+    `max_wait_ms` for more to arrive, then encodes everything gathered, up to `max_batch_texts`
+    texts, in a single `encode_length_sorted` call and hands each request its own rows back.
+    """
+
+    def __init__(self, embedding_model: str, device: str, max_batch_texts: int, max_wait_ms: float, max_queue_size: int):
+        self.embedding_model = embedding_model
+        self.device = device
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait_ms / 1000
+
+        self.requests: "queue.Queue[_EncodeRequest]" = queue.Queue(maxsize=max_queue_size)
+
+        self.batches = 0
+        self.n_requests = 0
+        self.n_texts = 0
+        self.max_batch_seen = 0
+        self.wait_sec = 0.0
+        self.encode_sec = 0.0
+
+        self._thread = threading.Thread(target=self._run,
+                                         name=f"embedding-engine-{embedding_model}-{device}",
+                                         daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        request = _EncodeRequest(list(texts))
+
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            raise EngineOverloaded(f"Embedding queue of {self.embedding_model} on {self.device} is full")
+
+        return request.future
+
+    def _gather(self) -> List[_EncodeRequest]:
+        batch = [self.requests.get()]
+        n_texts = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+
+        while n_texts < self.max_batch_texts:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            batch.append(request)
+            n_texts += len(request.texts)
+
+        # requests whose caller gave up are dropped rather than encoded
+        return [request for request in batch if request.future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._gather()
+
+            if not batch:
+                continue
+
+            texts = [text for request in batch for text in request.texts]
+            start = time.monotonic()
+
+            try:
+                embedder = get_embedder(self.embedding_model, self.device)
+                embeddings = encode_length_sorted(embedder, texts, device=self.device)
+            except Exception as e:
+                logger.error(f"Encoding a batch of {len(texts)} texts with {self.embedding_model} failed: {e}")
+
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            finished = time.monotonic()
+            offset = 0
+
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+            self.batches += 1
+            self.n_requests += len(batch)
+            self.n_texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+            self.wait_sec += sum(start - request.enqueued_at for request in batch)
+            self.encode_sec += finished - start
+
+    def stats(self) -> Dict:
+        batches = max(self.batches, 1)
+        n_requests = max(self.n_requests, 1)
+
+        return {
+            "model": self.embedding_model,
+            "device": self.device,
+            "queue_depth": self.requests.qsize(),
+            "batches": self.batches,
+            "requests": self.n_requests,
+            "texts": self.n_texts,
+            "mean_batch_texts": round(self.n_texts / batches, 2),
+            "mean_batch_requests": round(self.n_requests / batches, 2),
+            "max_batch_texts": self.max_batch_seen,
+            "mean_queue_wait_ms": round(1000 * self.wait_sec / n_requests, 2),
+            "mean_encode_ms": round(1000 * self.encode_sec / batches, 2),
+        }
+
+
+class EmbeddingEngine:
+    """
+    Serves `encode` calls of concurrent requests from warm embedders, gathering them into
+    micro-batches per (`Embedders` key, device). A request waits at most `max_wait_ms` for
+    others to join its batch, so a lone request pays little extra latency while concurrent ones
+    share forward passes instead of queueing behind each other.
+
+    A worker thread is started on the first request for a model, the model itself comes from
+    the `EmbedderRegistry`, so eviction and preloading still apply.
+    """
+
+    def __init__(self, max_batch_texts: int = None, max_wait_ms: float = None, max_queue_size: int = None):
+        self.max_batch_texts = max_batch_texts or settings.embedding_engine.max_batch_texts
+        self.max_wait_ms = settings.embedding_engine.max_wait_ms if max_wait_ms is None else max_wait_ms
+        self.max_queue_size = max_queue_size or settings.embedding_engine.max_queue_size
+
+        self._workers: Dict[Tuple[str, str], _ModelWorker] = {}
+        self._lock = threading.Lock()
+
+    def _worker(self, embedding_model: str, device: str = None) -> _ModelWorker:
+        key = (embedding_model.lower().strip(), device or "cpu")
+
+        with self._lock:
+            if key not in self._workers:
+                self._workers[key] = _ModelWorker(*key,
+                                                  max_batch_texts=self.max_batch_texts,
+                                                  max_wait_ms=self.max_wait_ms,
+                                                  max_queue_size=self.max_queue_size)
+            return self._workers[key]
+
+    def submit(self, embedding_model: str, texts: List[str], device: str = None) -> Future:
+        return self._worker(embedding_model, device).submit(texts)
+
+    def encode(self, embedding_model: str, texts: List[str], device: str = None) -> np.ndarray:
+        return self.submit(embedding_model, texts, device).result()
+
+    async def aencode(self, embedding_model: str, texts: List[str], device: str = None) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(embedding_model, texts, device))
+
+    def start(self, embedding_models: List[str], device: str = None) -> None:
+        for embedding_model in embedding_models:
+            self._worker(embedding_model, device)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            workers = list(self._workers.values())
+
+        return {
+            "max_batch_texts": self.max_batch_texts,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": sum(worker.requests.qsize() for worker in workers),
+            "workers": [worker.stats() for worker in workers],
+        }
+
+
+embedding_engine = EmbeddingEngine()
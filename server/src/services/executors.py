@@ -0,0 +1,82 @@
+import time
+import asyncio
+import threading
+from typing import Callable, Dict
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ..core.config import settings
+
+
+class BoundedExecutor:
+    """
+    A named thread pool for blocking calls made from async handlers. At most `max_workers`
+    calls of the pool run at once, the rest wait in its queue, so a burst of slow calls, e.g. LLM
+    requests, only ever holds its own pool's threads and never the event loop or another pool.
+    The time calls spend queued is kept for the most recent `window` calls.
+    """
+
+    def __init__(self, name: str, max_workers: int, window: int = 1024):
+        self.name = name
+        self.max_workers = max_workers
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-executor")
+        self._lock = threading.Lock()
+        self._queue_waits = deque(maxlen=window)
+
+        self.submitted = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _call(self, fn: Callable, enqueued_at: float):
+        with self._lock:
+            self._queue_waits.append(time.monotonic() - enqueued_at)
+            self.running += 1
+
+        try:
+            return fn()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            self.submitted += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._call, partial(fn, *args, **kwargs), time.monotonic())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = np.asarray(self._queue_waits) * 1000
+            running = self.running
+
+            return {
+                "max_workers": self.max_workers,
+                "running": running,
+                "queued": self.submitted - self.completed - running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queue_wait_p50_ms": round(float(np.percentile(waits, 50)), 2) if len(waits) else None,
+                "queue_wait_p99_ms": round(float(np.percentile(waits, 99)), 2) if len(waits) else None,
+            }
+
+
+# Milvus searches and Redis cache lookups, short calls on the hot path of every query
+retrieval_executor = BoundedExecutor("retrieval", settings.executors.retrieval_workers)
+# chat completions of the agents, which take seconds each
+genai_executor = BoundedExecutor("genai", settings.executors.genai_workers)
+
+
+def executor_stats() -> Dict:
+    return {executor.name: executor.stats() for executor in (retrieval_executor, genai_executor)}
@@ -0,0 +1,201 @@
+import re
+import json
+from typing import Callable, List
+from functools import lru_cache
+
+import numpy as np
+
+
+# `column(name)` returns the values of one field for every row, the compiled filter a boolean mask
+Columns = Callable[[str], np.ndarray]
+Predicate = Callable[[Columns], np.ndarray]
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<op>==|!=|<=|>=|<|>)
+      | (?P<punct>[()\[\],])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_COMPARISONS = {
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+_FLIPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+def _tokenize(expr: str) -> List[tuple]:
+    tokens, pos = [], 0
+
+    while pos < len(expr):
+        if expr[pos:].strip() == "":
+            break
+
+        match = _TOKEN.match(expr, pos)
+
+        if match is None:
+            raise ValueError(f"Cannot parse filter expression at: {expr[pos:]}")
+
+        kind = match.lastgroup
+        value = match.group(kind)
+
+        if kind == "word" and value.lower() in ("and", "or", "not", "in", "like", "true", "false"):
+            kind, value = "keyword", value.lower()
+
+        tokens.append((kind, value))
+        pos = match.end()
+
+    return tokens
+
+
+def _literal(kind: str, value: str):
+    if kind == "string":
+        # double-quoted literals are what `json.dumps` writes for the filters built in this package
+        return json.loads(value) if value[0] == '"' else value[1:-1].replace("\\'", "'")
+    if kind == "number":
+        return float(value) if "." in value else int(value)
+    if kind == "keyword" and value in ("true", "false"):
+        return value == "true"
+
+    raise ValueError(f"Expected a literal in filter expression, got {value}")
+
+
+def _like(pattern: str) -> Callable:
+    regex = re.compile("^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$", re.DOTALL)
+    return np.vectorize(lambda value: bool(regex.match(str(value))), otypes=[bool])
+
+
+class _Parser:
+    """
+    Recursive descent over the Milvus expressions this package writes or lets users write:
+    comparisons, `in`/`not in` lists and `like` patterns on single fields, combined with
+    `and`, `or`, `not` and parentheses.
+    """
+
+    def __init__(self, expr: str):
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+
+    def peek(self, offset: int = 0):
+        idx = self.pos + offset
+        return self.tokens[idx] if idx < len(self.tokens) else (None, None)
+
+    def take(self, kind: str = None, value: str = None):
+        token = self.peek()
+
+        if (kind and token[0] != kind) or (value and token[1] != value):
+            raise ValueError(f"Expected {value or kind} in filter expression, got {token[1]}")
+
+        self.pos += 1
+        return token
+
+    def parse(self) -> Predicate:
+        predicate = self.disjunction()
+
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()[1]} in filter expression")
+
+        return predicate
+
+    def disjunction(self) -> Predicate:
+        terms = [self.conjunction()]
+
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            terms.append(self.conjunction())
+
+        return terms[0] if len(terms) == 1 else lambda columns: np.logical_or.reduce([term(columns) for term in terms])
+
+    def conjunction(self) -> Predicate:
+        terms = [self.negation()]
+
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            terms.append(self.negation())
+
+        return terms[0] if len(terms) == 1 else lambda columns: np.logical_and.reduce([term(columns) for term in terms])
+
+    def negation(self) -> Predicate:
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            term = self.negation()
+            return lambda columns: ~term(columns)
+
+        if self.peek() == ("punct", "("):
+            self.take()
+            term = self.disjunction()
+            self.take("punct", ")")
+            return term
+
+        return self.comparison()
+
+    def values(self) -> list:
+        self.take("punct", "[")
+        values = []
+
+        while self.peek() != ("punct", "]"):
+            values.append(_literal(*self.take()))
+
+            if self.peek() == ("punct", ","):
+                self.take()
+
+        self.take("punct", "]")
+        return values
+
+    def comparison(self) -> Predicate:
+        kind, value = self.peek()
+
+        # `2022 <= year` is the same as `year >= 2022`
+        if kind != "word":
+            literal = _literal(*self.take())
+            op = self.take("op")[1]
+            field = self.take("word")[1]
+            return self._compare(field, _FLIPPED[op], literal)
+
+        field = self.take("word")[1]
+        kind, value = self.peek()
+
+        if kind == "op":
+            self.take()
+            return self._compare(field, value, _literal(*self.take()))
+
+        if (kind, value) == ("keyword", "not") and self.peek(1) == ("keyword", "in"):
+            self.take(), self.take()
+            values = self.values()
+            return lambda columns: ~np.isin(columns(field), values)
+
+        if (kind, value) == ("keyword", "in"):
+            self.take()
+            values = self.values()
+            return lambda columns: np.isin(columns(field), values)
+
+        if (kind, value) == ("keyword", "like"):
+            self.take()
+            match = _like(_literal(*self.take("string")))
+            return lambda columns: match(columns(field)) if len(columns(field)) else np.zeros(0, dtype=bool)
+
+        raise ValueError(f"Expected a comparison on {field} in filter expression")
+
+    @staticmethod
+    def _compare(field: str, op: str, literal) -> Predicate:
+        compare = _COMPARISONS[op]
+        return lambda columns: np.asarray(compare(columns(field), literal), dtype=bool)
+
+
+@lru_cache(maxsize=256)
+def compile_filter(expr: str) -> Predicate:
+    """
+    Compiles a Milvus boolean expression into a function from the columns of a set of rows to a
+    mask over them, e.g. `compile_filter('year >= 2022 and company in ["acme"]')`. Raises
+    `ValueError` for syntax it does not know.
+    """
+    if expr is None or not expr.strip():
+        return lambda columns: np.ones(len(columns("id")), dtype=bool)
+
+    return _Parser(expr).parse()
@@ -0,0 +1,187 @@
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional, Set
+
+from ..core.utils import get_logger
+from ..core.dependencies import get_redis_client
+
+
+logger = get_logger(__name__)
+
+
+class IngestionManifest:
+    """
+    Records which documents are already embedded, keyed by (file hash, document id, embedding
+    model, chunking parameters, metadata), so the same file uploaded for another owner, company
+    or year is ingested again with its own metadata. Entries live in a single Redis hash, so lookups are O(1) and
+    shared by every API server and Celery worker. Only the latest version of a document keeps its
+    entry, an older one is forgotten once it is replaced, so uploading it again re-ingests it.
+
+    If Redis is unreachable the manifest reports every document as not ingested, which falls
+    back to the previous always-embed behaviour instead of failing the ingestion.
+    """
+
+    MANIFEST_KEY = "smarag:ingestion_manifest"
+
+    def __init__(self, redis_client=None):
+        self._redis_client = redis_client
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    @staticmethod
+    def entry_key(file_hash: str, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int,
+                  metadata: Dict = None) -> str:
+        fingerprint = hashlib.md5(json.dumps(metadata or {}, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        return f"{file_hash}:{embedding_model}:{chunk_size}:{overlap_tokens}:{fingerprint}:{doc_id}"
+
+    def get(self, file_hash: str, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int,
+            metadata: Dict = None) -> Optional[Dict]:
+        key = self.entry_key(file_hash, doc_id, embedding_model, chunk_size, overlap_tokens, metadata)
+
+        try:
+            entry = self.redis_client.hget(self.MANIFEST_KEY, key)
+        except Exception as e:
+            logger.warning(f"Ingestion manifest lookup failed, treating {key} as not ingested: {e}")
+            return None
+
+        return json.loads(entry) if entry else None
+
+    def is_ingested(self, file_hash: str, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int,
+                    metadata: Dict = None) -> bool:
+        return self.get(file_hash, doc_id, embedding_model, chunk_size, overlap_tokens, metadata) is not None
+
+    def mark_ingested(self,
+                      file_hash: str,
+                      doc_id: str,
+                      embedding_model: str,
+                      chunk_size: int,
+                      overlap_tokens: int,
+                      metadata: Dict = None,
+                      **details) -> None:
+        key = self.entry_key(file_hash, doc_id, embedding_model, chunk_size, overlap_tokens, metadata)
+        entry = {"ingested_at": time.time(), **details}
+
+        try:
+            self.redis_client.hset(self.MANIFEST_KEY, key, json.dumps(entry))
+        except Exception as e:
+            logger.warning(f"Failed to record {key} in the ingestion manifest: {e}")
+
+    def forget(self, file_hash: str, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int,
+               metadata: Dict = None) -> None:
+        key = self.entry_key(file_hash, doc_id, embedding_model, chunk_size, overlap_tokens, metadata)
+
+        try:
+            self.redis_client.hdel(self.MANIFEST_KEY, key)
+        except Exception as e:
+            logger.warning(f"Failed to remove {key} from the ingestion manifest: {e}")
+
+
+class DocumentVersions:
+    """
+    Remembers what is stored for the latest version of each document, keyed by (document id,
+    embedding model, chunking parameters): the set of chunk hashes in the vector collection and a
+    fingerprint per page. When an edited file is uploaded under the same id, only chunks missing
+    from the set are embedded and only the chunks that disappeared are deleted.
+
+    Like the manifest, a Redis failure reads as "nothing stored", which means a full re-embed.
+    """
+
+    KEY_PREFIX = "smarag:doc_versions"
+
+    def __init__(self, redis_client=None):
+        self._redis_client = redis_client
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    @classmethod
+    def entry_key(cls, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int) -> str:
+        return f"{cls.KEY_PREFIX}:{embedding_model}:{chunk_size}:{overlap_tokens}:{doc_id}"
+
+    def chunk_hashes(self, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int) -> Set[str]:
+        key = self.entry_key(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        try:
+            return {chunk_hash.decode() for chunk_hash in self.redis_client.smembers(f"{key}:chunks")}
+        except Exception as e:
+            logger.warning(f"Document version lookup failed, re-embedding {doc_id} in full: {e}")
+            return set()
+
+    def page_hashes(self, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int) -> List[str]:
+        key = self.entry_key(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        try:
+            page_hashes = self.redis_client.get(f"{key}:pages")
+        except Exception as e:
+            logger.warning(f"Document version lookup failed for {doc_id}: {e}")
+            return []
+
+        return json.loads(page_hashes) if page_hashes else []
+
+    def file_hash(self, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int) -> Optional[str]:
+        key = self.entry_key(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        try:
+            file_hash = self.redis_client.get(f"{key}:file")
+        except Exception as e:
+            logger.warning(f"Document version lookup failed for {doc_id}: {e}")
+            return None
+
+        return file_hash.decode() if file_hash else None
+
+    def metadata(self, doc_id: str, embedding_model: str, chunk_size: int, overlap_tokens: int) -> Optional[Dict]:
+        key = self.entry_key(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        try:
+            metadata = self.redis_client.get(f"{key}:metadata")
+        except Exception as e:
+            logger.warning(f"Document version lookup failed for {doc_id}: {e}")
+            return None
+
+        return json.loads(metadata) if metadata else None
+
+    def save(self,
+             doc_id: str,
+             embedding_model: str,
+             chunk_size: int,
+             overlap_tokens: int,
+             chunk_hashes: List[str],
+             page_hashes: List[str],
+             file_hash: str = None,
+             metadata: Dict = None) -> None:
+        key = self.entry_key(doc_id, embedding_model, chunk_size, overlap_tokens)
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(f"{key}:chunks")
+            if chunk_hashes:
+                pipe.sadd(f"{key}:chunks", *chunk_hashes)
+            pipe.set(f"{key}:pages", json.dumps(page_hashes or []))
+            if file_hash:
+                pipe.set(f"{key}:file", file_hash)
+            if metadata is not None:
+                pipe.set(f"{key}:metadata", json.dumps(metadata))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record the stored version of {doc_id}: {e}")
+
+
+def changed_pages(old_page_hashes: List[str], new_page_hashes: List[str]) -> List[int]:
+    n_pages = max(len(old_page_hashes), len(new_page_hashes))
+
+    return [page_no for page_no in range(n_pages)
+            if page_no >= len(old_page_hashes)
+            or page_no >= len(new_page_hashes)
+            or old_page_hashes[page_no] != new_page_hashes[page_no]]
+
+
+ingestion_manifest = IngestionManifest()
+document_versions = DocumentVersions()
@@ -0,0 +1,412 @@
+import time
+import queue
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+import numpy as np
+
+from nltk import sent_tokenize
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from .chunking import Chunk, StreamingChunker
+from .batching import encode_length_sorted
+from .pdf_extraction import iter_pages
+
+
+logger = get_logger(__name__)
+
+# a sentence without any boundary is cut here so that one unpunctuated document cannot grow without limit
+MAX_CARRY_CHARS = 20000
+
+_DONE = object()
+
+
+class _StageFailure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+@dataclass
+class DocumentEnd:
+    doc_path: str
+    n_chunks: int = 0
+    n_skipped: int = 0
+    chunk_hashes: List[str] = field(default=None)
+    page_hashes: List[str] = field(default=None)
+
+
+class StageStats:
+    """
+    Seconds each `bounded_stage` spent working (`busy_sec`, which includes waiting on the stage
+    before it), blocked on a full output queue (`stalled_sec`, the next stage is slower) and
+    leaving its consumer waiting on an empty queue (`starved_sec`, this stage or one before it is
+    slower). The slowest stage is the last one whose consumer starves while it never stalls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def add(self, stage: str, counter: str, seconds: float) -> None:
+        with self._lock:
+            counters = self._stages.setdefault(stage, {"busy_sec": 0.0, "stalled_sec": 0.0, "starved_sec": 0.0})
+            counters[counter] += seconds
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: {counter: round(seconds, 3) for counter, seconds in counters.items()}
+                    for stage, counters in self._stages.items()}
+
+
+@dataclass
+class EncodedBatch:
+    doc_paths: List[str]
+    chunks: List[Chunk]
+    embeddings: np.ndarray
+
+    @property
+    def texts(self) -> List[str]:
+        return [chunk.text for chunk in self.chunks]
+
+
+def bounded_stage(items: Iterable,
+                  maxsize: int = None,
+                  name: str = "ingestion-stage",
+                  stats: StageStats = None) -> Iterator:
+    """
+    Runs the iterable `items` on its own thread and hands its results over through a queue holding
+    at most `maxsize` items, so a fast stage blocks instead of buffering a whole document. Errors
+    are re-raised in the consumer, and the producer stops once the consumer goes away. Time spent
+    on either side of the queue is recorded under `name` in `stats`.
+    """
+    buffer = queue.Queue(maxsize=maxsize or settings.ingestion.stage_queue_size)
+    stop = threading.Event()
+    stats = stats or StageStats()
+
+    def _put(item) -> bool:
+        started = time.perf_counter()
+
+        try:
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stats.add(name, "stalled_sec", time.perf_counter() - started)
+
+    def _produce():
+        try:
+            iterator = iter(items)
+
+            while True:
+                started = time.perf_counter()
+                item = next(iterator, _DONE)
+                stats.add(name, "busy_sec", time.perf_counter() - started)
+
+                if item is _DONE:
+                    break
+                if not _put(item):
+                    return
+            _put(_DONE)
+        except BaseException as e:
+            _put(_StageFailure(e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=_produce, name=name, daemon=True).start()
+
+    try:
+        while True:
+            started = time.perf_counter()
+            item = buffer.get()
+            stats.add(name, "starved_sec", time.perf_counter() - started)
+
+            if item is _DONE:
+                return
+            if isinstance(item, _StageFailure):
+                raise item.exc
+
+            yield item
+    finally:
+        stop.set()
+
+
+def split_sentences(pages: Iterable[Tuple[str, int, str]]) -> Iterator:
+    """
+    Sentence-splits a page stream into `(doc_path, sentence, page_no)`, followed by a
+    `DocumentEnd` per document. The last sentence of a page is carried over to the next page, so
+    sentences running across a page break come out whole, attributed to the page they start on.
+    """
+    doc_path = None
+    carry, carry_page = None, None
+
+    for page_doc_path, page_no, page_text in pages:
+        if page_doc_path != doc_path:
+            if doc_path is not None:
+                if carry:
+                    yield doc_path, carry, carry_page
+                yield DocumentEnd(doc_path)
+
+            doc_path = page_doc_path
+            carry, carry_page = None, None
+
+        text = page_text.strip()
+
+        if carry is not None:
+            text = (carry + " " + text).strip()
+
+        sentences = sent_tokenize(text) if text else []
+
+        if not sentences:
+            continue
+
+        first_page = carry_page if carry is not None else page_no
+
+        for idx, sentence in enumerate(sentences[:-1]):
+            yield doc_path, sentence, first_page if idx == 0 else page_no
+
+        carry = sentences[-1]
+        carry_page = first_page if len(sentences) == 1 else page_no
+
+        if len(carry) > MAX_CARRY_CHARS:
+            yield doc_path, carry, carry_page
+            carry, carry_page = None, None
+
+    if doc_path is not None:
+        if carry:
+            yield doc_path, carry, carry_page
+        yield DocumentEnd(doc_path)
+
+
+def iter_sentences(doc_paths: List[str],
+                   sentence_cache=None,
+                   doc_hashes: Dict[str, str] = None,
+                   stage_stats: StageStats = None) -> Iterator:
+    """
+    `split_sentences` stream for `doc_paths`. With a `SentenceCache`, documents already split by
+    an earlier model are read back from it and only the rest are extracted, writing through to
+    the cache.
+    """
+    if sentence_cache is None:
+        pages = bounded_stage(iter_pages(doc_paths), settings.ingestion.stage_queue_size,
+                              name="ingestion-pages", stats=stage_stats)
+        yield from split_sentences(pages)
+        return
+
+    uncached = []
+
+    for doc_path in doc_paths:
+        if sentence_cache.has(doc_hashes[doc_path]):
+            yield from sentence_cache.read(doc_path, doc_hashes[doc_path])
+        else:
+            uncached.append(doc_path)
+
+    if uncached:
+        pages = bounded_stage(iter_pages(uncached), settings.ingestion.stage_queue_size,
+                              name="ingestion-pages", stats=stage_stats)
+        yield from sentence_cache.write_through(split_sentences(pages), doc_hashes)
+
+
+def tokenize_sentences(sentences: Iterable, tokenizer, batch_size: int = None) -> Iterator:
+    """
+    Tokenizes sentences in batches and yields lists of `(doc_path, sentence, n_tokens, page_no)`.
+    A batch never spans two documents.
+    """
+    batch_size = batch_size or settings.ingestion.tokenize_batch_size
+    batch = []
+
+    def _flush():
+        inputs = tokenizer([sentence for _, sentence, _ in batch], **settings.embedders.default_emb_params)
+
+        if "length" in inputs:
+            lengths = inputs["length"]
+        else:
+            lengths = [len(ids) for ids in inputs["input_ids"]]
+
+        return [(doc_path, sentence, int(n_tokens), page_no)
+                for (doc_path, sentence, page_no), n_tokens in zip(batch, lengths)]
+
+    for item in sentences:
+        if isinstance(item, DocumentEnd):
+            if batch:
+                yield _flush()
+                batch = []
+            yield item
+            continue
+
+        batch.append(item)
+
+        if len(batch) >= batch_size:
+            yield _flush()
+            batch = []
+
+    if batch:
+        yield _flush()
+
+
+def chunk_sentences(token_batches: Iterable, chunk_size_approx: int, overlap_tokens: int) -> Iterator:
+    """
+    Streams `(doc_path, Chunk)` pairs and a `DocumentEnd` per document carrying its chunk count
+    and a fingerprint of every page, built from the sentences each page contributed.
+    """
+    chunker = StreamingChunker(chunk_size_approx, overlap_tokens)
+    n_chunks = 0
+    page_digests = {}
+
+    for item in token_batches:
+        if isinstance(item, DocumentEnd):
+            for chunk in chunker.finish():
+                n_chunks += 1
+                yield item.doc_path, chunk
+
+            page_hashes = [page_digests[page_no].hexdigest() for page_no in sorted(page_digests)]
+
+            yield DocumentEnd(item.doc_path, n_chunks, page_hashes=page_hashes)
+            n_chunks = 0
+            page_digests = {}
+            continue
+
+        doc_path = item[0][0]
+
+        for _, sentence, _, page_no in item:
+            page_digests.setdefault(page_no, hashlib.sha1()).update(sentence.encode("utf-8"))
+
+        for chunk in chunker.add([sentence for _, sentence, _, _ in item],
+                                 [n_tokens for _, _, n_tokens, _ in item],
+                                 [page_no for _, _, _, page_no in item]):
+            n_chunks += 1
+            yield doc_path, chunk
+
+
+def skip_known_chunks(chunks: Iterable, known_chunks: Dict[str, Set[str]]) -> Iterator:
+    """
+    Drops chunks whose hash is already stored for their document, as well as repeats within the
+    document, so only new or edited text is encoded. The hash covers the page span, so a chunk
+    whose pages moved is encoded again and stored with its new span. The `DocumentEnd` of each document gets the
+    full list of its current chunk hashes, which tells the caller which stored chunks are stale.
+    """
+    seen = {}
+    n_skipped = 0
+
+    for item in chunks:
+        if isinstance(item, DocumentEnd):
+            item.chunk_hashes = list(seen.pop(item.doc_path, {}))
+            item.n_skipped = n_skipped
+            n_skipped = 0
+            yield item
+            continue
+
+        doc_path, chunk = item
+        chunk_hash = chunk.chunk_hash
+        doc_seen = seen.setdefault(doc_path, {})
+
+        if chunk_hash in doc_seen or chunk_hash in known_chunks.get(doc_path, ()):
+            doc_seen[chunk_hash] = True
+            n_skipped += 1
+            continue
+
+        doc_seen[chunk_hash] = True
+        yield item
+
+
+def encode_chunks(chunks: Iterable, embedder, window: int = None, device: str = None) -> Iterator:
+    """
+    Encodes chunks `window` at a time, across document boundaries, with length-sorted batches
+    packed under the token budget (see `batching.encode_length_sorted`). Each window yields
+    `EncodedBatch` items in the original chunk order, and every `DocumentEnd` right after the
+    batch holding the last chunk of its document.
+    """
+    window = window or settings.ingestion.encode_window
+    buffered = []
+    n_chunks = 0
+
+    def _encode():
+        pending = [item for item in buffered if not isinstance(item, DocumentEnd)]
+        embeddings = None
+
+        if pending:
+            lengths = [chunk.n_tokens for _, chunk in pending]
+            embeddings = encode_length_sorted(embedder,
+                                              [chunk.text for _, chunk in pending],
+                                              lengths=None if None in lengths else lengths,
+                                              device=device)
+        run, offset = [], 0
+
+        for item in buffered:
+            if isinstance(item, DocumentEnd):
+                if run:
+                    yield EncodedBatch(doc_paths=[doc_path for doc_path, _ in run],
+                                       chunks=[chunk for _, chunk in run],
+                                       embeddings=embeddings[offset:offset + len(run)])
+                    offset += len(run)
+                    run = []
+                yield item
+            else:
+                run.append(item)
+
+        if run:
+            yield EncodedBatch(doc_paths=[doc_path for doc_path, _ in run],
+                               chunks=[chunk for _, chunk in run],
+                               embeddings=embeddings[offset:offset + len(run)])
+
+    for item in chunks:
+        buffered.append(item)
+
+        if not isinstance(item, DocumentEnd):
+            n_chunks += 1
+
+        if n_chunks >= window:
+            yield from _encode()
+            buffered, n_chunks = [], 0
+
+    if buffered:
+        yield from _encode()
+
+
+def iter_ingestion_batches(doc_paths: List[str],
+                           embedder,
+                           chunk_size_approx: int,
+                           overlap_tokens: int,
+                           device: str = None,
+                           sentence_cache=None,
+                           doc_hashes: Dict[str, str] = None,
+                           known_chunks: Dict[str, Set[str]] = None,
+                           stage_stats: StageStats = None) -> Iterator:
+    """
+    Streams `doc_paths` through page extraction, sentence splitting, tokenization, chunking and
+    encoding. Every stage runs on its own thread behind a bounded queue, so memory stays flat
+    regardless of document size and encoded batches start arriving after the first pages.
+
+    Yields `EncodedBatch` items ready to insert, and a `DocumentEnd` once all chunks of a document
+    have been yielded. `sentence_cache` and `doc_hashes` enable sharing the first two stages
+    between embedding models, see `iter_sentences`. With `known_chunks`, chunks already stored
+    for a document are not encoded again, see `skip_known_chunks`. Per-stage timings are
+    collected in `stage_stats`.
+    """
+    queue_size = settings.ingestion.stage_queue_size
+
+    sentences = bounded_stage(iter_sentences(doc_paths, sentence_cache, doc_hashes, stage_stats),
+                              queue_size * settings.ingestion.tokenize_batch_size,
+                              name="ingestion-sentences",
+                              stats=stage_stats)
+
+    token_batches = bounded_stage(tokenize_sentences(sentences, embedder.tokenizer),
+                                  queue_size,
+                                  name="ingestion-tokens",
+                                  stats=stage_stats)
+
+    chunks = bounded_stage(skip_known_chunks(chunk_sentences(token_batches, chunk_size_approx, overlap_tokens),
+                                             known_chunks or {}),
+                           settings.ingestion.encode_window,
+                           name="ingestion-chunks",
+                           stats=stage_stats)
+
+    return bounded_stage(encode_chunks(chunks, embedder, device=device), 2, name="ingestion-encode", stats=stage_stats)
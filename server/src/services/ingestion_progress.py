@@ -0,0 +1,279 @@
+import json
+import time
+import threading
+from typing import Dict, List
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from ..core.dependencies import get_redis_client
+from .ingestion_pipeline import DocumentEnd, EncodedBatch, StageStats
+
+
+logger = get_logger(__name__)
+
+PROGRESS_STATE = "PROGRESS"
+
+# counters summed over the tasks of a fanned-out ingestion
+SHARED_COUNTERS = ("docs_done", "docs_empty", "pages_done", "chunks_encoded", "chunks_skipped",
+                   "vectors_inserted", "vectors_deleted")
+
+
+class SharedProgress:
+    """
+    Progress of an ingestion fanned out over many Celery tasks, kept in a Redis hash under the
+    id of the parent task. The parent records the totals, every task adds what it did, and
+    `as_dict` sums it up in the same shape as `IngestionProgress.as_dict`.
+    """
+
+    KEY_PREFIX = "smarag:ingestion_progress"
+    TTL_SEC = 24 * 3600
+
+    def __init__(self, parent_id: str, redis_client=None):
+        self.parent_id = parent_id
+        self.key = f"{self.KEY_PREFIX}:{parent_id}"
+        self._redis_client = redis_client
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    def plan(self, docs_total: int, pages_total: int, models_total: int) -> None:
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(self.key, mapping={"docs_total": docs_total,
+                                     "pages_total": pages_total,
+                                     "models_total": models_total,
+                                     "started_at": time.time()})
+        pipe.expire(self.key, self.TTL_SEC)
+        pipe.execute()
+
+    def add(self, deltas: Dict[str, float]) -> None:
+        pipe = self.redis_client.pipeline(transaction=True)
+
+        for name, delta in deltas.items():
+            if delta:
+                pipe.hincrbyfloat(self.key, name, delta)
+
+        pipe.expire(self.key, self.TTL_SEC)
+        pipe.execute()
+
+    def add_failure(self, doc_id: str, embedding_model: str, error: str) -> None:
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.rpush(f"{self.key}:failed", json.dumps({"doc_id": doc_id, "model": embedding_model, "error": error}))
+        pipe.expire(f"{self.key}:failed", self.TTL_SEC)
+        pipe.execute()
+
+    def as_dict(self) -> Dict:
+        values = {name.decode(): float(value) for name, value in self.redis_client.hgetall(self.key).items()}
+        failed = [json.loads(entry) for entry in self.redis_client.lrange(f"{self.key}:failed", 0, -1)]
+
+        elapsed = time.time() - values.get("started_at", time.time())
+        pages_total = int(values.get("pages_total", 0))
+        pages_done = min(int(values.get("pages_done", 0)), pages_total)
+
+        stages = {}
+
+        for name, seconds in values.items():
+            if name.startswith("stage:"):
+                _, stage, counter = name.split(":", 2)
+                stages.setdefault(stage, {})[counter] = round(seconds, 3)
+
+        eta = elapsed * (pages_total - pages_done) / pages_done if pages_done else None
+
+        return {
+            "models_total": int(values.get("models_total", 0)),
+            "docs_total": int(values.get("docs_total", 0)),
+            **{name: int(values.get(name, 0)) for name in SHARED_COUNTERS},
+            "pages_done": pages_done,
+            "pages_total": pages_total,
+            "docs_failed": failed,
+            "elapsed_sec": round(elapsed, 1),
+            "eta_sec": round(eta, 1) if eta is not None else None,
+            "pages_per_sec": round(pages_done / elapsed, 2) if elapsed else None,
+            "stages": stages,
+        }
+
+    def clear(self) -> None:
+        self.redis_client.delete(self.key, f"{self.key}:failed")
+
+
+class IngestionProgress:
+    """
+    Counts what a `start_computing` run has done so far and publishes it as the `PROGRESS`
+    custom state of its Celery task, at most once every `progress_interval_sec`.
+
+    Work is measured in pages over all (document, model) pairs left to embed, which also drives
+    the ETA. Pages of the document being encoded count as soon as a chunk reaching them is
+    encoded, so long filings advance smoothly instead of in one step at their end.
+
+    With `parent_id`, the task is one part of a fanned-out ingestion: every publish also adds
+    what changed since the last one to the `SharedProgress` of the parent and stores the sum as
+    the parent's `PROGRESS` state.
+    """
+
+    def __init__(self, task=None, publish_interval: float = None, parent_id: str = None):
+        self.task = task
+        self.shared = SharedProgress(parent_id) if parent_id else None
+        self._shared_sent: Dict[str, float] = {}
+        self.publish_interval = publish_interval if publish_interval is not None else settings.ingestion.progress_interval_sec
+
+        self.stage_stats = StageStats()
+
+        self.models_total = 0
+        self.models_done = 0
+        self.model = None
+
+        self.docs_total = 0
+        self.docs_done = 0
+        self.docs_empty = 0
+
+        self.pages_total = 0
+        self.pages_done = 0
+
+        self.chunks = 0
+        self.chunks_skipped = 0
+        self.vectors_inserted = 0
+        self.vectors_deleted = 0
+
+        self._page_counts: Dict[str, int] = {}
+        self._doc_pages: Dict[str, int] = {}
+        self._writer = None
+        self._insert_sec = 0.0
+
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self._published_at = 0.0
+
+    def plan(self, pending_docs: Dict[str, List[str]], page_counts: Dict[str, int]) -> None:
+        self._page_counts = page_counts
+
+        self.models_total = len(pending_docs)
+        self.docs_total = sum(len(doc_paths) for doc_paths in pending_docs.values())
+        self.pages_total = sum(page_counts.get(doc_path, 0) for doc_paths in pending_docs.values() for doc_path in doc_paths)
+
+        self.publish(force=True)
+
+    def start_model(self, model: str, writer) -> None:
+        with self._lock:
+            self.model = model
+            self._writer = writer
+
+        self.publish(force=True)
+
+    def finish_model(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self.vectors_inserted += self._writer.rows_inserted
+                self._insert_sec += self._writer.insert_seconds
+                self._writer = None
+
+            self.models_done += 1
+
+        self.publish(force=True)
+
+    def batch_encoded(self, batch: EncodedBatch) -> None:
+        with self._lock:
+            self.chunks += len(batch.chunks)
+
+            for doc_path, chunk in zip(batch.doc_paths, batch.chunks):
+                if chunk.last_page is not None:
+                    self._doc_pages[doc_path] = max(self._doc_pages.get(doc_path, 0), chunk.last_page + 1)
+
+        self.publish()
+
+    def document_done(self, doc_end: DocumentEnd) -> None:
+        with self._lock:
+            self._doc_pages.pop(doc_end.doc_path, None)
+
+            self.docs_done += 1
+            self.docs_empty += doc_end.n_chunks == 0
+            self.pages_done += self._page_counts.get(doc_end.doc_path, 0)
+            self.chunks_skipped += doc_end.n_skipped
+
+        self.publish()
+
+    def record_deleted(self, n_deleted: int) -> None:
+        with self._lock:
+            self.vectors_deleted += n_deleted
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at
+            pages_done = min(self.pages_done + sum(self._doc_pages.values()), self.pages_total)
+
+            vectors_inserted = self.vectors_inserted
+            insert_sec = self._insert_sec
+
+            if self._writer is not None:
+                vectors_inserted += self._writer.rows_inserted
+                insert_sec += self._writer.insert_seconds
+
+            eta = elapsed * (self.pages_total - pages_done) / pages_done if pages_done else None
+
+            return {
+                "model": self.model,
+                "models_done": self.models_done,
+                "models_total": self.models_total,
+                "docs_done": self.docs_done,
+                "docs_total": self.docs_total,
+                "docs_empty": self.docs_empty,
+                "pages_done": pages_done,
+                "pages_total": self.pages_total,
+                "chunks_encoded": self.chunks,
+                "chunks_skipped": self.chunks_skipped,
+                "vectors_inserted": vectors_inserted,
+                "vectors_deleted": self.vectors_deleted,
+                "elapsed_sec": round(elapsed, 1),
+                "eta_sec": round(eta, 1) if eta is not None else None,
+                "pages_per_sec": round(pages_done / elapsed, 2) if elapsed else None,
+                "stages": {**self.stage_stats.as_dict(), "milvus-insert": {"busy_sec": round(insert_sec, 3)}},
+            }
+
+    def publish(self, force: bool = False) -> None:
+        now = time.perf_counter()
+
+        if self.task is None or not getattr(self.task.request, "id", None):
+            return
+        if not force and now - self._published_at < self.publish_interval:
+            return
+
+        self._published_at = now
+
+        try:
+            self.task.update_state(state=PROGRESS_STATE, meta=self.as_dict())
+
+            if self.shared is not None:
+                self._publish_shared()
+        except Exception as e:
+            logger.warning(f"Failed to publish ingestion progress: {e}")
+
+    def _shared_counters(self) -> Dict[str, float]:
+        progress = self.as_dict()
+        counters = {name: progress[name] for name in SHARED_COUNTERS}
+
+        for stage, stage_counters in progress["stages"].items():
+            for counter, seconds in stage_counters.items():
+                counters[f"stage:{stage}:{counter}"] = seconds
+
+        return counters
+
+    def _publish_shared(self, counters: Dict[str, float] = None) -> None:
+        counters = counters if counters is not None else self._shared_counters()
+
+        self.shared.add({name: value - self._shared_sent.get(name, 0) for name, value in counters.items()})
+        self._shared_sent = counters
+
+        self.task.backend.store_result(self.shared.parent_id, self.shared.as_dict(), PROGRESS_STATE)
+
+    def rollback_shared(self) -> None:
+        """
+        Takes back everything this task added to the parent's progress, before it is retried.
+        """
+        if self.shared is None or not self._shared_sent:
+            return
+
+        try:
+            self._publish_shared({name: 0 for name in self._shared_sent})
+        except Exception as e:
+            logger.warning(f"Failed to roll back ingestion progress: {e}")
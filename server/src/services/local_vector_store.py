@@ -0,0 +1,705 @@
+"""
+An embedded stand-in for the Milvus server, answering the `MilvusClient` calls this package makes
+from memory-mapped NumPy matrices under a data directory. Selected with
+`VECTOR_STORE_BACKEND=local`, see `core.dependencies.get_milvus_client`.
+
+Every collection is a directory of immutable segments, one per `insert`, plus tombstone files
+listing deleted ids. Searches are exact: one matrix product per segment and query batch, then a
+top-k over the scores. `compact` merges the segments and drops deleted rows; it runs on its own
+once a collection has more than `max_segments` segments or more than `max_deleted_ratio` of its
+rows are deleted. Index parameters are recorded but not built, as exact search is what a
+small corpus wants anyway.
+
+A sparse field filled by a BM25 function of the schema is not stored either. Searching it scores
+the text of the function's input field by BM25, from postings each segment builds on first use.
+Terms are the lowercased words of the text, without the stemming of Milvus' analyzers.
+"""
+import os
+import re
+import json
+import shutil
+import threading
+from itertools import islice
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from .filter_expressions import compile_filter
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers are then only serialized within a process
+    fcntl = None
+
+
+logger = get_logger(__name__)
+
+VECTOR_TYPES = ("FLOAT_VECTOR", "FLOAT16_VECTOR", "BINARY_VECTOR")
+_INT_TYPES = ("INT8", "INT16", "INT32", "INT64")
+
+_TERM = re.compile(r"\w+")
+
+# Milvus' defaults for BM25 functions
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _analyze(text: str) -> List[str]:
+    return _TERM.findall((text or "").lower())
+
+
+def _write_json(path: str, obj) -> None:
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+class _IndexParams(list):
+    def add_index(self, field_name: str, index_type: str = "", metric_type: str = None, params: Dict = None, **kwargs):
+        self.append({"field_name": field_name, "index_type": index_type, "metric_type": metric_type, "params": params or {}})
+
+
+class _Segment:
+    """
+    The rows of one insert. Vectors are memory-mapped, scalar columns are read on first use.
+    """
+
+    def __init__(self, path: str, fields: List[Dict]):
+        self.path = path
+        self.fields = {field["name"]: field for field in fields}
+
+        self.ids = np.load(os.path.join(path, "id.npy"))
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._norms: Dict[str, np.ndarray] = {}
+        self._scalars: Optional[Dict[str, np.ndarray]] = None
+        self._postings: Dict[str, Tuple[np.ndarray, Dict[str, Tuple[np.ndarray, np.ndarray]]]] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vectors(self, name: str) -> np.ndarray:
+        if name not in self._vectors:
+            self._vectors[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._vectors[name]
+
+    def norms(self, name: str) -> np.ndarray:
+        if name not in self._norms:
+            self._norms[name] = np.load(os.path.join(self.path, f"{name}_norms.npy"))
+        return self._norms[name]
+
+    def column(self, name: str) -> np.ndarray:
+        if name == "id":
+            return self.ids
+
+        if self._scalars is None:
+            with open(os.path.join(self.path, "scalars.json")) as f:
+                raw = json.load(f)
+
+            self._scalars = {field: np.asarray(values, dtype=np.int64 if self.fields[field]["type"] in _INT_TYPES else object)
+                             for field, values in raw.items()}
+
+        return self._scalars[name]
+
+    def postings(self, name: str) -> Tuple[np.ndarray, Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Terms per row of the text field `name`, and for every term the rows containing it with
+        its count in each. Segments never change, so this is built once.
+        """
+        if name not in self._postings:
+            lengths = np.zeros(len(self), dtype=np.float32)
+            postings: Dict[str, Tuple[List[int], List[int]]] = {}
+
+            for row, text in enumerate(self.column(name)):
+                terms = _analyze(text)
+                lengths[row] = len(terms)
+
+                for term, count in Counter(terms).items():
+                    rows, counts = postings.setdefault(term, ([], []))
+                    rows.append(row)
+                    counts.append(count)
+
+            self._postings[name] = (lengths, {term: (np.asarray(rows, dtype=np.int64), np.asarray(counts, dtype=np.float32))
+                                              for term, (rows, counts) in postings.items()})
+
+        return self._postings[name]
+
+    def value(self, name: str, row: int):
+        field_type = self.fields[name]["type"]
+
+        if field_type == "FLOAT_VECTOR":
+            return np.array(self.vectors(name)[row])
+        if field_type in VECTOR_TYPES:
+            # float16 and binary vectors come back as a list holding their bytes, as from pymilvus
+            return [self.vectors(name)[row].tobytes()]
+
+        value = self.column(name)[row]
+        return int(value) if isinstance(value, np.integer) else value
+
+
+class _Collection:
+    def __init__(self, path: str):
+        self.path = path
+        self.meta_mtime = None
+        self.meta: Dict = {}
+        self.segments: Dict[str, _Segment] = {}
+        self.deleted = np.zeros(0, dtype=np.int64)
+
+    @property
+    def fields(self) -> List[Dict]:
+        return self.meta["fields"]
+
+    @property
+    def functions(self) -> List[Dict]:
+        return self.meta.get("functions", [])
+
+    @property
+    def generated_fields(self) -> set:
+        # filled by the collection's functions, never stored
+        return {name for function in self.functions for name in function["output_field_names"]}
+
+    def bm25_input(self, name: str) -> Optional[str]:
+        for function in self.functions:
+            if function["type"] == "BM25" and name in function["output_field_names"]:
+                return function["input_field_names"][0]
+        return None
+
+    def field(self, name: str) -> Dict:
+        for field in self.fields:
+            if field["name"] == name:
+                return field
+        raise KeyError(f"No field {name} in {os.path.basename(self.path)}")
+
+    def refresh(self) -> None:
+        # another process, e.g. a Celery worker, may have inserted or compacted since
+        meta_path = os.path.join(self.path, "meta.json")
+        stat = os.stat(meta_path)
+        # metadata is replaced, never edited in place, so a new inode means a new version
+        mtime = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        if mtime == self.meta_mtime:
+            return
+
+        with open(meta_path) as f:
+            self.meta = json.load(f)
+
+        self.segments = {name: self.segments.get(name) or _Segment(os.path.join(self.path, name), self.fields)
+                         for name in self.meta["segments"]}
+        self.deleted = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                                [np.load(os.path.join(self.path, name)) for name in self.meta["tombstones"]]))
+        self.meta_mtime = mtime
+
+    def live(self, segment: _Segment) -> np.ndarray:
+        return ~np.isin(segment.ids, self.deleted) if len(self.deleted) else np.ones(len(segment), dtype=bool)
+
+    def mask(self, segment: _Segment, filter: str) -> np.ndarray:
+        mask = self.live(segment)
+
+        if filter:
+            mask &= compile_filter(filter)(segment.column)
+
+        return mask
+
+
+class LocalVectorStore:
+    """
+    The subset of `pymilvus.MilvusClient` used by this package, over collections stored under
+    `data_dir`. Safe to share between threads; processes sharing a directory see each other's
+    writes on their next call.
+    """
+
+    def __init__(self, data_dir: str = None, max_segments: int = None, max_deleted_ratio: float = None):
+        self.data_dir = data_dir or settings.local_vector_store.path
+        self.max_segments = max_segments or settings.local_vector_store.max_segments
+        self.max_deleted_ratio = max_deleted_ratio or settings.local_vector_store.max_deleted_ratio
+
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.RLock()
+
+    # collections
+
+    def _path(self, collection_name: str) -> str:
+        return os.path.join(self.data_dir, collection_name)
+
+    def _collection(self, collection_name: str) -> _Collection:
+        if not self.has_collection(collection_name=collection_name):
+            raise ValueError(f"Collection {collection_name} does not exist")
+
+        with self._lock:
+            collection = self._collections.get(collection_name)
+
+            if collection is None or collection.path != self._path(collection_name):
+                collection = self._collections[collection_name] = _Collection(self._path(collection_name))
+
+            collection.refresh()
+            return collection
+
+    def _write(self, collection_name: str):
+        return _WriteLock(self, collection_name)
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return os.path.exists(os.path.join(self._path(collection_name), "meta.json"))
+
+    def list_collections(self, **kwargs) -> List[str]:
+        return sorted(name for name in os.listdir(self.data_dir) if self.has_collection(name))
+
+    @staticmethod
+    def prepare_index_params(**kwargs) -> _IndexParams:
+        return _IndexParams()
+
+    def create_collection(self, collection_name: str, schema=None, index_params=None, **kwargs) -> None:
+        if self.has_collection(collection_name):
+            return
+
+        fields = [{"name": field.name,
+                   "type": getattr(field.dtype, "name", str(field.dtype)),
+                   "params": dict(getattr(field, "params", None) or {}),
+                   "is_primary": bool(getattr(field, "is_primary", False)),
+                   "auto_id": bool(getattr(field, "auto_id", False) or getattr(schema, "auto_id", False))}
+                  for field in schema.fields]
+
+        functions = [{"name": function.name,
+                      "type": getattr(function.type, "name", str(function.type)),
+                      "input_field_names": list(function.input_field_names),
+                      "output_field_names": list(function.output_field_names)}
+                     for function in getattr(schema, "functions", None) or []]
+
+        indexes = {}
+        for index in index_params or []:
+            index = index if isinstance(index, dict) else {"field_name": index.field_name,
+                                                           "index_type": index.index_type,
+                                                           "metric_type": getattr(index, "metric_type", None),
+                                                           "params": dict(getattr(index, "params", None) or {})}
+            indexes[index["field_name"]] = index
+
+        path = self._path(collection_name)
+        os.makedirs(path, exist_ok=True)
+
+        _write_json(os.path.join(path, "meta.json"), {"fields": fields,
+                                                      "functions": functions,
+                                                      "indexes": indexes,
+                                                      "next_id": 1,
+                                                      "next_file": 0,
+                                                      "segments": [],
+                                                      "tombstones": []})
+
+    def drop_collection(self, collection_name: str, **kwargs) -> None:
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            shutil.rmtree(self._path(collection_name), ignore_errors=True)
+
+    def rename_collection(self, old_name: str, new_name: str, **kwargs) -> None:
+        if self.has_collection(new_name):
+            raise ValueError(f"Collection {new_name} already exists")
+
+        with self._lock:
+            self._collections.pop(old_name, None)
+            os.replace(self._path(old_name), self._path(new_name))
+
+    def describe_collection(self, collection_name: str, **kwargs) -> Dict:
+        try:
+            from pymilvus import DataType
+        except ImportError:
+            DataType = None
+
+        collection = self._collection(collection_name)
+        fields = [{**field, "type": DataType[field["type"]] if DataType else field["type"]}
+                  for field in collection.fields]
+
+        return {"collection_name": collection_name, "fields": fields, "functions": collection.functions}
+
+    def describe_index(self, collection_name: str, index_name: str, **kwargs) -> Dict:
+        collection = self._collection(collection_name)
+        index = collection.meta["indexes"].get(index_name, {})
+        n_rows = sum(len(segment) for segment in collection.segments.values())
+
+        return {**index, "total_rows": n_rows, "indexed_rows": n_rows, "pending_index_rows": 0, "state": "Finished"}
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> Dict:
+        collection = self._collection(collection_name)
+        return {"row_count": int(sum(collection.live(segment).sum() for segment in collection.segments.values()))}
+
+    def load_collection(self, collection_name: str, **kwargs) -> None:
+        self._collection(collection_name)
+
+    def release_collection(self, collection_name: str, **kwargs) -> None:
+        pass
+
+    def flush(self, collection_name: str, **kwargs) -> None:
+        # every insert and delete is written through
+        pass
+
+    # writes
+
+    def insert(self, collection_name: str, data: List[Dict], **kwargs) -> Dict:
+        if isinstance(data, dict):
+            data = [data]
+
+        if not data:
+            return {"insert_count": 0, "ids": []}
+
+        with self._write(collection_name) as collection:
+            primary = next(field for field in collection.fields if field["is_primary"])
+
+            if primary["auto_id"]:
+                ids = np.arange(collection.meta["next_id"], collection.meta["next_id"] + len(data), dtype=np.int64)
+            else:
+                ids = np.asarray([row[primary["name"]] for row in data], dtype=np.int64)
+
+            name = f"seg_{collection.meta['next_file']:08d}"
+            tmp_path = os.path.join(collection.path, f"{name}.tmp")
+            os.makedirs(tmp_path, exist_ok=True)
+
+            np.save(os.path.join(tmp_path, "id.npy"), ids)
+            scalars = {}
+
+            for field in collection.fields:
+                if field["is_primary"] or field["name"] in collection.generated_fields:
+                    continue
+
+                values = [row.get(field["name"]) for row in data]
+
+                if field["type"] in VECTOR_TYPES:
+                    vectors = self._vector_matrix(values, field["type"])
+                    np.save(os.path.join(tmp_path, f"{field['name']}.npy"), vectors)
+
+                    if field["type"] != "BINARY_VECTOR":
+                        np.save(os.path.join(tmp_path, f"{field['name']}_norms.npy"),
+                                np.einsum("ij,ij->i", vectors.astype(np.float32), vectors.astype(np.float32)))
+                else:
+                    scalars[field["name"]] = [value.item() if isinstance(value, np.generic) else value for value in values]
+
+            _write_json(os.path.join(tmp_path, "scalars.json"), scalars)
+            os.replace(tmp_path, os.path.join(collection.path, name))
+
+            collection.meta["segments"].append(name)
+            collection.meta["next_file"] += 1
+            collection.meta["next_id"] = max(collection.meta["next_id"], int(ids.max()) + 1)
+
+        self._maybe_compact(collection_name)
+
+        return {"insert_count": len(data), "ids": ids.tolist()}
+
+    @staticmethod
+    def _vector_matrix(values: List, field_type: str) -> np.ndarray:
+        if field_type == "BINARY_VECTOR":
+            return np.stack([np.frombuffer(value, dtype=np.uint8) for value in values])
+        if field_type == "FLOAT16_VECTOR":
+            return np.stack([np.frombuffer(value, dtype=np.float16) if isinstance(value, bytes)
+                             else np.asarray(value, dtype=np.float16) for value in values])
+        return np.asarray(values, dtype=np.float32)
+
+    def delete(self, collection_name: str, filter: str = None, ids: List[int] = None, **kwargs) -> Dict:
+        with self._write(collection_name) as collection:
+            deleted = []
+
+            for segment in collection.segments.values():
+                mask = collection.live(segment)
+
+                if ids is not None:
+                    mask &= np.isin(segment.ids, np.asarray(ids, dtype=np.int64))
+                if filter:
+                    mask &= compile_filter(filter)(segment.column)
+
+                deleted.append(segment.ids[mask])
+
+            deleted = np.concatenate(deleted) if deleted else np.zeros(0, dtype=np.int64)
+
+            if len(deleted):
+                name = f"tombstones_{collection.meta['next_file']:08d}.npy"
+                np.save(os.path.join(collection.path, name), deleted)
+
+                collection.meta["tombstones"].append(name)
+                collection.meta["next_file"] += 1
+
+        self._maybe_compact(collection_name)
+
+        return {"delete_count": len(deleted)}
+
+    def _maybe_compact(self, collection_name: str) -> None:
+        collection = self._collection(collection_name)
+
+        n_rows = sum(len(segment) for segment in collection.segments.values())
+        n_deleted = len(collection.deleted)
+
+        if len(collection.segments) > self.max_segments or (n_rows and n_deleted / n_rows > self.max_deleted_ratio):
+            self.compact(collection_name)
+
+    def compact(self, collection_name: str, **kwargs) -> Dict:
+        """
+        Rewrites the live rows of a collection into one segment and drops its tombstones. The
+        replaced files are only removed by the next compaction, so searches that started on
+        them, here or in another process, can still finish.
+        """
+        with self._write(collection_name) as collection:
+            if len(collection.meta["segments"]) <= 1 and not collection.meta["tombstones"]:
+                return {"segments": len(collection.meta["segments"])}
+
+            garbage = collection.meta.get("garbage", [])
+            replaced = collection.meta["segments"] + collection.meta["tombstones"]
+
+            name = f"seg_{collection.meta['next_file']:08d}"
+            tmp_path = os.path.join(collection.path, f"{name}.tmp")
+            os.makedirs(tmp_path, exist_ok=True)
+
+            segments = list(collection.segments.values())
+            masks = [collection.live(segment) for segment in segments]
+
+            np.save(os.path.join(tmp_path, "id.npy"), np.concatenate([segment.ids[mask] for segment, mask in zip(segments, masks)]))
+            scalars = {}
+
+            for field in collection.fields:
+                if field["is_primary"] or field["name"] in collection.generated_fields:
+                    continue
+
+                if field["type"] in VECTOR_TYPES:
+                    vectors = np.concatenate([np.asarray(segment.vectors(field["name"]))[mask] for segment, mask in zip(segments, masks)])
+                    np.save(os.path.join(tmp_path, f"{field['name']}.npy"), vectors)
+
+                    if field["type"] != "BINARY_VECTOR":
+                        np.save(os.path.join(tmp_path, f"{field['name']}_norms.npy"),
+                                np.concatenate([segment.norms(field["name"])[mask] for segment, mask in zip(segments, masks)]))
+                else:
+                    scalars[field["name"]] = [value.item() if isinstance(value, np.generic) else value
+                                              for segment, mask in zip(segments, masks)
+                                              for value in segment.column(field["name"])[mask]]
+
+            _write_json(os.path.join(tmp_path, "scalars.json"), scalars)
+            os.replace(tmp_path, os.path.join(collection.path, name))
+
+            collection.meta["segments"] = [name]
+            collection.meta["tombstones"] = []
+            collection.meta["garbage"] = replaced
+            collection.meta["next_file"] += 1
+
+        for old_file in garbage:
+            old_path = os.path.join(collection.path, old_file)
+
+            try:
+                shutil.rmtree(old_path) if os.path.isdir(old_path) else os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove compacted {old_path}: {e}")
+
+        logger.info(f"Compacted {collection_name} from {len(replaced)} files into one segment")
+
+        return {"segments": 1}
+
+    # reads
+
+    def search(self,
+               collection_name: str,
+               data: List,
+               limit: int = 10,
+               anns_field: str = None,
+               search_params: Dict = None,
+               output_fields: List[str] = None,
+               filter: str = "",
+               **kwargs) -> List[List[Dict]]:
+        collection = self._collection(collection_name)
+
+        anns_field = anns_field or next(field["name"] for field in collection.fields if field["type"] in VECTOR_TYPES)
+
+        if collection.bm25_input(anns_field):
+            return self._search_bm25(collection, collection.bm25_input(anns_field), list(data), limit, filter,
+                                     output_fields or [])
+
+        field_type = collection.field(anns_field)["type"]
+        queries = self._vector_matrix(list(data), field_type)
+
+        # per query, the best (distance, segment, row) of every segment
+        candidates = [[] for _ in range(len(queries))]
+
+        for segment in collection.segments.values():
+            rows = np.flatnonzero(collection.mask(segment, filter))
+
+            if len(rows) == 0:
+                continue
+
+            distances = self._distances(segment, anns_field, field_type, queries, rows)
+            k = min(limit, len(rows))
+            top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+
+            for query_idx in range(len(queries)):
+                candidates[query_idx].extend((distances[query_idx, idx], segment, rows[idx]) for idx in top[query_idx])
+
+        output_fields = output_fields or []
+
+        return [[{"id": int(segment.ids[row]),
+                  "distance": float(distance),
+                  "entity": {name: segment.value(name, row) for name in output_fields}}
+                 for distance, segment, row in sorted(hits, key=lambda hit: hit[0])[:limit]]
+                for hits in candidates]
+
+    @staticmethod
+    def _search_bm25(collection: _Collection, text_field: str, texts: List[str], limit: int, filter: str,
+                     output_fields: List[str]) -> List[List[Dict]]:
+        """
+        Rows of `text_field` matching any term of each text, by BM25 score, higher first, which
+        is what Milvus returns as distance for BM25. Document frequencies and the average length
+        come from every live row, the filter only decides which rows are returned.
+        """
+        segments = list(collection.segments.values())
+        live = [collection.live(segment) for segment in segments]
+        masks = [collection.mask(segment, filter) for segment in segments]
+        postings = [segment.postings(text_field) for segment in segments]
+
+        n_rows = sum(int(mask.sum()) for mask in live)
+
+        if n_rows == 0:
+            return [[] for _ in texts]
+
+        avg_length = max(sum(float(lengths[mask].sum()) for (lengths, _), mask in zip(postings, live)) / n_rows, 1.0)
+        results = []
+
+        for text in texts:
+            terms = set(_analyze(text))
+            doc_freqs = {term: sum(int(mask[index[term][0]].sum()) for (_, index), mask in zip(postings, live) if term in index)
+                         for term in terms}
+            candidates = []
+
+            for segment, (lengths, index), mask in zip(segments, postings, masks):
+                scores = np.zeros(len(segment), dtype=np.float32)
+
+                for term in terms:
+                    if not doc_freqs[term] or term not in index:
+                        continue
+
+                    rows, counts = index[term]
+                    idf = np.log(1 + (n_rows - doc_freqs[term] + 0.5) / (doc_freqs[term] + 0.5))
+                    scores[rows] += idf * counts * (BM25_K1 + 1) / (counts + BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows] / avg_length))
+
+                rows = np.flatnonzero(mask & (scores > 0))
+                candidates.extend((float(scores[row]), segment, row) for row in rows[np.argsort(-scores[rows])[:limit]])
+
+            results.append([{"id": int(segment.ids[row]),
+                             "distance": score,
+                             "entity": {name: segment.value(name, row) for name in output_fields}}
+                            for score, segment, row in sorted(candidates, key=lambda hit: -hit[0])[:limit]])
+
+        return results
+
+    @staticmethod
+    def _distances(segment: _Segment, anns_field: str, field_type: str, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        vectors = segment.vectors(anns_field)
+        vectors = vectors if len(rows) == len(segment) else vectors[rows]
+
+        if field_type == "BINARY_VECTOR":
+            # hamming distance, the popcount of the xor of the packed codes
+            return np.stack([np.unpackbits(np.bitwise_xor(vectors, query), axis=1).sum(axis=1) for query in queries]).astype(np.float32)
+
+        queries = queries.astype(np.float32)
+        norms = segment.norms(anns_field)[rows]
+
+        # squared L2 as Milvus reports it, ||q||^2 - 2 q.x + ||x||^2, one matrix product for all queries
+        distances = (np.einsum("ij,ij->i", queries, queries)[:, None] - 2 * queries @ np.asarray(vectors, dtype=np.float32).T
+                     + norms[None, :])
+
+        # the expansion can come out slightly negative for a vector and itself
+        return np.maximum(distances, 0)
+
+    def _rows(self, collection: _Collection, segments: List[_Segment], filter: str, output_fields: List[str], ids=None):
+        output_fields = [name for name in (output_fields or []) if name != "id"]
+
+        for segment in segments:
+            mask = collection.mask(segment, filter)
+
+            if ids is not None:
+                mask &= np.isin(segment.ids, ids)
+
+            for row in np.flatnonzero(mask):
+                yield {"id": int(segment.ids[row]), **{name: segment.value(name, row) for name in output_fields}}
+
+    def get(self, collection_name: str, ids, output_fields: List[str] = None, **kwargs) -> List[Dict]:
+        collection = self._collection(collection_name)
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+
+        return list(self._rows(collection, list(collection.segments.values()), "", output_fields, ids=ids))
+
+    def query(self, collection_name: str, filter: str = "", output_fields: List[str] = None, limit: int = None, **kwargs) -> List[Dict]:
+        collection = self._collection(collection_name)
+        rows = self._rows(collection, list(collection.segments.values()), filter, output_fields)
+
+        return list(islice(rows, limit)) if limit else list(rows)
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, limit: int = -1, filter: str = "",
+                       output_fields: List[str] = None, **kwargs) -> "_QueryIterator":
+        collection = self._collection(collection_name)
+
+        # the segments of this moment, later inserts are not seen, as with a Milvus snapshot
+        rows = self._rows(collection, list(collection.segments.values()), filter, output_fields)
+
+        return _QueryIterator(rows, batch_size, None if limit is None or limit < 0 else limit)
+
+
+class _QueryIterator:
+    def __init__(self, rows, batch_size: int, limit: Optional[int]):
+        self.rows = rows
+        self.batch_size = batch_size
+        self.remaining = limit
+
+    def next(self) -> List[Dict]:
+        size = self.batch_size if self.remaining is None else min(self.batch_size, self.remaining)
+        batch = list(islice(self.rows, size))
+
+        if self.remaining is not None:
+            self.remaining -= len(batch)
+
+        return batch
+
+    def close(self) -> None:
+        self.rows = iter(())
+
+
+class _WriteLock:
+    """
+    Serializes the writers of a collection, across processes where `fcntl` is available, and
+    saves its metadata once the write is done.
+    """
+
+    def __init__(self, store: LocalVectorStore, collection_name: str):
+        self.store = store
+        self.collection_name = collection_name
+        self._file = None
+
+    def __enter__(self) -> _Collection:
+        self.store._lock.acquire()
+
+        try:
+            if fcntl is not None:
+                self._file = open(os.path.join(self.store._path(self.collection_name), ".lock"), "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+
+            self.collection = self.store._collection(self.collection_name)
+            return self.collection
+        except Exception:
+            self._release()
+            raise
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                _write_json(os.path.join(self.collection.path, "meta.json"), self.collection.meta)
+
+            # reloaded in any case, a failed write leaves the metadata in memory half-changed
+            self.collection.meta_mtime = None
+            self.collection.refresh()
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+        self.store._lock.release()
@@ -0,0 +1,282 @@
+"""
+Creates the chunk collections and moves existing ones to a newly configured ANN index or
+partition layout, or to the current schema, e.g. to add the BM25 field of the "fused" retrieval
+mode to a collection created before it.
+
+    python -m server.src.services.milvus_collections reindex STELLA_15_CR_EMBS
+    python -m server.src.services.milvus_collections reindex STELLA_15_CR_EMBS --drop-old
+
+Milvus cannot swap the index of a loaded field nor make an existing field the partition key, so
+`reindex` builds a shadow collection with the index and partitions now configured in
+`MilvusSettings.collections`, copies every row into it and waits for the
+index, while searches keep being served by the old collection. Rows inserted or deleted during
+the copy are caught up before the shadow is renamed into place; the old collection is kept under
+a `__pre_reindex_<timestamp>` name unless `--drop-old` is given. Writes in the moment between the
+last catch-up and the rename are lost, so re-ingestion is best paused while a collection is
+reindexed.
+"""
+import json
+import time
+import argparse
+from typing import Dict
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from .vector_codec import collection_precision, collection_index, collection_partitions, vector_datatype, index_params, \
+    decode_vector
+from .milvus_writer import MilvusBulkWriter
+from .retrieval import HEAD_DIM, BM25_FIELD
+from .result_cache import search_result_cache
+
+
+logger = get_logger(__name__)
+
+
+def create_chunk_collection(milvus_client, collection: Dict, collection_name: str = None) -> None:
+    """
+    Creates the chunk collection described by `collection`, an entry of
+    `MilvusSettings.collections`, under its own name or `collection_name`.
+    """
+    from pymilvus import MilvusClient, DataType, Function, FunctionType
+
+    precision = collection_precision(collection["collection_name"])
+    index = collection_index(collection["collection_name"])
+    partitions = collection_partitions(collection["collection_name"])
+    vector_type = vector_datatype(precision)
+
+    schema = MilvusClient.create_schema(
+        auto_id=False,
+        enable_dynamic_field=False
+    )
+
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, auto_id=True)
+    schema.add_field(field_name="vector_embs", datatype=vector_type, dim=collection["vector_dim"])
+    schema.add_field(field_name="head_embs", datatype=vector_type, dim=HEAD_DIM)
+    schema.add_field(field_name="text_chunk", datatype=DataType.VARCHAR, max_length=collection["chunk_max_length"],
+                     enable_analyzer=True, analyzer_params={"type": "english"})
+
+    # BM25 term weights of the text, computed by Milvus on insert, for the "fused" retrieval mode
+    schema.add_field(field_name=BM25_FIELD, datatype=DataType.SPARSE_FLOAT_VECTOR)
+    schema.add_function(Function(name="text_chunk_bm25",
+                                 function_type=FunctionType.BM25,
+                                 input_field_names=["text_chunk"],
+                                 output_field_names=[BM25_FIELD]))
+
+    if collection.get("add_emb_model_name", False):
+        schema.add_field(field_name="emb_model_name", datatype=DataType.VARCHAR, max_length=64)
+
+    # lets a re-uploaded document replace only the chunks that changed
+    schema.add_field(field_name="doc_id", datatype=DataType.VARCHAR, max_length=512)
+    schema.add_field(field_name="page_start", datatype=DataType.INT32)
+    schema.add_field(field_name="page_end", datatype=DataType.INT32)
+    schema.add_field(field_name="chunk_hash", datatype=DataType.VARCHAR, max_length=64)
+
+    # scopes searches to one company's filings, one user's uploads or a reporting year;
+    # as partition key the owner also decides which partition a chunk is stored in
+    schema.add_field(field_name="company", datatype=DataType.VARCHAR, max_length=256)
+    schema.add_field(field_name="owner", datatype=DataType.VARCHAR, max_length=128, is_partition_key=partitions > 0)
+    schema.add_field(field_name="year", datatype=DataType.INT32)
+
+    params = milvus_client.prepare_index_params()
+
+    params.add_index(
+        field_name="id",
+        index_type="STL_SORT"
+    )
+
+    for field_name in ["doc_id", "company", "owner"]:
+        params.add_index(
+            field_name=field_name,
+            index_type="INVERTED"
+        )
+
+    for field_name in ["year", "page_start", "page_end"]:
+        params.add_index(
+            field_name=field_name,
+            index_type="STL_SORT"
+        )
+
+    params.add_index(
+        field_name=BM25_FIELD,
+        index_type="SPARSE_INVERTED_INDEX",
+        metric_type="BM25"
+    )
+
+    params.add_index(
+        field_name="head_embs",
+        **index_params(precision, index, HEAD_DIM)
+    )
+
+    params.add_index(
+        field_name="vector_embs",
+        **index_params(precision, index, collection["vector_dim"])
+    )
+
+    milvus_client.create_collection(
+        collection_name=collection_name or collection["collection_name"],
+        schema=schema,
+        index_params=params,
+        **({"num_partitions": partitions} if partitions else {})
+    )
+
+
+def _copy_rows(milvus_client, source: str, target: str, precision: str, filter: str = "",
+               copied: Dict[int, str] = None) -> int:
+    """
+    Copies the rows of `source` matching `filter` into `target` and returns the largest id
+    copied, or -1 if there was none. Row ids are reassigned by `target`, so the source id and
+    document of every row copied are recorded in `copied`, if given.
+    """
+    description = milvus_client.describe_collection(collection_name=source)
+    # fields filled by a function, the BM25 weights, are computed again by `target`
+    generated = {name for function in description.get("functions", []) for name in function.get("output_field_names", [])}
+    fields = [field["name"] for field in description["fields"] if field["name"] not in generated]
+
+    iterator = milvus_client.query_iterator(collection_name=source,
+                                            batch_size=1000,
+                                            filter=filter,
+                                            output_fields=fields)
+    max_id = -1
+
+    try:
+        with MilvusBulkWriter(milvus_client, target) as writer:
+            while batch := iterator.next():
+                max_id = max(max_id, max(row["id"] for row in batch))
+
+                if copied is not None:
+                    copied.update((row["id"], row["doc_id"]) for row in batch)
+
+                columns = {name: [row[name] for row in batch] for name in fields if name != "id"}
+
+                for name in ("vector_embs", "head_embs"):
+                    columns[name] = [decode_vector(value, precision) for value in columns[name]]
+
+                writer.add(**columns)
+    finally:
+        iterator.close()
+
+    return max_id
+
+
+def _replay_deletes(milvus_client, source: str, target: str, precision: str, copied: Dict[int, str],
+                    max_id: int, batch_size: int = 1000) -> int:
+    """
+    Removes from `target` the rows deleted from `source` since they were copied and returns
+    their number. The ids of `target` differ from those of `source`, so every document that lost
+    rows is deleted from `target` and its remaining rows, up to `max_id`, are copied again.
+    """
+    live = set()
+    iterator = milvus_client.query_iterator(collection_name=source,
+                                            batch_size=10 * batch_size,
+                                            filter=f"id <= {max_id}",
+                                            output_fields=["id"])
+    try:
+        while batch := iterator.next():
+            live.update(row["id"] for row in batch)
+    finally:
+        iterator.close()
+
+    deleted = [row_id for row_id in copied if row_id not in live]
+    doc_ids = sorted({copied.pop(row_id) for row_id in deleted})
+
+    for start in range(0, len(doc_ids), batch_size):
+        doc_filter = f"doc_id in {json.dumps(doc_ids[start:start + batch_size])}"
+
+        milvus_client.delete(collection_name=target, filter=doc_filter)
+        _copy_rows(milvus_client, source, target, precision, filter=f"id <= {max_id} and {doc_filter}", copied=copied)
+
+    if deleted:
+        logger.info(f"Replayed {len(deleted)} rows deleted from {source} during the copy, "
+                    f"{len(doc_ids)} documents copied again")
+
+    return len(deleted)
+
+
+def _wait_for_index(milvus_client, collection_name: str, poll_sec: float = 5.0) -> None:
+    for field_name in ("head_embs", "vector_embs"):
+        while True:
+            index = milvus_client.describe_index(collection_name=collection_name, index_name=field_name)
+
+            if not index.get("pending_index_rows"):
+                break
+
+            logger.info(f"Waiting for the {field_name} index of {collection_name}: "
+                        f"{index.get('indexed_rows')} of {index.get('total_rows')} rows indexed")
+            time.sleep(poll_sec)
+
+
+def reindex_collection(milvus_client, collection_name: str, drop_old: bool = False) -> Dict:
+    """
+    Rebuilds `collection_name` with the index and partitions currently configured for it, see
+    the module docstring. Returns the name the old collection was kept under and the number of rows.
+    """
+    collection = settings.milvus.collection(collection_name)
+    precision = collection_precision(collection_name)
+    index = collection_index(collection_name)
+
+    shadow_name = f"{collection_name}__reindex"
+    old_name = f"{collection_name}__pre_reindex_{int(time.time())}"
+
+    # a shadow left over from an interrupted run is rebuilt from scratch
+    if milvus_client.has_collection(collection_name=shadow_name):
+        milvus_client.drop_collection(collection_name=shadow_name)
+
+    logger.info(f"Reindexing {collection_name} with {index['type']} {index['build']}, "
+                f"{collection_partitions(collection_name)} owner partitions")
+
+    create_chunk_collection(milvus_client, collection, collection_name=shadow_name)
+
+    # the iterator reads a snapshot, rows inserted after it started all have larger ids,
+    # rows deleted after it are found missing from the source when it is read again
+    copied: Dict[int, str] = {}
+    max_id = _copy_rows(milvus_client, collection_name, shadow_name, precision, copied=copied)
+
+    while True:
+        milvus_client.flush(collection_name=collection_name)
+        caught_up = _copy_rows(milvus_client, collection_name, shadow_name, precision, filter=f"id > {max_id}",
+                               copied=copied)
+        max_id = max(max_id, caught_up)
+
+        replayed = _replay_deletes(milvus_client, collection_name, shadow_name, precision, copied, max_id)
+
+        if caught_up < 0 and not replayed:
+            break
+
+    milvus_client.flush(collection_name=shadow_name)
+    _wait_for_index(milvus_client, shadow_name)
+    milvus_client.load_collection(collection_name=shadow_name)
+
+    n_rows = milvus_client.get_collection_stats(collection_name=shadow_name).get("row_count")
+
+    milvus_client.rename_collection(old_name=collection_name, new_name=old_name)
+    milvus_client.rename_collection(old_name=shadow_name, new_name=collection_name)
+
+    search_result_cache.bump(collection_name)
+
+    logger.info(f"{collection_name} now uses {index['type']} over {n_rows} rows, the old collection is {old_name}")
+
+    if drop_old:
+        milvus_client.drop_collection(collection_name=old_name)
+        old_name = None
+
+    return {"collection": collection_name, "old_collection": old_name, "rows": n_rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reindex = commands.add_parser("reindex", help="move a collection to its configured index and partitions")
+    reindex.add_argument("collections", nargs="+")
+    reindex.add_argument("--drop-old", action="store_true", help="drop the old collection once the new one is in place")
+
+    args = parser.parse_args()
+
+    from ..core.dependencies import milvus_client
+
+    for collection_name in args.collections:
+        print(reindex_collection(milvus_client, collection_name, drop_old=args.drop_old))
+
+
+if __name__ == "__main__":
+    main()
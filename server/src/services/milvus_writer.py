@@ -0,0 +1,206 @@
+import json
+import time
+from typing import Callable, Dict, List
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import numpy as np
+
+from ..core.utils import get_logger
+from ..core.config import settings
+
+
+logger = get_logger(__name__)
+
+
+def _row_nbytes(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return 4 * len(value)
+    return 8
+
+
+class MilvusBulkWriter:
+    """
+    Buffers rows column by column and inserts them into a Milvus collection in bulk.
+
+    A batch is flushed once it reaches `max_rows` rows or `max_bytes` bytes, or once its oldest
+    row has waited `max_delay` seconds, so the first vectors of a long document become searchable
+    early. Flushes run on a single background thread, so the caller can encode the next batch
+    while the previous one is still being sent. At most one insert is in flight at any time.
+    """
+
+    def __init__(self,
+                 milvus_client,
+                 collection_name: str,
+                 max_rows: int = None,
+                 max_bytes: int = None,
+                 max_delay: float = None,
+                 on_insert: Callable[[], None] = None):
+        self.milvus_client = milvus_client
+        self.collection_name = collection_name
+        # called on the writer thread after every insert, e.g. to invalidate cached search results
+        self.on_insert = on_insert
+
+        self.max_rows = max_rows or settings.ingestion.insert_batch_rows
+        self.max_bytes = max_bytes or settings.ingestion.insert_batch_bytes
+        self.max_delay = max_delay or settings.ingestion.insert_max_delay_sec
+
+        self._columns: Dict[str, List] = {}
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._buffered_since = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="milvus-writer")
+        self._pending: Future = None
+
+        self.rows_inserted = 0
+        self.batches_inserted = 0
+        self.insert_seconds = 0.0
+        self._started_at = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(flush=exc_type is None)
+
+    def add(self, **columns) -> None:
+        """
+        Adds a columnar batch, e.g. `add(vector_embs=embs, text_chunk=texts, emb_model_name="m")`.
+        Scalar values are broadcast to every row of the batch.
+        """
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+
+        lengths = {name: len(v) for name, v in columns.items() if not (isinstance(v, str) or np.isscalar(v))}
+
+        if not lengths:
+            raise ValueError(f"No column of {sorted(columns)} is a sequence, the number of rows to add is unknown")
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"Columns should have one value per row, got lengths {lengths}")
+
+        n_rows = next(iter(lengths.values()))
+
+        for name, values in columns.items():
+            if isinstance(values, str) or np.isscalar(values):
+                values = [values] * n_rows
+
+            column = self._columns.setdefault(name, [])
+
+            for value in values:
+                column.append(value)
+                self._buffered_bytes += _row_nbytes(value)
+
+        self._buffered_rows += n_rows
+
+        if self._buffered_since is None:
+            self._buffered_since = time.perf_counter()
+
+        if self._buffered_rows >= self.max_rows or \
+                self._buffered_bytes >= self.max_bytes or \
+                time.perf_counter() - self._buffered_since >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffered_rows == 0:
+            return
+
+        names = list(self._columns.keys())
+        rows = [dict(zip(names, values)) for values in zip(*self._columns.values())]
+
+        self._columns = {}
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._buffered_since = None
+
+        # wait for the previous batch so that inserts stay ordered and errors surface early
+        self._wait()
+        self._pending = self._executor.submit(self._insert, rows)
+
+    def _insert(self, rows: List[Dict]):
+        start = time.perf_counter()
+
+        result = self.milvus_client.insert(collection_name=self.collection_name, data=rows)
+
+        self.insert_seconds += time.perf_counter() - start
+        self.rows_inserted += len(rows)
+        self.batches_inserted += 1
+
+        if self.on_insert is not None:
+            self.on_insert()
+
+        return result
+
+    def _wait(self) -> None:
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self, flush: bool = True) -> Dict:
+        try:
+            if flush:
+                self.flush()
+            self._wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+        stats = self.stats()
+
+        logger.info(f"Inserted {stats['rows']} rows into {self.collection_name} in {stats['batches']} batches "
+                    f"({stats['rows_per_sec']:.1f} rows/s overall, {stats['insert_rows_per_sec']:.1f} rows/s in Milvus)")
+
+        return stats
+
+    def stats(self) -> Dict:
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+
+        return {
+            "rows": self.rows_inserted,
+            "batches": self.batches_inserted,
+            "elapsed_sec": elapsed,
+            "insert_sec": self.insert_seconds,
+            "rows_per_sec": self.rows_inserted / elapsed if elapsed else 0.0,
+            "insert_rows_per_sec": self.rows_inserted / self.insert_seconds if self.insert_seconds else 0.0
+        }
+
+
+def delete_chunks(milvus_client,
+                  collection_name: str,
+                  doc_id: str,
+                  chunk_hashes: List[str],
+                  batch_size: int = 1000) -> int:
+    """
+    Deletes the rows of `doc_id` whose chunk hash is in `chunk_hashes`, `batch_size` hashes per
+    delete so the filter expression stays small.
+    """
+    n_deleted = 0
+
+    for start in range(0, len(chunk_hashes), batch_size):
+        batch = chunk_hashes[start:start + batch_size]
+
+        result = milvus_client.delete(collection_name=collection_name,
+                                      filter=f"doc_id == {json.dumps(doc_id)} and chunk_hash in {json.dumps(batch)}")
+
+        n_deleted += result.get("delete_count", 0) if isinstance(result, dict) else len(batch)
+
+    return n_deleted
+
+
+def delete_uncommitted(milvus_client, collection_name: str, doc_id: str, committed_hashes: List[str]) -> int:
+    """
+    Deletes the rows of `doc_id` that are not part of its last committed version, i.e. whatever
+    an interrupted ingestion attempt inserted before it failed.
+    """
+    doc_filter = f"doc_id == {json.dumps(doc_id)}"
+
+    if committed_hashes:
+        doc_filter += f" and chunk_hash not in {json.dumps(sorted(committed_hashes))}"
+
+    result = milvus_client.delete(collection_name=collection_name, filter=doc_filter)
+
+    return result.get("delete_count", 0) if isinstance(result, dict) else 0
@@ -0,0 +1,154 @@
+import os
+import threading
+import multiprocessing
+from itertools import chain, islice
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pymupdf
+
+from ..core.utils import get_logger
+from ..core.config import settings
+
+
+logger = get_logger(__name__)
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def _page_count(doc_path: str) -> int:
+    with pymupdf.open(doc_path) as doc:
+        return doc.page_count
+
+
+def _extract_page_range(doc_path: str, first_page: int, last_page: int) -> List[str]:
+    with pymupdf.open(doc_path) as doc:
+        return [doc[page_no].get_text() for page_no in range(first_page, last_page)]
+
+
+def count_pages(doc_paths: List[str]) -> Dict[str, int]:
+    # opening a PDF only reads its page tree, this is cheap next to extracting the text
+    page_counts = {}
+
+    for doc_path in doc_paths:
+        try:
+            page_counts[doc_path] = _page_count(doc_path)
+        except Exception:
+            page_counts[doc_path] = 0
+
+    return page_counts
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    global _extraction_pool
+
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            max_workers = settings.ingestion.extraction_workers or os.cpu_count()
+
+            # spawn instead of fork, workers run inside threaded Celery and uvicorn processes with torch loaded
+            _extraction_pool = ProcessPoolExecutor(max_workers=max_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"))
+
+            logger.info(f"Started PDF extraction pool with {max_workers} processes")
+
+    return _extraction_pool
+
+
+def _reset_extraction_pool() -> None:
+    global _extraction_pool
+
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+class ExtractionError(Exception):
+    """
+    Pages of a document could not be read. The document fails as a whole, ingesting only the
+    pages that could be read would record it as complete and delete the chunks of the others.
+    """
+
+
+def _extract_serially(shards: Iterable[Tuple[str, int, int]]) -> Iterator[Tuple[str, int, str]]:
+    for doc_path, first_page, last_page in shards:
+        try:
+            pages = _extract_page_range(doc_path, first_page, last_page)
+        except Exception as e:
+            raise ExtractionError(f"Failed to extract pages {first_page}-{last_page - 1} of {doc_path}: {e}") from e
+
+        for offset, text in enumerate(pages):
+            yield doc_path, first_page + offset, text
+
+
+def iter_pages(doc_paths: List[str],
+               pages_per_shard: int = None,
+               max_inflight_shards: int = None) -> Iterator[Tuple[str, int, str]]:
+    """
+    Streams `(doc_path, page_no, page_text)` for every page of `doc_paths`, documents one after
+    another and pages in order. Only `max_inflight_shards` shards are extracted ahead of the
+    consumer, so memory stays bounded however large the documents are, while the pool already
+    works on the next document before the current one is consumed.
+
+    Raises `ExtractionError` when a document cannot be opened or a page range not extracted.
+    Where the process pool cannot be used, pages are extracted in-process instead.
+    """
+    pages_per_shard = pages_per_shard or settings.ingestion.pages_per_shard
+    max_inflight_shards = max_inflight_shards or 2 * (settings.ingestion.extraction_workers or os.cpu_count())
+
+    def _shards():
+        for doc_path in doc_paths:
+            try:
+                n_pages = _page_count(doc_path)
+            except Exception as e:
+                raise ExtractionError(f"Failed to open {doc_path}: {e}") from e
+
+            for first_page in range(0, n_pages, pages_per_shard):
+                yield doc_path, first_page, min(first_page + pages_per_shard, n_pages)
+
+    shards = _shards()
+    first_shards = list(islice(shards, max_inflight_shards))
+
+    if not first_shards:
+        return
+
+    # a pool created in a daemonic process, a Celery prefork child, only fails once a shard is
+    # submitted or, with its workers failing to start, once the first result is awaited
+    try:
+        pool = get_extraction_pool()
+        inflight = deque((shard, pool.submit(_extract_page_range, *shard)) for shard in first_shards)
+
+        if isinstance(inflight[0][1].exception(), BrokenProcessPool):
+            raise inflight[0][1].exception()
+    except Exception as e:
+        logger.warning(f"PDF extraction pool unavailable, extracting in-process: {e}")
+        _reset_extraction_pool()
+
+        yield from _extract_serially(chain(first_shards, shards))
+        return
+
+    try:
+        while inflight:
+            (doc_path, first_page, last_page), future = inflight.popleft()
+
+            for shard in islice(shards, 1):
+                inflight.append((shard, pool.submit(_extract_page_range, *shard)))
+
+            try:
+                pages = future.result()
+            except BrokenProcessPool:
+                _reset_extraction_pool()
+                raise
+            except Exception as e:
+                raise ExtractionError(f"Failed to extract pages {first_page}-{last_page - 1} of {doc_path}: {e}") from e
+
+            for offset, text in enumerate(pages):
+                yield doc_path, first_page + offset, text
+
+    finally:
+        for _, future in inflight:
+            future.cancel()
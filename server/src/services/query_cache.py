@@ -0,0 +1,211 @@
+import time
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+from collections import OrderedDict
+
+import numpy as np
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from ..core.dependencies import get_redis_client
+from .embedding_engine import embedding_engine
+from .executors import retrieval_executor
+
+
+logger = get_logger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    # only differences that cannot change the embedding are folded, case is kept
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class QueryEmbeddingCache:
+    """
+    Caches query embeddings by (`Embedders` key, normalized text) in two tiers: an in-process
+    LRU of `max_entries` vectors, and Redis shared by the API servers and Celery workers. Both
+    tiers expire entries after `ttl_sec`, and Redis keeps at most `redis_max_entries` of them,
+    dropping the least recently used.
+
+    Report planning runs on a worker and AI edits on the API server, yet both embed the same
+    report instructions, so the Redis tier is what lets an edit reuse the planning vector. If
+    Redis is unreachable the cache works in-process only.
+    """
+
+    KEY_PREFIX = "smarag:query_embedding"
+
+    def __init__(self, max_entries: int = None, redis_max_entries: int = None, ttl_sec: int = None, redis_client=None):
+        self.max_entries = max_entries or settings.query_cache.max_entries
+        self.redis_max_entries = redis_max_entries or settings.query_cache.redis_max_entries
+        self.ttl_sec = ttl_sec or settings.query_cache.ttl_sec
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_client = redis_client
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    def _key(self, embedding_model: str, text: str) -> str:
+        digest = hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+        return f"{self.KEY_PREFIX}:{embedding_model.lower().strip()}:{digest}"
+
+    def get(self, embedding_model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(embedding_model, [text])[0]
+
+    def get_many(self, embedding_model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Cached embeddings of `texts`, None for those not cached. The ones missing in-process
+        are looked up in Redis in a single round trip.
+        """
+        keys = [self._key(embedding_model, text) for text in texts]
+        embeddings: List[Optional[np.ndarray]] = [None] * len(keys)
+        now = time.time()
+
+        with self._lock:
+            for idx, key in enumerate(keys):
+                entry = self._entries.get(key)
+
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    embeddings[idx] = entry[0]
+                else:
+                    self._entries.pop(key, None)
+
+        missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+
+        if not missing:
+            return embeddings
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.mget([keys[idx] for idx in missing])
+            pipe.zadd(f"{self.KEY_PREFIX}:index", {keys[idx]: now for idx in missing}, xx=True)
+            cached, _ = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Query embedding cache lookup failed: {e}")
+            cached = [None] * len(missing)
+
+        for idx, value in zip(missing, cached):
+            if value is not None:
+                embeddings[idx] = np.frombuffer(value, dtype=np.float32)
+                self._put_local(keys[idx], embeddings[idx])
+
+        with self._lock:
+            self.redis_hits += sum(value is not None for value in cached)
+            self.misses += sum(value is None for value in cached)
+
+        return embeddings
+
+    def put(self, embedding_model: str, text: str, embedding) -> None:
+        self.put_many(embedding_model, [text], [embedding])
+
+    def put_many(self, embedding_model: str, texts: List[str], embeddings) -> None:
+        # one Redis round trip for all of them, plus one to evict if the index grew too large
+        keys = [self._key(embedding_model, text) for text in texts]
+        embeddings = [np.asarray(embedding, dtype=np.float32).ravel() for embedding in embeddings]
+
+        for key, embedding in zip(keys, embeddings):
+            self._put_local(key, embedding)
+
+        if not keys:
+            return
+
+        try:
+            index_key = f"{self.KEY_PREFIX}:index"
+            now = time.time()
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, embedding in zip(keys, embeddings):
+                pipe.set(key, embedding.tobytes(), ex=self.ttl_sec)
+            pipe.zadd(index_key, {key: now for key in keys})
+            pipe.zcard(index_key)
+            *_, n_entries = pipe.execute()
+
+            if n_entries > self.redis_max_entries:
+                evicted = [evicted_key for evicted_key, _ in
+                           self.redis_client.zpopmin(index_key, n_entries - self.redis_max_entries)]
+                if evicted:
+                    self.redis_client.delete(*evicted)
+        except Exception as e:
+            logger.warning(f"Failed to store query embeddings in Redis: {e}")
+
+    def _put_local(self, key: str, embedding: np.ndarray) -> None:
+        # read-only, every caller shares the same array
+        embedding.setflags(write=False)
+
+        with self._lock:
+            self._entries[key] = (embedding, time.time() + self.ttl_sec)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+            }
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+def _cached(embedding_model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+    return query_embedding_cache.get_many(embedding_model, texts)
+
+
+def _fill(embedding_model: str, texts: List[str], embeddings: List[Optional[np.ndarray]], missing: List[int], computed) -> np.ndarray:
+    computed = np.atleast_2d(np.asarray(computed, dtype=np.float32))
+
+    if missing:
+        query_embedding_cache.put_many(embedding_model, [texts[idx] for idx in missing], computed)
+
+    for idx, embedding in zip(missing, computed):
+        embeddings[idx] = embedding
+
+    return np.stack(embeddings)
+
+
+def embed_queries(embedding_model: str, texts: List[str], device: str = None) -> np.ndarray:
+    """
+    Embeddings of `texts`, one row each. The ones not cached yet are encoded by the
+    `embedding_engine` in one request, batched with whatever else is being embedded.
+    """
+    embeddings = _cached(embedding_model, texts)
+    missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+
+    computed = embedding_engine.encode(embedding_model, [texts[idx] for idx in missing], device) if missing else []
+
+    return _fill(embedding_model, texts, embeddings, missing, computed)
+
+
+async def aembed_queries(embedding_model: str, texts: List[str], device: str = None) -> np.ndarray:
+    # the Redis round trips run on the retrieval pool, the encoding on the engine's own thread
+    embeddings = await retrieval_executor.run(_cached, embedding_model, texts)
+    missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+
+    computed = await embedding_engine.aencode(embedding_model, [texts[idx] for idx in missing], device) if missing else []
+
+    return await retrieval_executor.run(_fill, embedding_model, texts, embeddings, missing, computed)
+
+
+def embed_query(embedding_model: str, text: str, device: str = None) -> np.ndarray:
+    return embed_queries(embedding_model, [text], device)[0]
+
+
+async def aembed_query(embedding_model: str, text: str, device: str = None) -> np.ndarray:
+    return (await aembed_queries(embedding_model, [text], device))[0]
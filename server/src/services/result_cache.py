@@ -0,0 +1,138 @@
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.utils import get_logger
+from ..core.config import settings
+from ..core.dependencies import get_redis_client
+
+
+logger = get_logger(__name__)
+
+
+def _plain_hits(hits) -> List[Dict]:
+    # Milvus hits are client objects, only ids, distances and scalar output fields are kept
+    return [{"id": int(hit["id"]),
+             "distance": float(hit["distance"]),
+             "entity": {name: value.item() if isinstance(value, np.generic) else value
+                        for name, value in dict(hit.get("entity") or {}).items()}}
+            for hit in hits]
+
+
+class SearchResultCache:
+    """
+    Caches the hits of one query vector in Redis, keyed by the collection, the `Embedders` key,
+    a hash of the vector and every search parameter that can change the hits. Each entry
+    records the generation of its collection, a counter `bump` raises whenever ingestion has
+    changed the collection; an entry of an older generation is a miss. `ttl_sec` only frees
+    memory, correctness does not depend on it.
+
+    Milvus makes new rows searchable with a short delay, so for `settle_sec` after a bump
+    results are served but not cached, otherwise a search that does not see the new rows yet
+    could be cached as current. The window is a key Redis expires, so it is timed by the Redis
+    server rather than by the clocks of the hosts that bump and search.
+    """
+
+    KEY_PREFIX = "smarag:search_results"
+    GENERATION_PREFIX = "smarag:collection_generation"
+
+    def __init__(self, ttl_sec: int = None, settle_sec: float = None, redis_client=None):
+        self.ttl_sec = ttl_sec or settings.result_cache.ttl_sec
+        self.settle_sec = settings.result_cache.settle_sec if settle_sec is None else settle_sec
+
+        self._redis_client = redis_client
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = get_redis_client()
+        return self._redis_client
+
+    def _key(self, collection_name: str, embedding_model: str, query_embedding: np.ndarray, params: Dict,
+             query_text: str = None) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(query_embedding, dtype=np.float32).tobytes())
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+
+        if query_text is not None:
+            digest.update(query_text.encode("utf-8"))
+
+        return f"{self.KEY_PREFIX}:{collection_name}:{embedding_model}:{digest.hexdigest()}"
+
+    def _generation(self, collection_name: str) -> str:
+        return f"{self.GENERATION_PREFIX}:{collection_name}"
+
+    def get_many(self, collection_name: str, embedding_model: str, query_embeddings: np.ndarray, params: Dict,
+                 query_texts: List[str] = None):
+        """
+        Cached hits of each row of `query_embeddings`, None where there are none, and a token
+        to hand to `put_many` for the rows searched instead. `query_texts` are part of the key
+        when the search also ranks by them.
+        """
+        keys = [self._key(collection_name, embedding_model, query_embedding, params, query_text)
+                for query_embedding, query_text in zip(query_embeddings, query_texts or [None] * len(query_embeddings))]
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(self._generation(collection_name))
+            pipe.exists(f"{self._generation(collection_name)}:settling")
+            for key in keys:
+                pipe.get(key)
+            generation, settling, *entries = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Search result cache lookup failed: {e}")
+            return [None] * len(keys), None
+
+        generation = int(generation or 0)
+        results = []
+
+        for entry in entries:
+            entry = json.loads(entry) if entry else None
+            results.append(entry["hits"] if entry and entry["generation"] == generation else None)
+
+        n_hits = sum(result is not None for result in results)
+        self.hits += n_hits
+        self.misses += len(results) - n_hits
+
+        return results, None if settling else {"keys": keys, "generation": generation}
+
+    def put_many(self, token: Optional[Dict], rows: List[int], results: List) -> None:
+        if token is None:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+
+            # tagged with the generation read before searching, a bump in between makes them stale at once
+            for row, hits in zip(rows, results):
+                pipe.set(token["keys"][row], json.dumps({"generation": token["generation"], "hits": _plain_hits(hits)}),
+                         ex=self.ttl_sec)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to store search results in Redis: {e}")
+
+    def bump(self, collection_name: str) -> None:
+        """
+        Makes the cached results of `collection_name` stale. Raises if Redis cannot be reached:
+        the write that changed the collection has to fail with it, otherwise the old results
+        would be served until they expire.
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.incr(self._generation(collection_name))
+            if self.settle_sec > 0:
+                pipe.set(f"{self._generation(collection_name)}:settling", 1, px=int(self.settle_sec * 1000))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to invalidate cached search results of {collection_name}: {e}")
+            raise
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+search_result_cache = SearchResultCache()
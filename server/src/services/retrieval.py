@@ -0,0 +1,293 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.dependencies import milvus_client
+from ..core.config import GAIEmbeddersCollections, settings
+from .vector_codec import collection_precision, collection_index, decode_vector, encode_vectors, search_params
+from .chunk_metadata import validate_filter, scope_filter
+from .result_cache import search_result_cache
+
+
+HEAD_DIM = 128
+
+# sparse field Milvus fills with the BM25 weights of `text_chunk`, see `milvus_collections.create_chunk_collection`
+BM25_FIELD = "text_sparse"
+
+# "vector" searches the full vectors, "two_stage" gathers candidates on `head_embs` and re-scores them,
+# "fused" merges the vector ranking with the BM25 ranking of the query text by reciprocal rank fusion
+RETRIEVAL_MODES = ("vector", "two_stage", "fused")
+
+# the largest topk Milvus accepts in one search
+MAX_SEARCH_LIMIT = 16384
+
+
+def validate_mode(mode: Optional[str]) -> str:
+    mode = (mode or settings.retrieval.mode).lower().strip()
+
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode}, expected one of {RETRIEVAL_MODES}")
+
+    return mode
+
+
+def validate_candidate_multiplier(candidate_multiplier) -> Optional[int]:
+    # None leaves it to `settings.retrieval.candidate_multiplier`
+    if candidate_multiplier is None:
+        return None
+    if isinstance(candidate_multiplier, bool) or not isinstance(candidate_multiplier, int) or candidate_multiplier < 1:
+        raise ValueError(f"Candidate multiplier should be a positive integer, got {candidate_multiplier}")
+
+    return candidate_multiplier
+
+
+def validate_search_limit(limit: int, mode: str, candidate_multiplier: int = None) -> int:
+    # the "two_stage" and "fused" modes ask Milvus for `limit * candidate_multiplier` candidates per query
+    candidate_multiplier = candidate_multiplier or settings.retrieval.candidate_multiplier
+    search_limit = limit * candidate_multiplier if mode in ("two_stage", "fused") else limit
+
+    if limit < 1 or search_limit > MAX_SEARCH_LIMIT:
+        raise ValueError(f"A search for {limit} hits in the {mode} mode asks Milvus for {search_limit}, "
+                         f"expected between 1 and {MAX_SEARCH_LIMIT}")
+
+    return limit
+
+
+def search_chunks(embedding_model: str,
+                  query_embeddings,
+                  limit: int,
+                  output_fields: List[str] = None,
+                  anns_field: str = "vector_embs",
+                  filter: str = None,
+                  mode: str = None,
+                  candidate_multiplier: int = None,
+                  cache: bool = True,
+                  query_texts: List[str] = None,
+                  owners: List[str] = None) -> List:
+    """
+    Searches the chunk collection of `embedding_model` with one or more float query embeddings,
+    encoding them the way the collection stores its vectors. `filter` is a boolean expression
+    over the chunk metadata, see `chunk_metadata.validate_filter`, and `mode` one of
+    `RETRIEVAL_MODES`, `settings.retrieval.mode` by default. The "fused" mode also needs the
+    `query_texts` the embeddings were computed from. `owners` limits the search to their
+    chunks, and to their partitions of the collection; it is a scope the caller chooses, not
+    a permission check. Queries answered since the collection last changed are served from
+    the `search_result_cache`, unless `cache` is off.
+    """
+    collection_name = GAIEmbeddersCollections.mapping()[embedding_model]
+
+    query_embeddings = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    params = {"limit": limit,
+              "output_fields": output_fields or ["text_chunk"],
+              "anns_field": anns_field,
+              "filter": scope_filter(validate_filter(filter), owners) or "",
+              "mode": validate_mode(mode),
+              "candidate_multiplier": validate_candidate_multiplier(candidate_multiplier)
+                                      or settings.retrieval.candidate_multiplier}
+
+    validate_search_limit(limit, params["mode"], params["candidate_multiplier"])
+
+    if params["mode"] != "fused":
+        query_texts = None
+    elif query_texts is None or len(query_texts) != len(query_embeddings):
+        raise ValueError("The fused retrieval mode needs the text of every query")
+    else:
+        params["rrf_k"] = settings.retrieval.rrf_k
+
+    if not (cache and settings.result_cache.enabled):
+        return _search(collection_name, query_embeddings, query_texts, **params)
+
+    results, token = search_result_cache.get_many(collection_name, embedding_model, query_embeddings, params,
+                                                  query_texts)
+    missing = [idx for idx, hits in enumerate(results) if hits is None]
+
+    if missing:
+        # the queries not cached go to the vector store together
+        searched = _search(collection_name, query_embeddings[missing],
+                           [query_texts[idx] for idx in missing] if query_texts else None,
+                           **params)
+        search_result_cache.put_many(token, missing, searched)
+
+        for idx, hits in zip(missing, searched):
+            results[idx] = hits
+
+    return results
+
+
+def _search(collection_name: str,
+            query_embeddings: np.ndarray,
+            query_texts: Optional[List[str]],
+            limit: int,
+            output_fields: List[str],
+            anns_field: str,
+            filter: str,
+            mode: str,
+            candidate_multiplier: int,
+            rrf_k: int = None) -> List:
+    precision = collection_precision(collection_name)
+
+    if mode == "fused":
+        return _search_fused(collection_name, precision, query_embeddings, query_texts, limit,
+                             output_fields=output_fields,
+                             filter=filter,
+                             candidate_multiplier=candidate_multiplier,
+                             rrf_k=rrf_k)
+
+    if mode == "two_stage":
+        return _search_two_stage(collection_name, precision, query_embeddings, limit,
+                                 output_fields=output_fields,
+                                 filter=filter,
+                                 candidate_multiplier=candidate_multiplier)
+
+    if anns_field == "head_embs":
+        query_embeddings = query_embeddings[:, :HEAD_DIM]
+
+    return milvus_client.search(
+        collection_name=collection_name,
+        anns_field=anns_field,
+        data=encode_vectors(query_embeddings, precision),
+        limit=limit,
+        search_params=search_params(precision, collection_index(collection_name), limit),
+        output_fields=output_fields,
+        filter=filter
+    )
+
+
+def deduplicate_hits(results: List[List[Dict]], limit: int) -> List[List[Dict]]:
+    """
+    Gives every chunk found by several queries to the one it is closest to, keeping at most
+    `limit` hits per query. Hits are assigned best distance first, so a query that loses a chunk
+    moves on to its next candidates; searching `limit * len(results)` per query guarantees each
+    still ends up with `limit` hits where the collection has them.
+    """
+    ranked = sorted(((hit["distance"], query_idx, rank) for query_idx, hits in enumerate(results)
+                     for rank, hit in enumerate(hits)))
+
+    claimed = set()
+    kept: List[List[tuple]] = [[] for _ in results]
+
+    for _, query_idx, rank in ranked:
+        hit = results[query_idx][rank]
+
+        if hit["id"] in claimed or len(kept[query_idx]) >= limit:
+            continue
+
+        claimed.add(hit["id"])
+        kept[query_idx].append((rank, hit))
+
+    return [[hit for _, hit in sorted(hits, key=lambda item: item[0])] for hits in kept]
+
+
+def _stored_vectors(values: List, precision: str) -> np.ndarray:
+    values = [decode_vector(value, precision) for value in values]
+
+    if precision == "binary":
+        return np.unpackbits(np.frombuffer(b"".join(values), dtype=np.uint8).reshape(len(values), -1), axis=1)
+    return np.stack([np.asarray(value) for value in values]).astype(np.float32)
+
+
+def _distances(query_embedding: np.ndarray, candidates: np.ndarray, precision: str) -> np.ndarray:
+    # the metric Milvus would report for the full vectors, squared L2 or hamming on sign codes
+    if precision == "binary":
+        return (candidates != (query_embedding > 0)).sum(axis=1).astype(np.float32)
+    return ((candidates - query_embedding) ** 2).sum(axis=1)
+
+
+def _search_two_stage(collection_name: str,
+                      precision: str,
+                      query_embeddings: np.ndarray,
+                      limit: int,
+                      output_fields: List[str],
+                      filter: str,
+                      candidate_multiplier: int) -> List:
+    """
+    Searches `head_embs` for `limit * candidate_multiplier` candidates per query, re-ranks them
+    by their distance on the full `vector_embs` and fetches the output fields of the best
+    `limit` only. Returns hits shaped like `milvus_client.search`.
+    """
+    candidates = milvus_client.search(
+        collection_name=collection_name,
+        anns_field="head_embs",
+        data=encode_vectors(query_embeddings[:, :HEAD_DIM], precision),
+        limit=limit * candidate_multiplier,
+        search_params=search_params(precision, collection_index(collection_name), limit * candidate_multiplier),
+        output_fields=["vector_embs"],
+        filter=filter
+    )
+
+    ranked = []
+
+    for query_embedding, hits in zip(query_embeddings, candidates):
+        if not hits:
+            ranked.append([])
+            continue
+
+        distances = _distances(query_embedding,
+                               _stored_vectors([hit["entity"]["vector_embs"] for hit in hits], precision),
+                               precision)
+        best = np.argsort(distances, kind="stable")[:limit]
+
+        ranked.append([(hits[idx]["id"], float(distances[idx])) for idx in best])
+
+    ids = sorted({hit_id for hits in ranked for hit_id, _ in hits})
+    entities: Dict = {}
+
+    if ids:
+        for row in milvus_client.get(collection_name=collection_name, ids=ids, output_fields=output_fields):
+            entities[row["id"]] = {name: row[name] for name in output_fields if name in row}
+
+    return [[{"id": hit_id, "distance": distance, "entity": entities.get(hit_id, {})} for hit_id, distance in hits]
+            for hits in ranked]
+
+
+def _search_fused(collection_name: str,
+                  precision: str,
+                  query_embeddings: np.ndarray,
+                  query_texts: List[str],
+                  limit: int,
+                  output_fields: List[str],
+                  filter: str,
+                  candidate_multiplier: int,
+                  rrf_k: int) -> List:
+    """
+    Ranks `limit * candidate_multiplier` candidates per query by vector search and by BM25 on
+    `BM25_FIELD`, and keeps the best `limit` by reciprocal rank fusion. Both rankings are
+    searches of the collection itself, so every fused hit is a stored chunk and `limit` hits
+    come back wherever the vector search alone would find them. Hits are shaped like
+    `milvus_client.search`, with the negated fused score as distance so that lower still ranks first.
+    """
+    n_candidates = limit * candidate_multiplier
+
+    vector_hits = milvus_client.search(
+        collection_name=collection_name,
+        anns_field="vector_embs",
+        data=encode_vectors(query_embeddings, precision),
+        limit=n_candidates,
+        search_params=search_params(precision, collection_index(collection_name), n_candidates),
+        output_fields=output_fields,
+        filter=filter
+    )
+    lexical_hits = milvus_client.search(
+        collection_name=collection_name,
+        anns_field=BM25_FIELD,
+        data=list(query_texts),
+        limit=n_candidates,
+        search_params={"metric_type": "BM25"},
+        output_fields=output_fields,
+        filter=filter
+    )
+
+    results = []
+
+    for hits, lexical in zip(vector_hits, lexical_hits):
+        scores, entities = {}, {}
+
+        for ranking in (hits, lexical):
+            for rank, hit in enumerate(ranking):
+                scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (rrf_k + rank + 1)
+                entities.setdefault(hit["id"], hit["entity"])
+
+        results.append([{"id": id, "distance": -score, "entity": dict(entities[id])}
+                        for id, score in sorted(scores.items(), key=lambda item: -item[1])[:limit]])
+
+    return results
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+from uuid import uuid4
+from typing import Dict, Iterable, Iterator
+
+from ..core.utils import get_logger, make_directories, delete_file
+from ..core.config import settings
+from .ingestion_pipeline import DocumentEnd
+
+
+logger = get_logger(__name__)
+
+
+def host_queue(hostname: str) -> str:
+    """
+    Celery queue only the worker `hostname` consumes. The cache lives on the worker's own disk,
+    so the tasks that should read back what a worker cached are sent there.
+    """
+    return f"sentences.{hostname}"
+
+
+class SentenceCache:
+    """
+    Disk cache of sentence-split documents, keyed by file hash.
+
+    Extraction and sentence splitting do not depend on the embedding model, so the first model
+    to ingest a document writes its sentence stream here and every other model reads it back
+    instead of opening the PDF again. Entries are JSON lines of `[sentence, page_no]`, written
+    under a temporary name and renamed once the document is complete.
+    """
+
+    def __init__(self, cache_dir: str = None, ttl_sec: int = None):
+        self.cache_dir = cache_dir or settings.sentence_cache_path
+        self.ttl_sec = ttl_sec or settings.ingestion.sentence_cache_ttl_sec
+
+        make_directories([self.cache_dir])
+
+    def _path(self, doc_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{doc_hash}.jsonl")
+
+    def has(self, doc_hash: str) -> bool:
+        return os.path.exists(self._path(doc_hash))
+
+    def read(self, doc_path: str, doc_hash: str) -> Iterator:
+        # reads count as use, the ttl only drops documents nobody ingested recently
+        os.utime(self._path(doc_hash))
+
+        with open(self._path(doc_hash), "r", encoding="utf-8") as fptr:
+            for line in fptr:
+                sentence, page_no = json.loads(line)
+                yield doc_path, sentence, page_no
+
+        yield DocumentEnd(doc_path)
+
+    def write_through(self, sentences: Iterable, doc_hashes: Dict[str, str]) -> Iterator:
+        """
+        Passes a `split_sentences` stream through unchanged while storing each document in the cache.
+        """
+        fptr, part_path = None, None
+
+        try:
+            for item in sentences:
+                if isinstance(item, DocumentEnd):
+                    # documents without any text are cached too, as an empty entry
+                    if fptr is None:
+                        fptr, part_path = self._open_part(doc_hashes[item.doc_path])
+
+                    fptr.close()
+                    os.replace(part_path, self._path(doc_hashes[item.doc_path]))
+                    fptr, part_path = None, None
+
+                    yield item
+                    continue
+
+                doc_path, sentence, page_no = item
+
+                if fptr is None:
+                    fptr, part_path = self._open_part(doc_hashes[doc_path])
+
+                fptr.write(json.dumps([sentence, page_no]) + "\n")
+                yield item
+        finally:
+            # an aborted stream must not leave a partial document behind
+            if fptr is not None:
+                fptr.close()
+                delete_file(part_path)
+
+        self.prune()
+
+    def _open_part(self, doc_hash: str):
+        part_path = self._path(doc_hash) + f".{uuid4().hex}.part"
+        return open(part_path, "w", encoding="utf-8"), part_path
+
+    def prune(self) -> None:
+        cutoff = time.time() - self.ttl_sec
+
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    delete_file(entry.path)
+            except OSError as e:
+                logger.warning(f"Failed to prune sentence cache entry {entry.path}: {e}")
@@ -0,0 +1,126 @@
+import os
+import asyncio
+import hashlib
+from uuid import uuid4
+from typing import List, Tuple
+
+import anyio
+from anyio import to_thread
+from fastapi import UploadFile
+
+from ..core.utils import get_logger, store_by_hash, delete_file
+from ..core.config import settings
+
+
+logger = get_logger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+PDF_EOF = b"%%EOF"
+
+# the PDF header may follow some leading junk, the end marker some trailing whitespace
+_HEADER_WINDOW = 1024
+_TRAILER_WINDOW = 1024
+
+_io_limiter = None
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def _get_io_limiter() -> anyio.CapacityLimiter:
+    global _io_limiter
+
+    # own limiter instead of the default thread pool, upload bursts must not starve other endpoints
+    if _io_limiter is None:
+        _io_limiter = anyio.CapacityLimiter(settings.uploads.io_threads)
+    return _io_limiter
+
+
+class _PdfStreamWriter:
+    """
+    Writes an upload to a temporary file while hashing it and checking that it looks like a PDF,
+    all in the one pass over the bytes. Every method runs on an I/O thread.
+    """
+
+    def __init__(self, target_dir: str):
+        self.part_path = os.path.join(target_dir, f".{uuid4().hex}.part")
+        self.fptr = open(self.part_path, "wb")
+
+        self.file_hash = hashlib.md5()
+        self.n_bytes = 0
+        self.head = b""
+        self.tail = b""
+
+    def write(self, data: bytes) -> None:
+        if len(self.head) < _HEADER_WINDOW:
+            self.head = (self.head + data)[:_HEADER_WINDOW]
+
+            if len(self.head) >= len(PDF_MAGIC) and PDF_MAGIC not in self.head:
+                raise InvalidUpload("The file is not a PDF")
+
+        self.tail = (self.tail + data)[-_TRAILER_WINDOW:]
+        self.n_bytes += len(data)
+
+        if self.n_bytes > settings.uploads.max_file_bytes:
+            raise InvalidUpload(f"The file is larger than {settings.uploads.max_file_bytes} bytes")
+
+        self.file_hash.update(data)
+        self.fptr.write(data)
+
+    def commit(self, target_dir: str) -> Tuple[str, str]:
+        if PDF_MAGIC not in self.head or PDF_EOF not in self.tail:
+            raise InvalidUpload("The file is not a complete PDF")
+
+        self.fptr.flush()
+        os.fsync(self.fptr.fileno())
+        self.fptr.close()
+
+        # the temporary file only becomes visible under its final name once it is complete
+        return store_by_hash(self.part_path, target_dir, file_hash=self.file_hash.hexdigest())
+
+    def abort(self) -> None:
+        self.fptr.close()
+        delete_file(self.part_path)
+
+
+async def save_upload(file: UploadFile, target_dir: str) -> Tuple[str, str]:
+    """
+    Streams `file` into `target_dir` as `<md5>.pdf` without blocking the event loop and returns
+    `(doc_path, file_hash)`. Raises `InvalidUpload` if the file is not a PDF.
+    """
+    limiter = _get_io_limiter()
+    writer = await to_thread.run_sync(_PdfStreamWriter, target_dir, limiter=limiter)
+
+    try:
+        while data := await file.read(settings.uploads.read_chunk_bytes):
+            await to_thread.run_sync(writer.write, data, limiter=limiter)
+
+        return await to_thread.run_sync(writer.commit, target_dir, limiter=limiter)
+    except BaseException:
+        await to_thread.run_sync(writer.abort, limiter=limiter)
+        raise
+    finally:
+        await file.close()
+
+
+async def save_uploads(files: List[UploadFile], target_dir: str) -> List[Tuple[str, str]]:
+    """
+    Saves several uploads concurrently, at most `max_concurrent_files` at a time, keeping the
+    order of `files`. If any of them fails the others are cancelled and cleaned up.
+    """
+    semaphore = asyncio.Semaphore(settings.uploads.max_concurrent_files)
+
+    async def _save(file: UploadFile):
+        async with semaphore:
+            return await save_upload(file, target_dir)
+
+    tasks = [asyncio.create_task(_save(file)) for file in files]
+
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,169 @@
+from typing import Dict, List
+
+import numpy as np
+
+from ..core.config import settings
+
+
+PRECISIONS = ("float32", "float16", "int8", "binary")
+
+# build and search parameters used where a collection's "index" leaves them out
+ANN_INDEXES = {
+    "FLAT": ({}, {}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_PQ": ({"nlist": 1024, "nbits": 8}, {"nprobe": 16}),
+    "DISKANN": ({}, {"search_list": 100}),
+}
+
+# the most partitions Milvus 2.5 allows per collection
+MAX_PARTITIONS = 1024
+
+# Milvus 2.5 has no int8 vector field, int8 collections keep float32 rows and search a scalar-quantized index
+_INT8_NLIST = 128
+_INT8_NPROBE = 16
+
+
+def collection_precision(collection_name: str) -> str:
+    precision = settings.milvus.collection(collection_name).get("precision", "float32")
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown vector precision {precision} for {collection_name}, expected one of {PRECISIONS}")
+
+    return precision
+
+
+def collection_partitions(collection_name: str) -> int:
+    """
+    Number of partitions `owner` is hashed into as partition key of `collection_name`, 0 when the
+    collection is not partitioned.
+    """
+    partitions = int(settings.milvus.collection(collection_name).get("partitions") or 0)
+
+    if not 0 <= partitions <= MAX_PARTITIONS:
+        raise ValueError(f"{collection_name} is configured with {partitions} partitions, expected 0 to {MAX_PARTITIONS}")
+
+    return partitions
+
+
+def collection_index(collection_name: str) -> Dict:
+    """
+    The ANN index configured for the vector fields of `collection_name`, as
+    `{"type": ..., "build": {...}, "search": {...}}` with the defaults of `ANN_INDEXES` filled in.
+    int8 and binary collections have their index fixed by the precision and only accept FLAT.
+    """
+    index = settings.milvus.collection(collection_name).get("index") or {}
+    index_type = index.get("type", "FLAT").upper()
+
+    if index_type not in ANN_INDEXES:
+        raise ValueError(f"Unknown index type {index_type} for {collection_name}, expected one of {tuple(ANN_INDEXES)}")
+
+    precision = collection_precision(collection_name)
+
+    if index_type != "FLAT" and precision in ("int8", "binary"):
+        raise ValueError(f"{collection_name} stores {precision} vectors, whose index follows from the precision; "
+                         f"{index_type} needs float32 or float16")
+
+    build, search = ANN_INDEXES[index_type]
+
+    return {"type": index_type,
+            "build": {**build, **index.get("build", {})},
+            "search": {**search, **index.get("search", {})}}
+
+
+def vector_datatype(precision: str):
+    from pymilvus import DataType
+
+    return {
+        "float32": DataType.FLOAT_VECTOR,
+        "float16": DataType.FLOAT16_VECTOR,
+        "int8": DataType.FLOAT_VECTOR,
+        "binary": DataType.BINARY_VECTOR,
+    }[precision]
+
+
+def metric_type(precision: str) -> str:
+    return "HAMMING" if precision == "binary" else "L2"
+
+
+def index_params(precision: str, index: Dict = None, dim: int = None) -> Dict:
+    """
+    Keyword arguments for `IndexParams.add_index` of a vector field stored with `precision`,
+    `index` as returned by `collection_index`. IVF_PQ splits each vector into `m` sub-vectors,
+    which defaults to one per 16 dimensions of the field and has to divide `dim`.
+    """
+    if precision == "binary":
+        return {"index_type": "BIN_FLAT", "metric_type": "HAMMING"}
+    if precision == "int8":
+        return {"index_type": "IVF_SQ8", "metric_type": "L2", "params": {"nlist": _INT8_NLIST}}
+
+    if index is None or index["type"] == "FLAT":
+        return {"index_type": "FLAT", "metric_type": "L2"}
+
+    params = dict(index["build"])
+
+    if index["type"] == "IVF_PQ":
+        params.setdefault("m", dim // 16)
+
+        if dim % params["m"]:
+            raise ValueError(f"IVF_PQ needs m to divide the vector dimension, {params['m']} does not divide {dim}")
+
+    return {"index_type": index["type"], "metric_type": "L2", "params": params}
+
+
+def search_params(precision: str, index: Dict = None, limit: int = None) -> Dict:
+    if precision == "int8":
+        return {"metric_type": "L2", "params": {"nprobe": _INT8_NPROBE}}
+
+    if index is None or index["type"] == "FLAT":
+        return {"metric_type": metric_type(precision)}
+
+    params = dict(index["search"])
+
+    # both candidate lists have to hold at least the `limit` results asked for
+    if limit and "ef" in params:
+        params["ef"] = max(params["ef"], limit)
+    if limit and "search_list" in params:
+        params["search_list"] = max(params["search_list"], limit)
+
+    return {"metric_type": "L2", "params": params}
+
+
+def encode_vectors(embeddings, precision: str) -> List:
+    """
+    Converts float embeddings, one per row, into what `milvus_client.insert` and `search` expect
+    for a field stored with `precision`. Binary codes keep the sign of each dimension, packed
+    eight dimensions to a byte.
+    """
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+
+    if precision == "binary":
+        return [code.tobytes() for code in np.packbits(embeddings > 0, axis=1)]
+    if precision == "float16":
+        return list(embeddings.astype(np.float16))
+    return list(embeddings)
+
+
+def decode_vector(value, precision: str):
+    """
+    Turns a vector read back by `milvus_client.query` or `search` into what `insert` expects.
+    pymilvus returns float16 and binary vectors as a list holding their raw bytes; the float16
+    ones become arrays again and binary codes stay bytes.
+    """
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], bytes):
+        value = value[0]
+    if precision == "float16" and isinstance(value, bytes):
+        return np.frombuffer(value, dtype=np.float16)
+    return value
+
+
+def bytes_per_vector(dim: int, precision: str) -> int:
+    """
+    Memory of one vector in a loaded index, which is what the precision trades recall for.
+    """
+    return {
+        "float32": 4 * dim,
+        "float16": 2 * dim,
+        "int8": dim,
+        "binary": (dim + 7) // 8,
+    }[precision]
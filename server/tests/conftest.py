@@ -0,0 +1,24 @@
+"""
+The services under test only need numpy, so the modules that pull in torch, the PDF stack and
+the Celery, Mongo and Redis clients are replaced before anything imports them. Tests that touch
+Milvus patch it in `server.src.services.retrieval` with a fake.
+"""
+import sys
+import types
+import logging
+
+
+def _module(name: str, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _no_redis():
+    raise ConnectionError("Redis is not available in tests")
+
+
+sys.modules.setdefault("server.src.core.utils", _module("server.src.core.utils", get_logger=logging.getLogger))
+sys.modules.setdefault("server.src.core.dependencies", _module("server.src.core.dependencies",
+                                                               milvus_client=None,
+                                                               get_redis_client=_no_redis))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from server.src.services.retrieval import MAX_SEARCH_LIMIT, deduplicate_hits, validate_search_limit
+
+
+def hit(id: int, distance: float, **entity) -> dict:
+    return {"id": id, "distance": distance, "entity": entity}
+
+
+def test_deduplicate_hits_gives_shared_chunks_to_the_closest_query():
+    results = [[hit(1, 0.1), hit(2, 0.2), hit(3, 0.3)],
+               [hit(2, 0.05), hit(1, 0.4), hit(4, 0.5)]]
+
+    kept = deduplicate_hits(results, limit=2)
+
+    assert [[h["id"] for h in hits] for hits in kept] == [[1, 3], [2, 4]]
+
+
+def test_deduplicate_hits_keeps_rank_order_and_limit():
+    results = [[hit(5, 0.3), hit(6, 0.1), hit(7, 0.2)], []]
+
+    kept = deduplicate_hits(results, limit=2)
+
+    # the best two by distance, in the order the search returned them
+    assert [[h["id"] for h in hits] for hits in kept] == [[6, 7], []]
+
+
+def test_deduplicate_hits_never_returns_a_chunk_twice():
+    rng = np.random.default_rng(0)
+    results = [[hit(int(id), float(distance)) for id, distance in zip(rng.choice(30, 10, replace=False), rng.random(10))]
+               for _ in range(5)]
+
+    ids = [h["id"] for hits in deduplicate_hits(results, limit=4) for h in hits]
+
+    assert len(ids) == len(set(ids))
+
+
+@pytest.mark.parametrize("limit, mode, candidate_multiplier", [
+    (3, "vector", 10),
+    (MAX_SEARCH_LIMIT, "vector", 10),
+    (64 * 3, "fused", 10),
+    (MAX_SEARCH_LIMIT // 4, "two_stage", 4),
+])
+def test_validate_search_limit_accepts_what_milvus_can_search(limit, mode, candidate_multiplier):
+    assert validate_search_limit(limit, mode, candidate_multiplier) == limit
+
+
+@pytest.mark.parametrize("limit, mode, candidate_multiplier", [
+    (0, "vector", 10),
+    (MAX_SEARCH_LIMIT + 1, "vector", 1),
+    # a deduplicated batch of 64 queries for 30 hits each, with ten candidates per hit
+    (64 * 30, "two_stage", 10),
+    (MAX_SEARCH_LIMIT // 4 + 1, "fused", 4),
+])
+def test_validate_search_limit_rejects_searches_beyond_the_milvus_topk(limit, mode, candidate_multiplier):
+    with pytest.raises(ValueError):
+        validate_search_limit(limit, mode, candidate_multiplier)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from server.src.services.chunking import StreamingChunker, chunk_spans, compute_chunks
+
+
+# the chunker `services.chunking` replaced, as in `benchmarks.chunking` less the unused token lists
+def legacy_compute_chunks(inputs, text_sents, chunk_size_approx=256, overlap_tokens=20):
+    start_idx = 0
+
+    out_texts = []
+    added_idxs = set()
+
+    while start_idx < len(inputs["input_ids"]):
+        curr_len = len(inputs["input_ids"][start_idx])
+        temp_txts = [text_sents[start_idx]]
+        temp_idxs = [start_idx]
+
+        while start_idx+1<len(inputs["input_ids"]) and curr_len <= chunk_size_approx:
+            start_idx += 1
+
+            temp_txts.append(text_sents[start_idx])
+            temp_idxs.append(start_idx)
+
+            curr_len += len(inputs["input_ids"][start_idx])
+
+        if tuple(temp_idxs) not in added_idxs:
+            out_texts.append(temp_txts)
+            added_idxs.add(tuple(temp_idxs))
+        else:
+            start_idx += 1
+            continue
+
+        if start_idx+1 >= len(inputs["input_ids"]):
+            break
+
+        if len(inputs["input_ids"][start_idx]) >= chunk_size_approx:
+            start_idx += 1
+            continue
+
+        curr_overlap_size = 0
+
+        while start_idx > 0 and curr_overlap_size <= overlap_tokens:
+            start_idx -= 1
+            curr_overlap_size += len(inputs["input_ids"][start_idx])
+
+    return out_texts
+
+
+def _document(seed: int, n_sents: int, max_len: int):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, max_len, size=n_sents).tolist()
+
+    inputs = {"input_ids": [[0] * length for length in lengths]}
+    sentences = [f"sentence {idx}" for idx in range(n_sents)]
+
+    return inputs, sentences, lengths
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(256, 20), (64, 0), (32, 40), (100, 99), (8, 8)])
+@pytest.mark.parametrize("seed", range(20))
+def test_compute_chunks_matches_legacy(seed, chunk_size, overlap):
+    # up to 3x the chunk size, so single sentences over the limit are covered too
+    inputs, sentences, _ = _document(seed, n_sents=int(np.random.default_rng(seed).integers(0, 300)),
+                                     max_len=3 * chunk_size)
+
+    assert compute_chunks(inputs, sentences, chunk_size, overlap) == \
+        legacy_compute_chunks(inputs, sentences, chunk_size, overlap)
+
+
+def test_compute_chunks_of_nothing():
+    assert compute_chunks({"input_ids": []}, []) == legacy_compute_chunks({"input_ids": []}, []) == []
+
+
+def test_compute_chunks_uses_tokenizer_lengths():
+    inputs, sentences, lengths = _document(0, n_sents=50, max_len=80)
+
+    assert compute_chunks({**inputs, "length": lengths}, sentences, 64, 10) == \
+        legacy_compute_chunks(inputs, sentences, 64, 10)
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(256, 20), (32, 31), (8, 7)])
+@pytest.mark.parametrize("seed", range(10))
+def test_streaming_chunker_matches_whole_document(seed, chunk_size, overlap):
+    _, sentences, lengths = _document(seed, n_sents=400, max_len=2 * chunk_size)
+    pages = [idx // 7 for idx in range(len(sentences))]
+
+    chunker = StreamingChunker(chunk_size, overlap, block_tokens=chunk_size)
+    chunks = []
+
+    for start in range(0, len(sentences), 7):
+        chunks += chunker.add(sentences[start:start + 7], lengths[start:start + 7], pages[start:start + 7])
+    chunks += chunker.finish()
+
+    spans = chunk_spans(lengths, chunk_size, overlap)
+
+    assert [chunk.sentences for chunk in chunks] == [sentences[start:end + 1] for start, end in spans]
+    assert [(chunk.first_page, chunk.last_page) for chunk in chunks] == [(pages[start], pages[end]) for start, end in spans]
+
+
+def test_streaming_chunker_rejects_overlap_as_long_as_chunk():
+    with pytest.raises(ValueError):
+        StreamingChunker(32, 32)
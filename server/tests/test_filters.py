@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from server.src.services.chunk_metadata import document_metadata, infer_year, validate_filter
+from server.src.services.filter_expressions import compile_filter
+
+
+ROWS = {
+    "doc_id": np.array(["acme/report_2021.pdf", "acme/report_2023.pdf", "globex/esg_2023.pdf", "initech/2024.pdf"]),
+    "company": np.array(["acme", "acme", "globex", "initech"]),
+    "owner": np.array(["alice", "alice", "bob", ""]),
+    "year": np.array([2021, 2023, 2023, 2024]),
+    "page_start": np.array([1, 4, 10, 2]),
+    "page_end": np.array([3, 4, 12, 2]),
+}
+
+
+def matching(expr: str) -> list:
+    return np.flatnonzero(compile_filter(expr)(ROWS.__getitem__)).tolist()
+
+
+@pytest.mark.parametrize("doc_id, year", [
+    ("acme_sustainability_report_2023.pdf", 2023),
+    ("acme/report_2022-2023.pdf", 2023),
+    ("reports/2021/acme_report.pdf", None),
+    ("3f2a20199c/acme_esg.pdf", None),
+    ("acme_2099_outlook.pdf", None),
+    ("", None),
+])
+def test_infer_year_reads_the_file_name(doc_id, year):
+    assert infer_year(doc_id) == year
+
+
+def test_document_metadata_fills_missing_values():
+    assert document_metadata("acme/report_2021.pdf", company=" acme ") == \
+        {"doc_id": "acme/report_2021.pdf", "company": "acme", "owner": "", "year": 2021}
+    assert document_metadata("acme/report.pdf", owner="alice", year=2019)["year"] == 2019
+    assert document_metadata("acme/report.pdf")["year"] == 0
+
+
+@pytest.mark.parametrize("expr", [
+    'company == "acme" and year >= 2022',
+    "year in [2022, 2023] or not (page_start < 5)",
+    "doc_id like 'acme/%'",
+    '  owner != ""  ',
+])
+def test_validate_filter_accepts_metadata_expressions(expr):
+    assert validate_filter(expr) == expr.strip()
+
+
+@pytest.mark.parametrize("expr", [None, "", "   "])
+def test_validate_filter_treats_blank_as_no_filter(expr):
+    assert validate_filter(expr) is None
+
+
+@pytest.mark.parametrize("expr", [
+    'text_chunk like "%scope 3%"',
+    "vector_embs != []",
+    "id > 0",
+    'company == "acme"; drop',
+    "year >= 2022 || year < 2000",
+])
+def test_validate_filter_rejects_other_fields_and_syntax(expr):
+    with pytest.raises(ValueError):
+        validate_filter(expr)
+
+
+def test_validate_filter_ignores_field_names_in_literals():
+    assert validate_filter('company == "text_chunk; id"') == 'company == "text_chunk; id"'
+
+
+@pytest.mark.parametrize("expr, rows", [
+    ('company == "acme"', [0, 1]),
+    ("year >= 2023", [1, 2, 3]),
+    ("2023 <= year", [1, 2, 3]),
+    ('company == "acme" and year >= 2022', [1]),
+    ('company == "globex" or year < 2022', [0, 2]),
+    ('company == "acme" or company == "globex" and year == 2021', [0, 1]),
+    ('(company == "acme" or company == "globex") and year == 2023', [1, 2]),
+    ('not company == "acme"', [2, 3]),
+    ('company in ["globex", "initech"]', [2, 3]),
+    ('owner not in ["alice"]', [2, 3]),
+    ("doc_id like 'acme/%'", [0, 1]),
+    ('doc_id like "%_2023.pdf"', [1, 2]),
+    ('owner == ""', [3]),
+])
+def test_compile_filter(expr, rows):
+    assert matching(expr) == rows
+
+
+@pytest.mark.parametrize("expr", [
+    'company == "acme" and',
+    "year >=",
+    "(year > 2020",
+    "year > 2020)",
+    "company like 2020",
+    "year ~ 2020",
+    # fields are only compared with literals
+    "page_start == page_end",
+])
+def test_compile_filter_rejects_malformed_expressions(expr):
+    with pytest.raises(ValueError):
+        compile_filter(expr)
+
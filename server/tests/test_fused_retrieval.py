@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from server.src.services import retrieval
+
+
+def hit(id: int, distance: float, **entity) -> dict:
+    return {"id": id, "distance": distance, "entity": entity}
+
+
+class FakeMilvus:
+    def __init__(self, vector_hits, lexical_hits):
+        self.hits = {"vector_embs": vector_hits, retrieval.BM25_FIELD: lexical_hits}
+        self.searches = []
+
+    def search(self, collection_name, data, limit, anns_field, filter, output_fields, **kwargs):
+        self.searches.append((anns_field, list(data) if anns_field == retrieval.BM25_FIELD else len(data), limit, filter))
+        assert len(data) == len(self.hits[anns_field])
+
+        return [[{**hit, "entity": {name: hit["entity"][name] for name in output_fields}} for hit in hits[:limit]]
+                for hits in self.hits[anns_field]]
+
+
+def chunk(id: int, distance: float = 0.0) -> dict:
+    return hit(id, distance, text_chunk=f"text {id}", doc_id=f"doc {id % 3}")
+
+
+def search_fused(monkeypatch, vector_hits, lexical_hits, limit=3, output_fields=("text_chunk",), filter="", rrf_k=60):
+    milvus = FakeMilvus(vector_hits, lexical_hits)
+
+    monkeypatch.setattr(retrieval, "milvus_client", milvus)
+    monkeypatch.setattr(retrieval, "collection_index", lambda collection_name: {"type": "FLAT"})
+
+    results = retrieval._search_fused("CHUNKS", "float32", np.zeros((len(vector_hits), 4), dtype=np.float32),
+                                      [f"query {idx}" for idx in range(len(vector_hits))], limit,
+                                      output_fields=list(output_fields),
+                                      filter=filter,
+                                      candidate_multiplier=2,
+                                      rrf_k=rrf_k)
+    return results, milvus
+
+
+def test_search_fused_ranks_by_reciprocal_rank_fusion(monkeypatch):
+    vector_hits = [[chunk(1), chunk(2), chunk(3)]]
+    lexical_hits = [[chunk(3, 9.5), chunk(2, 4.0)]]
+
+    results, _ = search_fused(monkeypatch, vector_hits, lexical_hits, rrf_k=60)
+
+    # 3: 1/63 + 1/61, 2: 1/62 + 1/62, 1: 1/61
+    assert [h["id"] for h in results[0]] == [3, 2, 1]
+    assert results[0][0]["distance"] == pytest.approx(-(1 / 63 + 1 / 61))
+    assert results[0][1]["distance"] == pytest.approx(-(1 / 62 + 1 / 62))
+    assert results[0][2]["distance"] == pytest.approx(-1 / 61)
+
+
+def test_search_fused_returns_chunks_only_the_lexical_ranking_found(monkeypatch):
+    results, _ = search_fused(monkeypatch, [[chunk(1)]], [[chunk(9, 3.0), chunk(1, 1.0)]])
+
+    assert [h["id"] for h in results[0]] == [1, 9]
+    assert results[0][1]["entity"] == {"text_chunk": "text 9"}
+
+
+def test_search_fused_returns_limit_hits_where_the_vector_search_has_them(monkeypatch):
+    vector_hits = [[chunk(idx) for idx in range(10)]]
+
+    results, _ = search_fused(monkeypatch, vector_hits, [[]], limit=3)
+
+    assert [h["id"] for h in results[0]] == [0, 1, 2]
+
+
+def test_search_fused_returns_only_the_requested_fields(monkeypatch):
+    results, _ = search_fused(monkeypatch, [[chunk(1)]], [[]])
+
+    assert results == [[{"id": 1, "distance": pytest.approx(-1 / 61), "entity": {"text_chunk": "text 1"}}]]
+
+
+def test_search_fused_keeps_queries_apart_and_applies_limit(monkeypatch):
+    vector_hits = [[chunk(idx) for idx in range(6)],
+                   [chunk(idx) for idx in reversed(range(6))]]
+    lexical_hits = [[], [chunk(3)]]
+
+    results, milvus = search_fused(monkeypatch, vector_hits, lexical_hits, limit=2, filter='year >= 2023')
+
+    assert [[h["id"] for h in hits] for hits in results] == [[0, 1], [3, 5]]
+    # both rankings draw limit * candidate_multiplier candidates under the same filter
+    assert milvus.searches == [("vector_embs", 2, 4, 'year >= 2023'),
+                               (retrieval.BM25_FIELD, ["query 0", "query 1"], 4, 'year >= 2023')]
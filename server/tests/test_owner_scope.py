@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from server.src.services.chunk_metadata import validate_filter, validate_owners, scope_filter
+from server.src.services.filter_expressions import compile_filter
+
+
+ROWS = {
+    "company": np.array(["acme", "acme", "globex", "initech"]),
+    "owner": np.array(["alice", "alice", "bob", ""]),
+    "year": np.array([2021, 2023, 2023, 2024]),
+}
+
+
+def matching(expr: str) -> list:
+    return np.flatnonzero(compile_filter(expr)(ROWS.__getitem__)).tolist()
+
+
+@pytest.mark.parametrize("owners, expected", [
+    (None, None),
+    ("alice", ["alice"]),
+    (["alice", "bob"], ["alice", "bob"]),
+    ([], []),
+])
+def test_validate_owners(owners, expected):
+    assert validate_owners(owners) == expected
+
+
+@pytest.mark.parametrize("owners", [42, ["alice", 7], {"owner": "alice"}])
+def test_validate_owners_rejects_anything_but_strings(owners):
+    with pytest.raises(ValueError):
+        validate_owners(owners)
+
+
+def test_scope_filter():
+    assert scope_filter(None, None) is None
+    assert scope_filter("year > 2020", []) == "year > 2020"
+    assert scope_filter(None, ["bob", " alice", "bob"]) == 'owner in ["alice", "bob"]'
+    assert scope_filter("year > 2020", ["alice"]) == 'owner in ["alice"] and (year > 2020)'
+
+
+def test_scope_filter_keeps_the_filter_precedence():
+    expr = scope_filter(validate_filter('year == 2021 or company == "globex"'), ["alice"])
+
+    # the scope applies to both alternatives of the filter
+    assert matching(expr) == [0]
+
+
+def test_scope_filter_agrees_with_validated_filter():
+    expr = scope_filter(validate_filter("year >= 2023"), ["alice", "bob"])
+
+    assert matching(expr) == [1, 2]
@@ -0,0 +1,86 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from server.src.core.config import settings
+from server.src.services import milvus_collections
+from server.src.services.local_vector_store import LocalVectorStore
+from server.src.services.milvus_collections import _copy_rows, _replay_deletes, create_chunk_collection
+from server.src.services.milvus_writer import delete_chunks
+from server.src.services.vector_codec import decode_vector, encode_vectors
+
+
+COLLECTION = settings.milvus.collections[0]
+
+
+@pytest.fixture(params=["float32", "float16", "binary"])
+def precision(request, monkeypatch):
+    monkeypatch.setattr(milvus_collections, "collection_precision", lambda collection_name: request.param)
+    return request.param
+
+
+@pytest.fixture
+def store(tmp_path, precision):
+    store = LocalVectorStore(str(tmp_path))
+
+    for name in ("SOURCE", "TARGET"):
+        create_chunk_collection(store, COLLECTION, collection_name=name)
+
+    return store
+
+
+def insert(store, precision, doc_id, chunk_hashes, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(len(chunk_hashes), COLLECTION["vector_dim"]))
+
+    store.insert(collection_name="SOURCE", data=[
+        {"vector_embs": vector, "head_embs": head, "text_chunk": f"{doc_id} {chunk_hash}", "emb_model_name": "m",
+         "doc_id": doc_id, "page_start": 1, "page_end": 1, "chunk_hash": chunk_hash,
+         "company": "acme", "owner": "alice", "year": 2023}
+        for vector, head, chunk_hash in zip(encode_vectors(vectors, precision),
+                                            encode_vectors(vectors[:, :128], precision),
+                                            chunk_hashes)])
+
+
+def contents(store, name, precision):
+    rows = store.query(collection_name=name, output_fields=["doc_id", "chunk_hash", "vector_embs"])
+
+    return sorted((row["doc_id"], row["chunk_hash"], np.asarray(decode_vector(row["vector_embs"], precision)).tobytes())
+                  for row in rows)
+
+
+def test_decode_vector_unwraps_what_pymilvus_returns():
+    vector = np.arange(4, dtype=np.float16)
+
+    assert np.array_equal(decode_vector([vector.tobytes()], "float16"), vector)
+    assert decode_vector([b"\x0f\xf0"], "binary") == b"\x0f\xf0"
+    assert decode_vector([0.5, 1.0], "float32") == [0.5, 1.0]
+
+
+def test_copy_rows_keeps_the_vectors(store, precision):
+    insert(store, precision, "a.pdf", ["h1", "h2", "h3"])
+
+    copied = {}
+    max_id = _copy_rows(store, "SOURCE", "TARGET", precision, copied=copied)
+
+    assert contents(store, "TARGET", precision) == contents(store, "SOURCE", precision)
+    assert max_id == max(copied)
+    assert Counter(copied.values()) == {"a.pdf": 3}
+
+
+def test_replay_deletes_removes_rows_deleted_during_the_copy(store, precision):
+    insert(store, precision, "a.pdf", ["h1", "h2", "h3"])
+    insert(store, precision, "b.pdf", ["h1", "h2"], seed=1)
+
+    copied = {}
+    max_id = _copy_rows(store, "SOURCE", "TARGET", precision, copied=copied)
+
+    # a re-ingestion replaces one chunk of a.pdf while the copy runs
+    delete_chunks(store, "SOURCE", "a.pdf", ["h2"])
+    insert(store, precision, "a.pdf", ["h4"], seed=2)
+
+    max_id = max(max_id, _copy_rows(store, "SOURCE", "TARGET", precision, filter=f"id > {max_id}", copied=copied))
+
+    assert _replay_deletes(store, "SOURCE", "TARGET", precision, copied, max_id) == 1
+    assert contents(store, "TARGET", precision) == contents(store, "SOURCE", precision)
+    assert _replay_deletes(store, "SOURCE", "TARGET", precision, copied, max_id) == 0
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from server.src.services import retrieval
+from server.src.services.retrieval import validate_candidate_multiplier
+from server.src.services.vector_codec import encode_vectors
+
+
+@pytest.mark.parametrize("candidate_multiplier, expected", [(None, None), (1, 1), (10, 10)])
+def test_validate_candidate_multiplier(candidate_multiplier, expected):
+    assert validate_candidate_multiplier(candidate_multiplier) == expected
+
+
+@pytest.mark.parametrize("candidate_multiplier", [0, -3, 2.5, "4", True])
+def test_validate_candidate_multiplier_rejects_anything_but_positive_integers(candidate_multiplier):
+    with pytest.raises(ValueError):
+        validate_candidate_multiplier(candidate_multiplier)
+
+
+class FakeMilvus:
+    def __init__(self, vectors: np.ndarray, candidates, precision: str):
+        self.stored = dict(zip(range(len(vectors)), encode_vectors(vectors, precision)))
+        self.candidates = candidates
+        self.searches = []
+        self.fetched = []
+
+    def search(self, collection_name, anns_field, data, limit, output_fields, filter, **kwargs):
+        self.searches.append((anns_field, limit, output_fields, filter))
+
+        return [[{"id": id, "distance": 0.0, "entity": {"vector_embs": self.stored[id]}} for id in ids[:limit]]
+                for ids in self.candidates]
+
+    def get(self, collection_name, ids, output_fields):
+        self.fetched.append(list(ids))
+
+        return [{"id": id, "text_chunk": f"text {id}"} for id in ids]
+
+
+def search_two_stage(monkeypatch, vectors, queries, candidates, limit, precision="float32"):
+    milvus = FakeMilvus(vectors, candidates, precision)
+
+    monkeypatch.setattr(retrieval, "milvus_client", milvus)
+    monkeypatch.setattr(retrieval, "collection_index", lambda collection_name: {"type": "FLAT"})
+
+    results = retrieval._search_two_stage("CHUNKS", precision, queries, limit,
+                                          output_fields=["text_chunk"],
+                                          filter="year >= 2023",
+                                          candidate_multiplier=3)
+    return results, milvus
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16"])
+def test_search_two_stage_reranks_candidates_on_the_full_vectors(monkeypatch, precision):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(12, 256)).astype(np.float32)
+    query = vectors[7] + 0.01
+
+    # the head search ranks the true neighbour last among the candidates
+    results, milvus = search_two_stage(monkeypatch, vectors, query[None], [[2, 5, 9, 7, 1, 3]], limit=2,
+                                       precision=precision)
+
+    assert results[0][0]["id"] == 7
+    assert results[0][0]["entity"] == {"text_chunk": "text 7"}
+    assert len(results[0]) == 2
+    assert milvus.searches == [("head_embs", 6, ["vector_embs"], "year >= 2023")]
+    # only the kept hits have their output fields fetched
+    assert milvus.fetched == [sorted(hit["id"] for hit in results[0])]
+
+
+def test_search_two_stage_ranks_binary_codes_by_hamming_distance(monkeypatch):
+    vectors = np.where(np.random.default_rng(1).random((8, 256)) > 0.5, 1.0, -1.0).astype(np.float32)
+    query = vectors[4].copy()
+    query[:3] *= -1
+
+    results, _ = search_two_stage(monkeypatch, vectors, query[None], [[0, 1, 4, 6]], limit=1, precision="binary")
+
+    assert results == [[{"id": 4, "distance": 3.0, "entity": {"text_chunk": "text 4"}}]]
+
+
+def test_search_two_stage_keeps_queries_without_candidates(monkeypatch):
+    vectors = np.eye(4, 256, dtype=np.float32)
+
+    results, _ = search_two_stage(monkeypatch, vectors, vectors[:2], [[], [1, 0]], limit=1)
+
+    assert [[hit["id"] for hit in hits] for hits in results] == [[], [1]]